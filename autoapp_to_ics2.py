@@ -5,11 +5,17 @@ import sys
 import math                     # for floor
 import collections              # for deque
 import csv
+import numbers                  # for comparing values in the window
+import bisect                   # for matching carbs to boluses
+import time                     # for timing the bulk computations
+import multiprocessing          # for backfill
+import numpy as np
 import cs304dbi as dbi
 from datetime import datetime, timedelta
 import date_ui
 import logging
-from migrate_basal_rate import migrate_basal_12
+from migrate_basal_rate import migrate_basal_12, actual_basal
+from statement_counter import CountingConnection
 
 # Configuration Constants
 
@@ -63,14 +69,14 @@ def import_functions(conn):
 ## ================================================================
 ## Fill Forward
 
-def fill_forward_between(conn, start_time, end_time):
+def fill_forward_between(conn, start_time, end_time, dirty=None):
     '''The migration functions will assume that the ICS2 table has all the
 necessary rows, so we can do the updates using the SQL UPDATE
 statement rather than mess with REPLACE or INSERT ON DUPLICATE
 KEY. This function establishes that precondition. All the functions
 below can call this function first. It's idempotent, so calling it
 unnecessarily is fine. Soon, we'll set this up as to be invoked via
-CRON.  The function returns the rtime where it started. However, other
+CRON.  The function returns the number of rows it created. However, other
 migration functions should start from autoapp.last_update.date. See
 get_migration_time().
 
@@ -80,22 +86,43 @@ get_migration_time().
     then this becomes complicated, and I would rather keep this
     function simple and robust.
 
+    Oct 2026. This used to do one INSERT per 5-minute slot, which
+    meant thousands of round trips to catch up after an outage. Now we
+    read the rtimes that already exist with one query and insert the
+    missing ones with executemany, which pymysql turns into a few
+    multi-row INSERTs. Returns the number of rows actually created.
+    If dirty is a DirtyRange, the new rows are added to it.
+
     '''
     start_time = date_ui.to_rtime(start_time)
     end_time = date_ui.to_rtime(end_time)
     curs = conn.cursor()
     logging.debug(f'fill_forward_between: inserting rows into {TABLE} from {start_time} to {end_time}')
-    # this part needs to be idempotent, particularly when we are testing, so
-    # I added the ON DUPLICATE KEY no-op
-    insert = f'''INSERT INTO {TABLE}(rtime, user)
-                 VALUES(%s, '{USER}')
-                 ON DUPLICATE KEY UPDATE user=user; '''
-    rtime = start_time
     # it's important that it be <= because we want to include the last row
+    curs.execute(f'''SELECT rtime FROM {TABLE}
+                     WHERE user = %s and rtime >= %s and rtime <= %s''',
+                 [USER, start_time, end_time])
+    existing = set([ row[0] for row in curs.fetchall() ])
+    missing = []
+    rtime = start_time
     while rtime <= end_time:
-        curs.execute(insert, [rtime])
+        if rtime not in existing:
+            missing.append((rtime, USER))
         rtime += timedelta(minutes=5)
+    if len(missing) == 0:
+        return 0
+    # this part needs to be idempotent, particularly when we are testing, so
+    # I kept the ON DUPLICATE KEY no-op. A no-op doesn't count as an
+    # affected row, so a row someone else inserted meanwhile isn't counted.
+    insert = f'''INSERT INTO {TABLE}(rtime, user)
+                 VALUES(%s, %s)
+                 ON DUPLICATE KEY UPDATE user=user'''
+    created = curs.executemany(insert, missing)
     conn.commit()
+    if dirty is not None and created > 0:
+        dirty.add(missing[0][0], missing[-1][0])
+    logging.info(f'fill_forward_between: created {created} rows in {TABLE}')
+    return created
 
 ## ----------------------------- Migration ----------------------------------------
 
@@ -114,6 +141,99 @@ def print_tuples(col_names, rows):
         row_list = [ str(val) for val in row ]
         print('\t'.join(row_list))
 
+# ================================================================
+# Bulk updates. Updating one row at a time means one round trip (and
+# often one commit) per 5-minute row, which is what made recomputing
+# the whole table take more than 11 minutes. Instead, we can load the
+# new values into a temporary table and copy them over with a single
+# UPDATE.
+
+# the staging table is only scratch space, so writes to it aren't
+# counted as rows written in the metrics (see run_step)
+SCRATCH_TABLES = ['ics2_staging']
+
+def bulk_update(conn, columns, rows, commit=True, dirty=None):
+    '''Sets the given columns of TABLE from rows, a list of tuples of
+    the form (rtime, val1, val2, ...), where the values correspond to
+    the columns. The rows are loaded into a temporary staging table
+    (executemany turns an INSERT into multi-row INSERTs) and then
+    copied into TABLE with one join UPDATE, so the number of
+    statements doesn't grow with the number of rows. Like the other
+    migration functions, this only modifies existing rows; see
+    fill_forward_between. Returns the number of rows changed.
+
+    If there are several tuples for the same rtime, the last one wins,
+    as it would if we did the updates one at a time.
+
+    If dirty is a DirtyRange, the earliest and latest rtimes whose
+    values actually change are added to it. That costs one more query.
+    '''
+    # dedup on rtime, keeping the last, since rtime is the key of the staging table
+    rows = list({ row[0]: row for row in rows }.values())
+    if len(rows) == 0:
+        return 0
+    col_list = ', '.join(columns)
+    curs = dbi.cursor(conn)
+    # temporary tables are private to this connection and vanish when it closes
+    curs.execute('DROP TEMPORARY TABLE IF EXISTS ics2_staging')
+    # copying the column definitions from TABLE means the values get
+    # the same types and rounding they would get in TABLE
+    curs.execute(f'''CREATE TEMPORARY TABLE ics2_staging (PRIMARY KEY (rtime))
+                     SELECT rtime, {col_list} FROM {TABLE} WHERE false''')
+    placeholders = ', '.join(['%s'] * (len(columns)+1))
+    curs.executemany(f'''INSERT INTO ics2_staging(rtime, {col_list}) VALUES ({placeholders})''',
+                     rows)
+    if dirty is not None:
+        # <=> is null-safe equality, so NULL to 0 counts as a change
+        same = ' AND '.join([ f'ics.{col} <=> stage.{col}' for col in columns ])
+        curs.execute(f'''SELECT min(rtime), max(rtime)
+                         FROM {TABLE} AS ics INNER JOIN ics2_staging AS stage USING (rtime)
+                         WHERE ics.user = %s AND NOT ({same})''',
+                     [USER])
+        dirty.add(*curs.fetchone())
+    assignments = ', '.join([ f'ics.{col} = stage.{col}' for col in columns ])
+    nr = curs.execute(f'''UPDATE {TABLE} AS ics INNER JOIN ics2_staging AS stage USING (rtime)
+                          SET {assignments}
+                          WHERE ics.user = %s''',
+                      [USER])
+    curs.execute('DROP TEMPORARY TABLE ics2_staging')
+    logging.debug(f'bulk_update of {col_list}: {len(rows)} rows staged, {nr} changed')
+    if commit:
+        conn.commit()
+    return nr
+
+class DirtyRange:
+    '''The earliest and latest rtimes that the import steps actually
+    changed, so that the derived columns (corrective insulin, the
+    minutes-since counters, DI and DC) only need to be recomputed from
+    there. Both are None if nothing has changed. Oct 2026.'''
+
+    def __init__(self, lo=None, hi=None):
+        self.lo = None
+        self.hi = None
+        self.add(lo, hi)
+
+    def add(self, lo, hi=None):
+        if lo is None:
+            return
+        if hi is None:
+            hi = lo
+        self.lo = lo if self.lo is None else min(self.lo, lo)
+        self.hi = hi if self.hi is None else max(self.hi, hi)
+
+    def is_clean(self):
+        return self.lo is None
+
+    def __str__(self):
+        if self.is_clean():
+            return 'clean'
+        return f'dirty from {self.lo} to {self.hi}'
+
+def rtime_offset(rtime, base_rtime):
+    '''Returns the number of 5-minute steps from base_rtime to rtime,
+    which is the index of rtime in an array that starts at base_rtime.'''
+    return int((rtime - base_rtime).total_seconds() // (5*60))
+
 # ================================================================
 
 def bolus_import_s_and_ds(conn, start_time, end_time, debugp=False):
@@ -185,11 +305,14 @@ def bolus_import_s_and_ds_test(conn, start_time, end_time):
 
 # ================================================================
 
-def extended_bolus_import(conn, start_time, end_time, debugp=False):
+def extended_bolus_drips(conn, start_time, end_time):
     '''because extended boluses aren't recorded in the bolus table until
 they complete, we have to use a different approach. We'll look at the
 extended_bolus_state table, and compute the start time of the extended
-bolus from the date - progress_minutes and the duration from minutes.'''
+bolus from the date - progress_minutes and the duration from minutes.
+Returns a list of (start_rtime, end_rtime, extended_bolus_amt_12), one per
+extended bolus, where the drip goes into the row with the start time but
+not the row with the end time.'''
     curs = dbi.cursor(conn)
     n = curs.execute(f'''SELECT * 
                         FROM (SELECT date  
@@ -201,7 +324,7 @@ bolus from the date - progress_minutes and the duration from minutes.'''
                      [start_time, end_time])
     logging.debug(f'updating with {n} extended bolus reports between {start_time} and {end_time}')
     last_start_time = None
-    dst = conn.cursor()
+    drips = []
     for row in curs.fetchall():
         # is it volume or rate?
         e_start, date, volume, duration, progress = row
@@ -215,11 +338,22 @@ bolus from the date - progress_minutes and the duration from minutes.'''
         last_start_time = e_start
         end_rtime = date_ui.to_rtime(e_start + timedelta(minutes=duration))
         extended_bolus_amt_12 = volume / math.floor(duration/5)
+        drips.append((e_start, end_rtime, extended_bolus_amt_12))
+    return drips
+
+def extended_bolus_import(conn, start_time, end_time, debugp=False, dirty=None):
+    '''Stores the extended boluses from extended_bolus_drips. If dirty is
+a DirtyRange, the rows of any bolus that changed are added to it.'''
+    dst = conn.cursor()
+    for e_start, end_rtime, extended_bolus_amt_12 in extended_bolus_drips(conn, start_time, end_time):
         # we'll drip into the row with the start time (<=), but not the row with the end time (<)
         # Because this is an update, it should be idempotent
-        dst.execute('''UPDATE {} SET extended_bolus_amt_12 = %s 
-                       WHERE user='{}' AND %s <= rtime and rtime < %s'''.format(TABLE,USER),
-                      [extended_bolus_amt_12, e_start, end_rtime])
+        nr = dst.execute('''UPDATE {} SET extended_bolus_amt_12 = %s 
+                            WHERE user='{}' AND %s <= rtime and rtime < %s'''.format(TABLE,USER),
+                         [extended_bolus_amt_12, e_start, end_rtime])
+        # rows already set to this value don't count as affected
+        if dirty is not None and nr > 0:
+            dirty.add(e_start, end_rtime - timedelta(minutes=5))
     conn.commit()
 
 def extended_bolus_import_test(conn, start_time, end_time):
@@ -454,16 +588,186 @@ def migrate_rescue_carbs_from_diamon(conn, start_time,
     for row in curs.fetchall():
         user, timestamp, total_carbs, quantity, carb_name = row
         notes = f'{quantity} of {carb_name} at {timestamp}'
-        logging.debug('rescue carb from diamon: {total_carbs} at {timestamp}')
+        logging.debug(f'rescue carb from diamon: {total_carbs} at {timestamp}')
         rtime = date_ui.to_rtime(timestamp)
-        update.execute('''update insulin_carb_smoothed_2 set
-                          carb_code = 'rescue', carbs = %s, rescue_carbs = %s, notes = %s
-                          where user = '{USER_ID}' and rtime = %s''',
+        update.execute(f'''update insulin_carb_smoothed_2 set
+                           carb_code = 'rescue', carbs = %s, rescue_carbs = %s, notes = %s
+                           where user = '{USER}' and rtime = %s''',
                        [total_carbs, total_carbs, notes, rtime])
     if commit:
         conn.commit()
 
 
+# ================================================================
+# Staged import. The functions above read the source events and then
+# update ICS2 one row at a time, and matching_insulin_bolus adds a
+# query per carb. Instead, we can read all the events for the window
+# (a handful of queries), work out every column change in memory, and
+# apply each column with one bulk_update. Oct 2026.
+
+MEAL_CARB_CODES = ['before6', 'breakfast', 'lunch', 'snack', 'dinner', 'after9']
+
+STAGED_IMPORT_COLUMNS = ['bolus_type', 'total_bolus_volume', 'carbs', 'carb_code',
+                         'minutes_since_last_meal', 'rescue_carbs', 'notes']
+
+def bolus_near(bolus_rtimes, carb_rtime, time_interval=MEAL_INSULIN_TIME_INTERVAL):
+    '''The in-memory version of matching_insulin_bolus: true if there's
+    an rtime in the sorted list bolus_rtimes strictly within
+    time_interval minutes of carb_rtime.'''
+    time0 = carb_rtime - timedelta(minutes=time_interval)
+    time1 = carb_rtime + timedelta(minutes=time_interval)
+    i = bisect.bisect_right(bolus_rtimes, time0)
+    return i < len(bolus_rtimes) and bolus_rtimes[i] < time1
+
+def staged_event_changes(conn, start_time, end_time, window=None):
+    '''Does the work of bolus_import_s_and_ds, update_carb_codes,
+    carbohydrate_import, migrate_rescue_carbs and
+    migrate_rescue_carbs_from_diamon, in that order, so later sources
+    win just as they did, but in memory. The number of queries doesn't
+    depend on the number of events. Returns a dictionary mapping rtime
+    to a dictionary of column changes. If window is an IcsWindow
+    covering the interval plus MEAL_INSULIN_TIME_INTERVAL either side,
+    the existing ICS2 values are read from it rather than the database.
+    '''
+    curs = dbi.cursor(conn)
+    # rtime -> dictionary of column changes
+    changes = {}
+    def change(rtime, **cols):
+        changes.setdefault(rtime, {}).update(cols)
+
+    # S and DS boluses, as in bolus_import_s_and_ds
+    curs.execute(f'''select janice.date5f(date), type, if(value='', NULL, value)
+                     from autoapp.bolus
+                     where user_id = {USER_ID}
+                       and (type = 'S' or type = 'DS')
+                       and date >= %s and date <= %s''',
+                 [start_time, end_time])
+    new_boluses = curs.fetchall()
+    logging.info(f'need to import {len(new_boluses)} boluses')
+    for rtime, bolus_type, bolus_value in new_boluses:
+        change(rtime, bolus_type=bolus_type, total_bolus_volume=bolus_value)
+
+    # To classify carbs, we need the boluses that matching_insulin_bolus
+    # would have found in ICS2 after the boluses above were imported.
+    interval = timedelta(minutes=MEAL_INSULIN_TIME_INTERVAL)
+    if window is None:
+        curs.execute(f'''select rtime, total_bolus_volume from {TABLE}
+                         where %s < rtime and rtime < %s
+                         and total_bolus_volume is not null''',
+                     [start_time - interval, end_time + interval])
+        bolus_volumes = dict(curs.fetchall())
+    else:
+        bolus_volumes = dict([ (rtime, vol)
+                               for rtime, vol in window.items('total_bolus_volume',
+                                                              start_time - interval + timedelta(minutes=5),
+                                                              end_time + interval)
+                               if vol is not None ])
+    for rtime, bolus_type, bolus_value in new_boluses:
+        bolus_volumes[rtime] = bolus_value
+    bolus_rtimes = sorted([ rtime for rtime, vol in bolus_volumes.items() if vol is not None ])
+
+    def carb_code_for(rtime):
+        return meal_name(rtime) if bolus_near(bolus_rtimes, rtime) else 'rescue'
+
+    # carbs in ICS2 with missing or bad carb codes, as in update_carb_codes
+    if window is None:
+        curs.execute(f'''select rtime, carbs
+                         from {TABLE}
+                         where carbs > 0
+                         and (carb_code is null or
+                              carb_code not in ('before6', 'breakfast', 'lunch', 'snack', 'dinner', 'after9', 'rescue'))
+                         and %s <= rtime and rtime <= %s''',
+                     [start_time, end_time])
+        bad_carb_codes = curs.fetchall()
+    else:
+        bad_carb_codes = [ (rtime, carbs)
+                           for rtime, carbs in window.items('carbs', start_time, end_time + timedelta(minutes=5))
+                           if carbs is not None and carbs > 0
+                           and window.get('carb_code', rtime) not in MEAL_CARB_CODES + ['rescue'] ]
+    for rtime, carbs in bad_carb_codes:
+        change(rtime, carbs=carbs, carb_code=carb_code_for(rtime))
+
+    # carbs from autoapp, as in carbohydrate_import
+    curs.execute('''select janice.date5f(date) as rtime, value as carbs
+                    from autoapp.carbohydrate
+                    where date >= %s and date <= %s''',
+                 [start_time, end_time])
+    for rtime, carbs in curs.fetchall():
+        carb_code = carb_code_for(rtime)
+        logging.debug(f'{carbs} carbs at {str(rtime)} is {carb_code}')
+        change(rtime, carbs=carbs, carb_code=carb_code)
+        if carb_code != 'rescue':
+            change(rtime, minutes_since_last_meal=0)
+
+    # rescue carbs from the web form, as in migrate_rescue_carbs
+    curs.execute(f'''SELECT cast(date as datetime), carbs
+                     FROM janice.rescue_carbs
+                     WHERE user = '{USER}'
+                     AND cast(date as datetime) between %s and %s''',
+                 [start_time, end_time])
+    for date, carbs in curs.fetchall():
+        change(date_ui.to_rtime(date), carbs=carbs, carb_code='rescue')
+
+    # rescue carbs from diamon, as in migrate_rescue_carbs_from_diamon
+    curs.execute('''select timestamp, totalCarbGrams, quantity, carbName
+                    from rescue_carbs_from_diamon
+                    where timestamp between %s and %s''',
+                 [start_time, end_time])
+    for timestamp, total_carbs, quantity, carb_name in curs.fetchall():
+        notes = f'{quantity} of {carb_name} at {timestamp}'
+        change(date_ui.to_rtime(timestamp),
+               carb_code='rescue', carbs=total_carbs, rescue_carbs=total_carbs, notes=notes)
+
+    return changes
+
+def staged_event_import(conn, start_time, end_time, commit=True, dirty=None):
+    '''Stores the changes from staged_event_changes with one bulk_update
+    per column. Returns a dictionary of the number of rows changed for
+    each column.
+
+    Extended boluses are still done by extended_bolus_import, since
+    that's already one UPDATE per bolus over a range of rows.
+
+    If dirty is a DirtyRange, the rows that actually change are added to it.
+    '''
+    start_time = date_ui.to_rtime(start_time)
+    end_time = date_ui.to_rtime(end_time)
+    logging.info(f'staged_event_import from {start_time} to {end_time}')
+    changes = staged_event_changes(conn, start_time, end_time)
+    # Finally, one bulk_update per column
+    changed = {}
+    for col in STAGED_IMPORT_COLUMNS:
+        rows = [ (rtime, cols[col]) for rtime, cols in changes.items() if col in cols ]
+        if len(rows) > 0:
+            changed[col] = bulk_update(conn, [col], rows, commit=False, dirty=dirty)
+    if commit:
+        conn.commit()
+    logging.info(f'staged_event_import changed {changed}')
+    return changed
+
+def staged_event_import_comparison(conn, start_time, end_time):
+    '''Runs the row-at-a-time import functions and then
+    staged_event_import over the same window, e.g. a week, counting the
+    statements each sends. Each is rolled back afterwards, so this
+    doesn't change ICS2. Writes to SCRATCH_TABLES aren't counted.
+    Returns the two dictionaries of counts.'''
+    counted = CountingConnection(conn, scratch_tables=SCRATCH_TABLES)
+    bolus_import_s_and_ds(counted, start_time, end_time, debugp=True)
+    update_carb_codes(counted, start_time, end_time, debugp=True)
+    carbohydrate_import(counted, start_time, end_time, debugp=True)
+    migrate_rescue_carbs(counted, start_time, end_time, commit=False)
+    migrate_rescue_carbs_from_diamon(counted, start_time, end_time, commit=False)
+    before = counted.counts()
+    conn.rollback()
+    counted.reset()
+    staged_event_import(counted, start_time, end_time, commit=False)
+    after = counted.counts()
+    conn.rollback()
+    for label, counts in [('row at a time', before), ('staged', after)]:
+        print(f"{label}: {counts['statements']} statements, "
+              f"{counts['writes']} writes, {counts['seconds']:.2f} seconds")
+    return before, after
+
 # ================================================================
 
 def valid_minutes_since_last_meal_before_time(conn, time):
@@ -480,6 +784,48 @@ def valid_minutes_since_last_meal_before_time(conn, time):
     return curs.fetchone()
     
 
+def minutes_since_scan(rows, seed_rtime, seed_value, is_event):
+    '''Works forward from the seed (the most recent valid value), adding
+    5 to the counter for each row and resetting it to zero on rows where
+    is_event(row) is true. The rows are tuples starting with rtime, in
+    order, and all after the seed. Returns a list of (rtime, counter)
+    pairs, stopping at the first missing row, since the counter after a
+    gap would be wrong.'''
+    results = []
+    prev_rtime, counter = seed_rtime, seed_value
+    for row in rows:
+        rtime = row[0]
+        if rtime != prev_rtime + timedelta(minutes=5):
+            logging.error(f'No row in {TABLE} where rtime = {prev_rtime + timedelta(minutes=5)}')
+            break
+        if is_event(row):
+            counter = 0
+        else:
+            counter += 5
+        results.append((rtime, counter))
+        prev_rtime = rtime
+    return results
+
+def minutes_since_scan_test():
+    '''A meal two rows after the seed resets the counter, and the gap
+    after the fourth row stops the scan.'''
+    seed = date_ui.to_rtime('2024-06-01 12:00')
+    step = timedelta(minutes=5)
+    rows = [ (seed + 1*step, None),
+             (seed + 2*step, 'lunch'),
+             (seed + 3*step, 'rescue'),
+             (seed + 4*step, None),
+             (seed + 6*step, None) ]
+    actual = minutes_since_scan(rows, seed, 100,
+                                lambda row: row[1] is not None and row[1] != 'rescue')
+    expected = [ (seed + 1*step, 105),
+                 (seed + 2*step, 0),
+                 (seed + 3*step, 5),
+                 (seed + 4*step, 10) ]
+    if actual != expected:
+        raise Exception(f'mismatch: {actual} versus {expected}')
+    print('minutes_since_scan passed')
+
 def update_minutes_since_last_meal(conn, start_time,
                                    end_time=date_ui.to_rtime(datetime.now()),
                                    debug=False):
@@ -488,6 +834,12 @@ def update_minutes_since_last_meal(conn, start_time,
     end_time. Hopefully, that value is very recent, but this might
     update many rows in some cases.
 
+    Oct 2026. Rather than a SELECT and an UPDATE for every row, we now
+    read the carb_codes for the whole range with one query, compute
+    the counter with minutes_since_scan, and write it with
+    bulk_update. The scan starts with the row *after* the valid value;
+    it used to start at that row and add 5 to it on every run.
+
     '''
     # First, find the most recent non-null value for minutes_since_last_meal
     # we could ignore start_time, but let's look backwards from there
@@ -503,28 +855,14 @@ def update_minutes_since_last_meal(conn, start_time,
         # Now, work forward, incrementing the counter and resetting it to
         # zero when there are non-rescue carbs
         curs = dbi.cursor(conn)
-        logging.debug(f'iterating over all rows from {rtime} to {end_time}')
-        while rtime < end_time:
-            nr = curs.execute(f'''SELECT carb_code FROM {TABLE}
-                                  WHERE rtime = %s''',
-                              [rtime])
-            if nr == 0:
-                logging.error(f'No row in {TABLE} where rtime = {rtime}')
-                return
-            # notice the comma here; we're pulling the carb_code out of a tuple
-            (carb_code,) = curs.fetchone()
-            # print(rtime,carb_code)
-            if carb_code is not None and carb_code != 'rescue':
-                logging.debug(f'carb code {carb_code} at {rtime}')
-                mm = 0
-            else:
-                mm += 5
-            curs.execute(f'''UPDATE {TABLE} SET minutes_since_last_meal = %s
-                           where user = '{USER}' and rtime = %s''',
-                         [mm, rtime])
-            rtime += timedelta(minutes=5)
-        if not debug:
-            conn.commit()
+        logging.debug(f'reading all rows from {rtime} to {end_time}')
+        curs.execute(f'''SELECT rtime, carb_code FROM {TABLE}
+                         WHERE rtime > %s and rtime < %s
+                         ORDER BY rtime''',
+                     [rtime, end_time])
+        updates = minutes_since_scan(curs.fetchall(), rtime, mm,
+                                     lambda row: row[1] is not None and row[1] != 'rescue')
+        bulk_update(conn, ['minutes_since_last_meal'], updates, commit=not debug)
     except Exception as err:
         msg = repr(err)
         logging.error(f'ERROR! {msg} in update_minutes_since_last_meal for input {start_time} and {end_time}')
@@ -559,6 +897,9 @@ def update_minutes_since_last_bolus(conn,
     to test and run them separately, and (2) in practice, they will
     typically only run on a few rows.
 
+    Oct 2026. Like update_minutes_since_last_meal, this is now one
+    range read, minutes_since_scan, and a bulk_update.
+
     '''
     # First, find the most recent non-null value for minutes_since_last_meal
     # we could ignore start_time, but let's look backwards from there
@@ -574,26 +915,13 @@ def update_minutes_since_last_bolus(conn,
         # Now, work forward, incrementing the counter and resetting it to
         # zero when there is a bolus, which we define as total_bolus_volume > 0
         curs = dbi.cursor(conn)
-        while rtime < end_time:
-            nr = curs.execute(f'''SELECT total_bolus_volume FROM {TABLE}
-                                  WHERE rtime = %s''',
-                              [rtime])
-            if nr == 0:
-                logging.error(f'There is no row for rtime {rtime}')
-                return
-            # notice the comma here; we're pulling the carb_code out of a tuple
-            (tbv,) = curs.fetchone()
-            if tbv is not None and tbv > 0:
-                logging.debug(f'bolus of {tbv} at {rtime}')
-                mb = 0
-            else:
-                mb += 5
-            curs.execute(f'''UPDATE {TABLE} SET minutes_since_last_bolus = %s
-                             where user = '{USER}' and rtime = %s''',
-                         [mb, rtime])
-            rtime += timedelta(minutes=5)
-        if not debug:
-            conn.commit()
+        curs.execute(f'''SELECT rtime, total_bolus_volume FROM {TABLE}
+                         WHERE rtime > %s and rtime < %s
+                         ORDER BY rtime''',
+                     [rtime, end_time])
+        updates = minutes_since_scan(curs.fetchall(), rtime, mb,
+                                     lambda row: row[1] is not None and row[1] > 0)
+        bulk_update(conn, ['minutes_since_last_bolus'], updates, commit=not debug)
     except Exception as err:
         msg = repr(err)
         logging.error(f'ERROR! {msg} in update_minutes_since_last_bolus for input {start_time} and {end_time}')
@@ -766,9 +1094,127 @@ def update_dynamic_insulin(conn,
         if commit:
             conn.commit()
 
+def dynamic_insulin_array(insulin, iac):
+    '''Returns an array of DI values given a dense array of insulin
+    values (one per 5-minute row, zero where there's no row) and the
+    IAC. Element k of the result is the sum of iac[i]*insulin[k-i],
+    which is exactly what di_worker computes, but as one convolution.
+    The first len(iac)-1 values only see part of their window, so
+    callers should start the insulin array len(iac) rows early.'''
+    insulin = np.asarray(insulin, dtype=float)
+    return np.convolve(insulin, np.asarray(iac, dtype=float))[:len(insulin)]
+
+def recompute_dynamic_insulin(conn,
+                              start_time,
+                              end_time=date_ui.to_rtime(datetime.now()),
+                              commit=True):
+    '''Oct 2026. Computes the same DI values as update_dynamic_insulin,
+    but reads the insulin for the whole range (plus the IAC lookback)
+    with one query, computes DI with a NumPy convolution, and writes it
+    back with bulk_update. That's a handful of statements no matter how
+    long the range, so we can recompute all of ICS2 (e.g. after
+    changing the IAC) in seconds rather than minutes.
+
+    Like update_dynamic_insulin, this is inclusive of start_time and
+    exclusive of end_time. Missing rows are treated as zero insulin
+    rather than stopping the computation. Returns the number of rows
+    computed and the rows/second.
+    '''
+    start_time = date_ui.to_rtime(start_time)
+    end_time = date_ui.to_rtime(end_time)
+    t0 = time.time()
+    iac = read_insulin_action_curve()
+    past_time = start_time - timedelta(minutes=5*len(iac))
+    logging.info(f'recompute_dynamic_insulin from {start_time} to {end_time}')
+    curs = dbi.cursor(conn)
+    curs.execute(f'''SELECT rtime, (ifnull(basal_amt_12,0) + ifnull(total_bolus_volume,0)) as ins
+                     FROM {TABLE}
+                     WHERE rtime >= %s and rtime < %s''',
+                 [past_time, end_time])
+    rows = curs.fetchall()
+    insulin = np.zeros(rtime_offset(end_time, past_time))
+    for rtime, ins in rows:
+        insulin[rtime_offset(rtime, past_time)] = float(ins)
+    missing = len(insulin) - len(rows)
+    if missing > 0:
+        logging.error(f'{missing} rows are missing between {past_time} and {end_time}; using zero insulin for them')
+    di = dynamic_insulin_array(insulin, iac)
+    updates = [ (rtime, float(di[rtime_offset(rtime, past_time)]))
+                for rtime, _ in rows
+                if rtime >= start_time ]
+    bulk_update(conn, ['dynamic_insulin'], updates, commit=commit)
+    elapsed = time.time() - t0
+    rate = len(updates) / elapsed if elapsed > 0 else float(len(updates))
+    logging.info(f'recomputed DI for {len(updates)} rows in {elapsed:.2f} seconds: {rate:.0f} rows/second')
+    return len(updates), rate
+
+def dynamic_insulin_array_test():
+    '''Checks that the convolution matches the di_worker ring buffer, using
+    the insulin trace from iterate_over_db_windows.di_driver_test.'''
+    iac = read_insulin_action_curve(test=True)
+    insulin = [ 0 for i in range(50) ]
+    insulin[10] = 1
+    insulin[20] = 2
+    insulin[30] = 2
+    insulin[35] = 2
+    window = [ 0 for w in iac ]
+    index = -1
+    expected = []
+    for ins in insulin:
+        index = ( index + 1 ) % len(iac)
+        window[index] = ins
+        expected.append(di_worker(window, index, iac))
+    actual = dynamic_insulin_array(insulin, iac)
+    for x, y in zip(expected, actual):
+        if not math.isclose(x, y, abs_tol=1e-9):
+            raise Exception(f'mismatch: {x} versus {y}')
+    print('dynamic_insulin_array agrees with di_worker')
+
 # ================================================================
 # Projecting into the future
 
+# ================================================================
+# Projections, computed on read. update_projected_data (below) stored
+# projected DI and DC in future rows of ICS2, but that meant
+# rewriting those rows every minute, so it's not called. Instead,
+# md_deploy and the predictive model can call project_dynamic_values
+# whenever they need a projection. It only reads, so it costs nothing
+# at migration time and is always current. Oct 2026.
+
+def project_dynamic_values(conn, hours=3, now=None):
+    '''Projects DI and DC from now (default the current time) through
+    the next N hours, assuming no new boluses or carbs. The past inputs
+    are the trailing action-curve window of ICS2, read with one query,
+    and the future insulin is the basal from actual_basal, which is the
+    programmed profile, adjusted by any temp basal in progress.
+
+    Returns a dictionary with lists of rtimes, dynamic_insulin and
+    dynamic_carbs, one per 5-minute step, starting at now.'''
+    step = timedelta(minutes=5)
+    now = date_ui.to_rtime(now or datetime.now())
+    end = now + timedelta(hours=int(hours)) + step
+    start = now - action_curve_horizon()
+    window = IcsWindow(start, now + step,
+                       columns=['basal_amt_12', 'total_bolus_volume', 'carbs', 'carb_code'])
+    window.load(conn)
+    n = rtime_offset(end, start)
+    insulin = np.zeros(n)
+    carbs = np.zeros(n)
+    carb_codes = [ None for i in range(n) ]
+    for k in range(window.n):
+        insulin[k] = (float(window.values['basal_amt_12'][k] or 0) +
+                      float(window.values['total_bolus_volume'][k] or 0))
+        carbs[k] = float(window.values['carbs'][k] or 0)
+        carb_codes[k] = window.values['carb_code'][k]
+    for update in actual_basal(conn, now + step, end):
+        insulin[rtime_offset(update['rtime'], start)] = float(update['basal_amt_12'] or 0)
+    di = dynamic_insulin_array(insulin, read_insulin_action_curve())
+    dc = dynamic_carbs_array(carbs, carb_codes, read_carb_action_curves())
+    first = rtime_offset(now, start)
+    return {'rtimes': [ start + k*step for k in range(first, n) ],
+            'dynamic_insulin': [ float(di[k]) for k in range(first, n) ],
+            'dynamic_carbs': [ float(dc[k]) for k in range(first, n) ]}
+
 def update_projected_data(conn, start_time, end_time, duration):
     '''July 2024. For the purposes of predicting future highs and
     lows, we project values like DI and DC into the future. (This
@@ -779,6 +1225,9 @@ def update_projected_data(conn, start_time, end_time, duration):
     if there's a meal or a bolus, or a change in basal, that will
     cause new values to be computed.
 
+    Oct 2026. Superseded by project_dynamic_values, which computes
+    projections when they're read instead of storing them.
+
     '''
 
     start_time = date_ui.to_rtime(start_time)
@@ -977,6 +1426,122 @@ def update_dynamic_carbs_test(conn=None):
     curs.execute(f'SELECT rtime, carbs, carb_code, dynamic_carbs as dc FROM {TABLE}')
     print_tuples(['rtime', 'carbs', 'carb_code', 'dynamic_carbs'], curs.fetchall())
 
+def carb_curve_name(carb_code):
+    '''Maps a carb_code to the name of its curve in carb_curves.csv. This
+    is the same aliasing that read_carb_action_curves does.'''
+    if carb_code in ('rescue', 'dinner'):
+        return carb_code
+    return 'bls'
+
+def dynamic_carbs_array(carbs, carb_codes, curves, curve_of=carb_curve_name):
+    '''Returns an array of DC values given a dense array of carbs (one
+    per 5-minute row), a parallel list of carb_codes, a dictionary of
+    curves and a function mapping a carb_code to a key in that
+    dictionary. Oct 2026.
+
+    The carbs are split into one dense array per curve (rescue, bls,
+    dinner or, with the action_curves table, rescue, brunch, dinner),
+    each of which is convolved with its curve, and the results are
+    summed. That's the same as the meal-by-meal sum in
+    update_dynamic_carbs, but just a few convolutions for any number of
+    rows. As with dynamic_insulin_array, callers should start the
+    arrays one curve length early.'''
+    n = len(carbs)
+    by_curve = {}
+    for i in range(n):
+        if carb_codes[i] is None or not carbs[i]:
+            continue
+        key = curve_of(carb_codes[i])
+        if key not in by_curve:
+            by_curve[key] = np.zeros(n)
+        by_curve[key][i] += float(carbs[i])
+    dc = np.zeros(n)
+    for key, meal_carbs in by_curve.items():
+        dc += np.convolve(meal_carbs, np.asarray(curves[key], dtype=float))[:n]
+    return dc
+
+def recompute_dynamic_carbs(conn,
+                            start_time,
+                            end_time=date_ui.to_rtime(datetime.now()),
+                            commit=True,
+                            curves=None,
+                            curve_of=carb_curve_name):
+    '''Oct 2026. Computes DC from start_time (inclusive) to end_time
+    (exclusive) using dynamic_carbs_array. It reads carbs and carb_code
+    for the range, plus a lookback of the longest curve, with one query
+    and writes DC back with bulk_update, so it costs the same handful of
+    statements whether the range is an hour or the whole table.
+
+    By default the curves come from carb_curves.csv, as in
+    update_dynamic_carbs. To use the action_curves table instead, pass
+    its carb curves and predictive_model_june21.carb_code_mapping as
+    curve_of; that's what dynamic_carbs.compute_dynamic_carbs_batch
+    does. Missing rows count as zero carbs. Returns the number of rows
+    computed and the rows/second.
+    '''
+    start_time = date_ui.to_rtime(start_time)
+    end_time = date_ui.to_rtime(end_time)
+    t0 = time.time()
+    if curves is None:
+        curves = read_carb_action_curves()
+    longest_curve_len = max([len(curve) for curve in curves.values()])
+    past_time = start_time - timedelta(minutes=5*longest_curve_len)
+    logging.info(f'recompute_dynamic_carbs from {start_time} to {end_time}')
+    curs = dbi.cursor(conn)
+    curs.execute(f'''SELECT rtime, carbs, carb_code FROM {TABLE}
+                     WHERE rtime >= %s and rtime < %s''',
+                 [past_time, end_time])
+    rows = curs.fetchall()
+    n = rtime_offset(end_time, past_time)
+    carbs = np.zeros(n)
+    carb_codes = [ None for i in range(n) ]
+    for rtime, row_carbs, carb_code in rows:
+        k = rtime_offset(rtime, past_time)
+        carbs[k] = float(row_carbs or 0)
+        carb_codes[k] = carb_code
+    dc = dynamic_carbs_array(carbs, carb_codes, curves, curve_of)
+    updates = [ (rtime, float(dc[rtime_offset(rtime, past_time)]))
+                for rtime, _, _ in rows
+                if rtime >= start_time ]
+    bulk_update(conn, ['dynamic_carbs'], updates, commit=commit)
+    elapsed = time.time() - t0
+    rate = len(updates) / elapsed if elapsed > 0 else float(len(updates))
+    logging.info(f'recomputed DC for {len(updates)} rows in {elapsed:.2f} seconds: {rate:.0f} rows/second')
+    return len(updates), rate
+
+def dynamic_carbs_array_test():
+    '''Checks the convolution against the meal-by-meal sum that
+    update_dynamic_carbs does, using the test curves and the meals from
+    update_dynamic_carbs_test, including the overlapping ones.'''
+    global CAC
+    cac_curves = read_carb_action_curves(test=True)
+    # read_carb_action_curves caches the test curves, so forget them
+    CAC = None
+    n = 40
+    carbs = [ 0 for i in range(n) ]
+    carb_codes = [ None for i in range(n) ]
+    for i, meal_carbs, carb_code in [ (2, 40, 'dinner'),
+                                      (5, 10, 'breakfast'),
+                                      (7, 20, 'lunch'),
+                                      (8, 10, 'snack'),
+                                      (9, 16, 'rescue') ]:
+        carbs[i] = meal_carbs
+        carb_codes[i] = carb_code
+    expected = []
+    for t in range(n):
+        curr_dc = 0
+        for i in range(t+1):
+            if carb_codes[i] is not None:
+                meal_cac = cac_curves[carb_codes[i]]
+                if t - i < len(meal_cac):
+                    curr_dc += carbs[i] * meal_cac[t-i]
+        expected.append(curr_dc)
+    actual = dynamic_carbs_array(carbs, carb_codes, cac_curves)
+    for x, y in zip(expected, actual):
+        if not math.isclose(x, y, abs_tol=1e-9):
+            raise Exception(f'mismatch: {x} versus {y}')
+    print('dynamic_carbs_array agrees with update_dynamic_carbs')
+
 # ================================================================
 # tests and inqueries
 
@@ -1105,33 +1670,550 @@ passed-in values, to avoid issues of simultaneous.
     conn.commit()
     return 'done'
 
+# ================================================================
+# The ICS2 window. Each step of migrate_between used to read the rows
+# it needed and write its own columns back, committing as it went.
+# Instead, migrate_between loads the window once into an IcsWindow,
+# the steps read and modify that, and at the end we flush just the
+# changed cells with one bulk_update and one commit. Oct 2026.
+
+WINDOW_COLUMNS = ['basal_amt', 'basal_amt_12', 'extended_bolus_amt_12',
+                  'bolus_type', 'total_bolus_volume', 'carbs', 'carb_code',
+                  'rescue_carbs', 'notes',
+                  'minutes_since_last_meal', 'minutes_since_last_bolus',
+                  'corrective_insulin', 'dynamic_insulin', 'dynamic_carbs']
+
+# the columns written by the import steps, which determine what's dirty
+WINDOW_INPUT_COLUMNS = ['basal_amt', 'basal_amt_12', 'extended_bolus_amt_12',
+                        'bolus_type', 'total_bolus_volume', 'carbs', 'carb_code',
+                        'rescue_carbs']
+
+def values_equal(x, y):
+    '''Null-safe equality, where numbers that differ only by float
+    rounding are equal, so that storing a value we computed over the
+    value we read back from MySQL doesn't count as a change.'''
+    if x is None or y is None:
+        return x is None and y is None
+    if isinstance(x, numbers.Number) and isinstance(y, numbers.Number):
+        return math.isclose(float(x), float(y), rel_tol=1e-6, abs_tol=1e-9)
+    return x == y
+
+class IcsWindow:
+    '''The ICS2 rows from start (inclusive) to end (exclusive), stored
+    by column, where each column is a list indexed by rtime_offset from
+    start. Rows that don't exist are None in every column and can't be
+    set, just as an UPDATE wouldn't affect them. Set records which
+    cells actually change, and flush writes only those.'''
+
+    def __init__(self, start_time, end_time, columns=WINDOW_COLUMNS):
+        self.start = date_ui.to_rtime(start_time)
+        self.end = date_ui.to_rtime(end_time)
+        self.n = rtime_offset(self.end, self.start)
+        self.columns = columns
+        self.present = [ False for i in range(self.n) ]
+        self.values = { col: [ None for i in range(self.n) ] for col in columns }
+        self.changed = { col: set() for col in columns }
+
+    def load(self, conn):
+        '''Reads the window with one query. Returns the number of rows.'''
+        curs = dbi.cursor(conn)
+        nr = curs.execute(f'''SELECT rtime, {', '.join(self.columns)} FROM {TABLE}
+                              WHERE user = %s and rtime >= %s and rtime < %s''',
+                          [USER, self.start, self.end])
+        for row in curs.fetchall():
+            self.add_row(row[0], dict(zip(self.columns, row[1:])))
+        logging.debug(f'loaded {nr} rows of {self.n} from {self.start} to {self.end}')
+        return nr
+
+    def add_row(self, rtime, vals):
+        '''Adds a row as it is in the database, which is not a change.'''
+        k = self.offset(rtime)
+        if k is None:
+            return
+        self.present[k] = True
+        for col, val in vals.items():
+            self.values[col][k] = val
+
+    def offset(self, rtime):
+        '''The index of rtime, or None if it's outside the window.'''
+        k = rtime_offset(rtime, self.start)
+        return k if 0 <= k < self.n else None
+
+    def rtime(self, k):
+        return self.start + timedelta(minutes=5*k)
+
+    def range(self, start_time, end_time):
+        '''The indexes from start_time (inclusive) to end_time
+        (exclusive), clipped to the window.'''
+        lo = max(0, rtime_offset(start_time, self.start))
+        hi = min(self.n, rtime_offset(end_time, self.start))
+        return range(lo, max(lo, hi))
+
+    def items(self, col, start_time, end_time):
+        '''(rtime, value) for each existing row from start_time
+        (inclusive) to end_time (exclusive).'''
+        return [ (self.rtime(k), self.values[col][k])
+                 for k in self.range(start_time, end_time)
+                 if self.present[k] ]
+
+    def get(self, col, rtime):
+        k = self.offset(rtime)
+        return None if k is None else self.values[col][k]
+
+    def set(self, col, rtime, value):
+        '''Sets the value, returning true if it changed.'''
+        k = self.offset(rtime)
+        if k is None or not self.present[k]:
+            return False
+        if values_equal(self.values[col][k], value):
+            return False
+        self.values[col][k] = value
+        self.changed[col].add(k)
+        return True
+
+    def changed_range(self, columns=None):
+        '''The earliest and latest changed rtimes in the given columns
+        (default all), or (None, None) if none.'''
+        changed = set()
+        for col in (columns or self.columns):
+            changed.update(self.changed[col])
+        if len(changed) == 0:
+            return None, None
+        return self.rtime(min(changed)), self.rtime(max(changed))
+
+    def changed_rows(self):
+        '''Returns the changed columns and a list of (rtime, val1,
+        val2...) tuples for the rows with any changes, in the form that
+        bulk_update wants. Unchanged cells in those rows have the values
+        we read, so writing them back doesn't change them.'''
+        cols = [ col for col in self.columns if len(self.changed[col]) > 0 ]
+        offsets = set()
+        for col in cols:
+            offsets.update(self.changed[col])
+        rows = [ tuple([self.rtime(k)] + [ self.values[col][k] for col in cols ])
+                 for k in sorted(offsets) ]
+        return cols, rows
+
+    def flush(self, conn, commit=True):
+        '''Writes the changed cells with one bulk_update and commits.
+        Returns the number of rows changed.'''
+        cols, rows = self.changed_rows()
+        if len(rows) == 0:
+            return 0
+        nr = bulk_update(conn, cols, rows, commit=commit)
+        logging.info(f'flushed {len(rows)} rows of {", ".join(cols)}')
+        self.changed = { col: set() for col in self.columns }
+        return nr
+
+def window_basal_12(conn, window, start_time, end_time):
+    '''migrate_basal_12, but into the window.'''
+    try:
+        for update in actual_basal(conn, start_time, end_time):
+            rtime = update['rtime']
+            if update['basal_amt_12'] is None:
+                logging.error(f'''ERROR: got a NULL basal_amt_12 for {rtime}''')
+            window.set('basal_amt', rtime, update['basal_amt'])
+            window.set('basal_amt_12', rtime, update['basal_amt_12'])
+            notes = window.get('notes', rtime)
+            if notes is None:
+                window.set('notes', rtime, update['notes'])
+            elif update['notes'] not in notes:
+                window.set('notes', rtime, notes + update['notes'])
+    except Exception as err:
+        logging.error(f'ERROR! {repr(err)} in window_basal_12 for inputs {start_time} and {end_time}')
+
+def window_extended_bolus(conn, window, start_time, end_time):
+    '''extended_bolus_import, but into the window.'''
+    for e_start, end_rtime, extended_bolus_amt_12 in extended_bolus_drips(conn, start_time, end_time):
+        for rtime, _ in window.items('extended_bolus_amt_12', e_start, end_rtime):
+            window.set('extended_bolus_amt_12', rtime, extended_bolus_amt_12)
+
+def window_staged_events(conn, window, start_time, end_time):
+    '''staged_event_import, but into the window.'''
+    changes = staged_event_changes(conn, start_time, end_time, window=window)
+    for rtime, cols in changes.items():
+        for col, val in cols.items():
+            window.set(col, rtime, val)
+
+def window_minutes_since(conn, window, col, event_col, is_event, seed_fn,
+                         start_time, end_time):
+    '''update_minutes_since_last_meal/bolus, but in the window. The
+    seed is the last valid value before start_time, usually in the
+    window; if not, seed_fn finds it in the database and the rows
+    between it and the window are read and written directly, since
+    they aren't in the window.'''
+    seed = None
+    for k in reversed(window.range(window.start, start_time)):
+        if window.values[col][k] is not None:
+            seed = (window.rtime(k), window.values[col][k])
+            break
+    before = []
+    if seed is None:
+        seed = seed_fn(conn, start_time)
+        if seed is None:
+            logging.error(f'ERROR: no valid value of {col} preceding {start_time}')
+            return
+        curs = dbi.cursor(conn)
+        curs.execute(f'''SELECT rtime, {event_col} FROM {TABLE}
+                         WHERE rtime > %s and rtime < %s
+                         ORDER BY rtime''',
+                     [seed[0], window.start])
+        before = list(curs.fetchall())
+    seed_rtime, seed_value = seed
+    rows = before + window.items(event_col, seed_rtime + timedelta(minutes=5), end_time)
+    counts = minutes_since_scan(rows, seed_rtime, seed_value, is_event)
+    outside = [ (rtime, count) for rtime, count in counts if window.offset(rtime) is None ]
+    if len(outside) > 0:
+        bulk_update(conn, [col], outside, commit=False)
+    for rtime, count in counts:
+        window.set(col, rtime, count)
+
+def window_corrective_insulin(conn, window, start_time, end_time):
+    '''update_corrective_insulin, but in the window: for boluses from
+    start_time to end_time (inclusive), count the carbs within 30
+    minutes.'''
+    for rtime, tbv in window.items('total_bolus_volume', start_time, end_time + timedelta(minutes=5)):
+        if tbv is None:
+            continue
+        near = window.items('carbs', rtime - timedelta(minutes=30), rtime + timedelta(minutes=35))
+        meal = len([ carbs for _, carbs in near if carbs is not None ])
+        window.set('corrective_insulin', rtime, 1-meal)
+
+def window_dynamic_insulin(conn, window, start_time, end_time):
+    '''recompute_dynamic_insulin, but in the window, which must start at
+    least one IAC length before start_time.'''
+    iac = read_insulin_action_curve()
+    insulin = np.array([ float(window.values['basal_amt_12'][k] or 0) +
+                         float(window.values['total_bolus_volume'][k] or 0)
+                         for k in range(window.n) ])
+    di = dynamic_insulin_array(insulin, iac)
+    for k in window.range(start_time, end_time):
+        window.set('dynamic_insulin', window.rtime(k), float(di[k]))
+
+def window_dynamic_carbs(conn, window, start_time, end_time):
+    '''recompute_dynamic_carbs, but in the window, which must start at
+    least one CAC length before start_time.'''
+    carbs = np.array([ float(c or 0) for c in window.values['carbs'] ])
+    dc = dynamic_carbs_array(carbs, window.values['carb_code'], read_carb_action_curves())
+    for k in window.range(start_time, end_time):
+        window.set('dynamic_carbs', window.rtime(k), float(dc[k]))
+
+def ics_window_test():
+    '''A bolus with a meal and one without, in a window built by hand,
+    checked against the array functions, and that the flush only
+    writes the rows that changed.'''
+    global IAC
+    # the window steps use the cached IAC, so cache the test one
+    IAC = read_insulin_action_curve(test=True)
+    iac = IAC
+    start = date_ui.to_rtime('2024-06-01 12:00')
+    window = IcsWindow(start, start + timedelta(minutes=5*40))
+    for k in range(window.n):
+        window.add_row(window.rtime(k), {'basal_amt_12': 0.1,
+                                         'minutes_since_last_bolus': 100 + 5*k if k < 5 else None})
+    window.add_row(window.rtime(10), {'total_bolus_volume': 2, 'carbs': 30, 'carb_code': 'lunch'})
+    window.add_row(window.rtime(30), {'total_bolus_volume': 1})
+    window_corrective_insulin(None, window, window.start, window.end)
+    if window.get('corrective_insulin', window.rtime(10)) != 0:
+        raise Exception('bolus with a meal should not be corrective')
+    if window.get('corrective_insulin', window.rtime(30)) != 1:
+        raise Exception('bolus without a meal should be corrective')
+    window_minutes_since(None, window, 'minutes_since_last_bolus', 'total_bolus_volume',
+                         lambda row: row[1] is not None and row[1] > 0, None,
+                         window.rtime(5), window.end)
+    if window.get('minutes_since_last_bolus', window.rtime(12)) != 10:
+        raise Exception('minutes since last bolus should be 10')
+    window_dynamic_insulin(None, window, window.rtime(len(iac)), window.end)
+    insulin = [ 0.1 + (2 if k == 10 else 1 if k == 30 else 0) for k in range(window.n) ]
+    expected = dynamic_insulin_array(insulin, iac)
+    for k in window.range(window.rtime(len(iac)), window.end):
+        if not math.isclose(window.values['dynamic_insulin'][k], expected[k], abs_tol=1e-9):
+            raise Exception(f'DI mismatch at {k}')
+    cols, rows = window.changed_rows()
+    if window.changed['minutes_since_last_bolus'] != set(range(5, window.n)):
+        raise Exception('only the rows after the seed should change')
+    if len(rows) != window.n - 5:
+        raise Exception(f'expected {window.n - 5} changed rows, got {len(rows)}')
+    IAC = None
+    print('ics_window passed')
+
 # ================================================================
 # this is the main function. It's divided into a function that
 # migrates data for a given time range (so we can go back and
 # re-calculate things if we need to, and June 2024, we do) and a
 # function that updates the migration_time tables.
 
-def migrate_between(conn, start_time, end_time):
+def migrate_between(conn, start_time, end_time, force=False):
     '''Migrates data that is in autoapp and other tables between those
     start/end times. This *does* do the fill-forward, so that any
     missing rows will be filled in. This should be idempotent.
+
+    Oct 2026. After the fill-forward, the rows are read once into an
+    IcsWindow (extending one action-curve length either side), every
+    step reads and modifies the window, and the changed cells are
+    written back with one flush, in a single transaction.
+
+    The cells the import steps actually change determine the dirty
+    range, and the derived columns are only recomputed from the first
+    changed row, through the last one plus the action-curve horizon. If
+    nothing changed, they are skipped entirely, so most cron runs do
+    very little. Use force=True to recompute the derived columns for
+    the whole interval, e.g. after changing a curve. Returns the
+    DirtyRange.
+
+    Each step is run by run_step, and the timings and counts are
+    stored in migration_metrics at the end.
     '''
     logging.info(f'migrate between {start_time} and {end_time}')
-    fill_forward_between(conn, start_time, end_time)
-    migrate_basal_12(conn, start_time, end_time)
-    bolus_import(conn, start_time, end_time)
-    logging.info('carbohydrate')
-    carbohydrate_import(conn, start_time, end_time)
-    migrate_rescue_carbs(conn, start_time, end_time)
-    migrate_rescue_carbs_from_diamon(conn, start_time, end_time)
-    update_minutes_since_last_meal(conn, start_time, end_time)
-    update_minutes_since_last_bolus(conn, start_time, end_time)
-    update_corrective_insulin(conn, start_time, end_time)
-    update_dynamic_insulin(conn, start_time, end_time)
-    # update_projected_data(conn, start_time, end_time, duration)
-    update_dynamic_carbs(conn, start_time, end_time)
+    run_start = datetime.now()
+    metrics = []
+    start_time = date_ui.to_rtime(start_time)
+    end_time = date_ui.to_rtime(end_time)
+    dirty = DirtyRange()
+    if force:
+        dirty.add(start_time, end_time)
+    created = run_step(metrics, conn, 'fill_forward', fill_forward_between,
+                       start_time, end_time, dirty=dirty)
+    logging.info(f'fill forward created {created} rows')
+    horizon = action_curve_horizon()
+    window = IcsWindow(start_time - horizon, end_time + horizon + timedelta(minutes=5))
+    run_step(metrics, conn, 'load_window', window.load)
+    run_step(metrics, conn, 'basal_12', window_basal_12, window, start_time, end_time)
+    run_step(metrics, conn, 'extended_bolus', window_extended_bolus, window, start_time, end_time)
+    # boluses, carbs and rescue carbs
+    run_step(metrics, conn, 'staged_events', window_staged_events, window, start_time, end_time)
+    dirty.add(*window.changed_range(WINDOW_INPUT_COLUMNS))
+    logging.info(f'inputs are {dirty}')
+    if dirty.is_clean():
+        logging.info('no inputs changed, so not recomputing derived columns')
+    else:
+        recompute_derived_columns(conn, window, dirty.lo, dirty.hi, end_time, metrics)
+    run_step(metrics, conn, 'flush', window.flush)
+    store_migration_metrics(conn, run_start, metrics)
     logging.info('done with migration')
+    return dirty
+
+def recompute_derived_columns(conn, window, lo, hi, end_time, metrics=None):
+    '''Recomputes the derived columns in the window given that inputs
+    changed between lo and hi (inclusive). The counters carry forward
+    until the next event, so they go to the end of the migration;
+    corrective insulin looks 30 minutes either way; DI and DC go one
+    curve length past hi. If metrics is a list, the steps are timed
+    into it.'''
+    if metrics is None:
+        metrics = []
+    step = timedelta(minutes=5)
+    counters_end = max(end_time, hi) + step
+    run_step(metrics, conn, 'minutes_since_meal', window_minutes_since, window,
+             'minutes_since_last_meal', 'carb_code',
+             lambda row: row[1] is not None and row[1] != 'rescue',
+             valid_minutes_since_last_meal_before_time,
+             lo, counters_end)
+    run_step(metrics, conn, 'minutes_since_bolus', window_minutes_since, window,
+             'minutes_since_last_bolus', 'total_bolus_volume',
+             lambda row: row[1] is not None and row[1] > 0,
+             valid_minutes_since_last_bolus_before_time,
+             lo, counters_end)
+    run_step(metrics, conn, 'corrective_insulin', window_corrective_insulin, window,
+             lo - timedelta(minutes=30), hi + timedelta(minutes=30))
+    iac = read_insulin_action_curve()
+    run_step(metrics, conn, 'dynamic_insulin', window_dynamic_insulin, window,
+             lo, hi + len(iac)*step + step)
+    # projections are computed when they're read; see project_dynamic_values
+    longest_cac = max([len(cac) for cac in read_carb_action_curves().values()])
+    run_step(metrics, conn, 'dynamic_carbs', window_dynamic_carbs, window,
+             lo, hi + longest_cac*step + step)
 
+# ================================================================
+# Metrics. Each step of migrate_between is run through a
+# CountingConnection, and we store one row per step per run in
+# migration_metrics (see sql/migration_metrics.sql). Oct 2026.
+
+def run_step(metrics, conn, step, fn, *args, **kwargs):
+    '''Calls fn(conn, *args, **kwargs), appending the step name, wall
+    time, statements and rows written to the metrics list. Rows written
+    to SCRATCH_TABLES don't count. Returns whatever fn returns.'''
+    counted = CountingConnection(conn, scratch_tables=SCRATCH_TABLES)
+    result = fn(counted, *args, **kwargs)
+    counts = counted.counts()
+    logging.debug(f'step {step}: {counts}')
+    metrics.append((step, counts))
+    return result
+
+def store_migration_metrics(conn, run_start, metrics):
+    '''Stores the metrics from run_step, with one multi-row INSERT. A
+    failure here is logged but doesn't stop the migration.'''
+    rows = [ (USER_ID, run_start, step, counts['seconds'], counts['statements'], counts['rows_written'])
+             for step, counts in metrics ]
+    if len(rows) == 0:
+        return
+    try:
+        curs = dbi.cursor(conn)
+        curs.executemany('''INSERT INTO migration_metrics(user_id, run_start, step, seconds,
+                                                         statements, rows_written)
+                            VALUES (%s, %s, %s, %s, %s, %s)''',
+                         rows)
+        conn.commit()
+    except Exception as err:
+        logging.error(f'ERROR! {repr(err)} storing migration metrics')
+
+def metrics_report(conn, days=7):
+    '''Prints the median and 95th percentile of the wall time,
+    statements and rows written for each step over the last N days,
+    along with the number of runs.'''
+    curs = dbi.cursor(conn)
+    curs.execute('''SELECT step, seconds, statements, rows_written
+                    FROM migration_metrics
+                    WHERE user_id = %s and run_start > now() - interval %s day
+                    ORDER BY step''',
+                 [USER_ID, int(days)])
+    by_step = collections.defaultdict(list)
+    for step, seconds, statements, rows_written in curs.fetchall():
+        by_step[step].append((seconds, statements, rows_written))
+    print(f'migration steps over the last {days} days')
+    print('\t'.join(['step', 'runs',
+                     'p50 secs', 'p95 secs',
+                     'p50 stmts', 'p95 stmts',
+                     'p50 rows', 'p95 rows']))
+    for step, vals in by_step.items():
+        vals = np.array(vals, dtype=float)
+        p50 = np.percentile(vals, 50, axis=0)
+        p95 = np.percentile(vals, 95, axis=0)
+        print('\t'.join([step, str(len(vals)),
+                         f'{p50[0]:.3f}', f'{p95[0]:.3f}',
+                         f'{p50[1]:.0f}', f'{p95[1]:.0f}',
+                         f'{p50[2]:.0f}', f'{p95[2]:.0f}']))
+    return by_step
+
+
+# ================================================================
+# Backfill. Rebuilding years of ICS2 (e.g. after a curve change) as
+# one serial migrate_between takes a long time, so this splits the
+# interval into chunks whose derived columns are computed by a pool of
+# worker processes, each with its own connection. The inputs are
+# imported first, in one serial pass over the whole interval (plus one
+# curve length before it), because importing depends on neighbouring
+# rows: carbs are coded by the boluses within
+# MEAL_INSULIN_TIME_INTERVAL of them, which may be in the next chunk.
+# Then each worker computes corrective insulin, DI and DC for its
+# chunk, reading the inputs on either side but writing only the rows in
+# [chunk_start, chunk_end), so no two workers write the same row and
+# every chunk matches a serial pass. The finished import and the
+# finished chunks are recorded in the ics2_backfill table (see
+# sql/ics2_backfill.sql), so a killed backfill picks up where it
+# stopped, without importing again. Oct 2026.
+
+BACKFILL_CHUNK_DAYS = 7
+BACKFILL_WORKERS = 4
+
+def action_curve_horizon():
+    '''The length of the longest action curve, as a timedelta.'''
+    longest = max([len(read_insulin_action_curve())] +
+                  [len(cac) for cac in read_carb_action_curves().values()])
+    return timedelta(minutes=5*longest)
+
+def backfill_chunks(start_time, end_time, chunk_days=BACKFILL_CHUNK_DAYS):
+    '''Returns a list of (chunk_start, chunk_end) pairs, each end
+    exclusive, that partition the interval from start_time to end_time.'''
+    chunks = []
+    chunk_start = start_time
+    while chunk_start < end_time:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end_time)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return chunks
+
+def backfill_import(conn, start_time, end_time):
+    '''Imports the inputs from one curve length before start_time to
+    end_time, serially, so that the convolutions at start_time see the
+    same inputs as a serial pass would, and carbs near a chunk boundary
+    are coded with the boluses on both sides of it. Then records the
+    import in ics2_backfill, as a row whose chunk_start is before
+    start_time (so it can't be mistaken for a chunk) and whose nrows is
+    NULL.'''
+    input_start = start_time - action_curve_horizon()
+    fill_forward_between(conn, input_start, end_time)
+    migrate_basal_12(conn, input_start, end_time)
+    extended_bolus_import(conn, input_start, end_time)
+    staged_event_import(conn, input_start, end_time)
+    curs = dbi.cursor(conn)
+    curs.execute('''INSERT INTO ics2_backfill(backfill_start, backfill_end, chunk_start,
+                                              chunk_end, nrows, finished)
+                    VALUES (%s, %s, %s, %s, NULL, current_timestamp())
+                    ON DUPLICATE KEY UPDATE finished = current_timestamp()''',
+                 [start_time, end_time, input_start, end_time])
+    conn.commit()
+
+def backfill_chunk(chunk):
+    '''Worker process: computes corrective insulin, DI and DC for one
+    chunk, whose inputs backfill_import has already imported, with its
+    own connection, and records it in ics2_backfill. Writes only the
+    rows in the chunk. Returns the chunk and the number of rows, or
+    None for the rows if it failed, in which case the chunk will be
+    retried on the next run.'''
+    backfill_start, backfill_end, chunk_start, chunk_end = chunk
+    try:
+        conn = dbi.connect()
+        last_row = chunk_end - timedelta(minutes=5)
+        update_corrective_insulin(conn, chunk_start, last_row)
+        nrows, _ = recompute_dynamic_insulin(conn, chunk_start, chunk_end)
+        recompute_dynamic_carbs(conn, chunk_start, chunk_end)
+        curs = dbi.cursor(conn)
+        curs.execute('''INSERT INTO ics2_backfill(backfill_start, backfill_end, chunk_start,
+                                                  chunk_end, nrows, finished)
+                        VALUES (%s, %s, %s, %s, %s, current_timestamp())
+                        ON DUPLICATE KEY UPDATE nrows = %s, finished = current_timestamp()''',
+                     [backfill_start, backfill_end, chunk_start, chunk_end, nrows, nrows])
+        conn.commit()
+        conn.close()
+        return chunk_start, chunk_end, nrows
+    except Exception as err:
+        logging.error(f'ERROR! {repr(err)} in backfill_chunk from {chunk_start} to {chunk_end}')
+        return chunk_start, chunk_end, None
+
+def backfill(conn, start_time, end_time,
+             workers=BACKFILL_WORKERS, chunk_days=BACKFILL_CHUNK_DAYS):
+    '''Migrates everything from start_time to end_time, as migrate_between
+    with force=True would, but in parallel chunks. Chunks that are
+    already recorded in ics2_backfill for this start and end are
+    skipped. The inputs are imported first, serially, for the whole
+    interval, unless ics2_backfill records that an earlier run already
+    did. The minutes-since counters carry over from one
+    chunk to the next, so they are done afterwards in one serial pass,
+    which is cheap. Returns the number of chunks that failed.'''
+    start_time = date_ui.to_rtime(start_time)
+    end_time = date_ui.to_rtime(end_time)
+    curs = dbi.cursor(conn)
+    curs.execute('''SELECT chunk_start FROM ics2_backfill
+                    WHERE backfill_start = %s and backfill_end = %s''',
+                 [start_time, end_time])
+    recorded = [ row[0] for row in curs.fetchall() ]
+    # the import's row is the one that starts before the backfill
+    imported = any([ chunk_start < start_time for chunk_start in recorded ])
+    finished = set([ chunk_start for chunk_start in recorded if chunk_start >= start_time ])
+    todo = [ (start_time, end_time, chunk_start, chunk_end)
+             for chunk_start, chunk_end in backfill_chunks(start_time, end_time, chunk_days)
+             if chunk_start not in finished ]
+    logging.info(f'backfill from {start_time} to {end_time}: {len(finished)} chunks already done, {len(todo)} to do')
+    t0 = time.time()
+    failed = 0
+    if len(todo) > 0 and imported:
+        logging.info('the inputs were already imported')
+    elif len(todo) > 0:
+        backfill_import(conn, start_time, end_time)
+        logging.info(f'imported the inputs in {time.time() - t0:.0f} seconds')
+    with multiprocessing.Pool(workers) as pool:
+        for chunk_start, chunk_end, nrows in pool.imap_unordered(backfill_chunk, todo):
+            if nrows is None:
+                failed += 1
+            logging.info(f'chunk from {chunk_start} to {chunk_end}: {nrows} rows')
+    if failed > 0:
+        logging.error(f'{failed} chunks failed; run the backfill again to retry them')
+        return failed
+    update_minutes_since_last_meal(conn, start_time, end_time)
+    update_minutes_since_last_bolus(conn, start_time, end_time)
+    logging.info(f'backfill from {start_time} to {end_time} took {time.time() - t0:.0f} seconds')
+    return failed
 
 def migrate_all(conn=None, alt_start_time=None):
     '''This is the function that should, eventually, be called from a cron job every 5 minutes.'''
@@ -1147,7 +2229,8 @@ def migrate_all(conn=None, alt_start_time=None):
     start_time = alt_start_time or prev_migration
     logging.info(f'start time is {start_time}')
     end_time = datetime.now()
-    migrate_between(conn, start_time, end_time)
+    # an explicit start time means we want everything recomputed from there
+    migrate_between(conn, start_time, end_time, force=(alt_start_time is not None))
     logging.info('storing update time')
     set_migration_time(conn, prev_migration, last_autoapp_update)
     logging.info('done')
@@ -1181,7 +2264,48 @@ if __name__ == '__main__':
         logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
                             datefmt='%H:%M',
                             level=logging.DEBUG)
-        migrate_between(conn, sys.argv[2], sys.argv[3])
+        migrate_between(conn, sys.argv[2], sys.argv[3], force=True)
+        sys.exit()
+    if len(sys.argv) > 1 and sys.argv[1] == 'backfill':
+        # like 'between' for a long interval, in parallel chunks; resumable
+        logging.basicConfig(format='%(asctime)s %(process)d %(levelname)s %(message)s',
+                            datefmt='%H:%M',
+                            level=logging.INFO)
+        workers = int(sys.argv[4]) if len(sys.argv) > 4 else BACKFILL_WORKERS
+        failed = backfill(conn, sys.argv[2], sys.argv[3], workers=workers)
+        sys.exit(1 if failed > 0 else 0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'recompute_di':
+        # recompute just the DI column, e.g. after changing the IAC
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                            datefmt='%H:%M',
+                            level=logging.INFO)
+        nrows, rate = recompute_dynamic_insulin(conn, sys.argv[2], sys.argv[3])
+        print(f'recomputed DI for {nrows} rows at {rate:.0f} rows/second')
+        sys.exit()
+    if len(sys.argv) > 1 and sys.argv[1] == 'recompute_dc':
+        # recompute just the DC column, e.g. after changing the CAC
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                            datefmt='%H:%M',
+                            level=logging.INFO)
+        nrows, rate = recompute_dynamic_carbs(conn, sys.argv[2], sys.argv[3])
+        print(f'recomputed DC for {nrows} rows at {rate:.0f} rows/second')
+        sys.exit()
+    if len(sys.argv) > 1 and sys.argv[1] == 'import_stats':
+        # compare statement counts of the old and staged imports, e.g. over a week
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                            datefmt='%H:%M',
+                            level=logging.INFO)
+        staged_event_import_comparison(conn, sys.argv[2], sys.argv[3])
+        sys.exit()
+    if len(sys.argv) > 1 and sys.argv[1] == 'metrics':
+        # per-step p50/p95 over the last N days, default 7
+        metrics_report(conn, int(sys.argv[2]) if len(sys.argv) > 2 else 7)
+        sys.exit()
+    if len(sys.argv) > 1 and sys.argv[1] == 'project':
+        # print projected DI and DC for the next N hours, default 3
+        proj = project_dynamic_values(conn, int(sys.argv[2]) if len(sys.argv) > 2 else 3)
+        print_tuples(['rtime', 'dynamic_insulin', 'dynamic_carbs'],
+                     zip(proj['rtimes'], proj['dynamic_insulin'], proj['dynamic_carbs']))
         sys.exit()
     if len(sys.argv) > 1 and sys.argv[1] == 'since':
         # 'since' updates the migration times and goes up to "now"
@@ -69,10 +69,16 @@ import os                       # for path.join
 import sys
 import math                     # for floor
 import collections              # for deque
+import bisect                   # for the CGM index
+import time
+import multiprocessing         # to migrate the pairs concurrently
+import queue
 import cs304dbi as dbi
+import bolus_carb_pairing
 from datetime import datetime, timedelta
 import date_ui
 import logging
+from statement_counter import nearest_rank   # for lag_report
 
 from loop_logic_testing_cgm_cron import in_test_mode as in_loop_logic_test_mode
 import loop_logic_testing_cgm_cron as lltcc
@@ -107,6 +113,9 @@ CARBS_MINUTES_AFTER_BOLUS = 5
 # the time in minutes for two timestamps to "match"
 TIMEDELTA_MINS = 5
 
+# a CGM reading further than this from a bolus, etc. doesn't match it
+MAX_MINUTES_FOR_MATCHING_CGM = 30
+
 def debugging():
     '''Run this in the Python REPL to turn on debug logging. The default is just error'''
     logging.basicConfig(level=logging.DEBUG)
@@ -336,14 +345,14 @@ def migrate_cgm(conn, dest, start_time, commit=True):
         if nr == 0:
             logging.debug(f'inserting into {dest}.realtime_cgm cgm = {row[2]} from {source}')
             if source == 'dexcom':
-                ins.execute(f'''insert into {dest}.realtime_cgm(cgm_id,user_id,dexcom_time,mgdl,trend,trend_code,src)
-                                values(null,%s,%s,%s,%s,%s,'dexcom')''',
-                            row)
+                ins.execute(f'''insert into {dest}.realtime_cgm(cgm_id,user_id,dexcom_time,mgdl,trend,trend_code,src,lag_secs)
+                                values(null,%s,%s,%s,%s,%s,'dexcom',%s)''',
+                            list(row) + [lag_secs(dexcom_time)])
             elif source == 'libre':
                 # Updated insertion with trend_code set to NULL
-                ins.execute(f'''insert into {dest}.realtime_cgm(cgm_id,user_id,dexcom_time,mgdl,trend,trend_code,src)
-                                values(null,%s,%s,%s,%s,NULL,'libre')''',
-                            (user_id, dexcom_time, row[2], row[3]))  # omitting trend_code
+                ins.execute(f'''insert into {dest}.realtime_cgm(cgm_id,user_id,dexcom_time,mgdl,trend,trend_code,src,lag_secs)
+                                values(null,%s,%s,%s,%s,NULL,'libre',%s)''',
+                            (user_id, dexcom_time, row[2], row[3], lag_secs(dexcom_time)))  # omitting trend_code
                     
     if commit:
         conn.commit()
@@ -385,6 +394,92 @@ is running in dest.
     migrate_cgm(conn, dest, prev_cgm_update)
     set_cgm_migration_time(conn, dest, prev_cgm_update, last_cgm_update)
 
+# ================================================================
+# Ingestion lag
+
+'''Oct 2026. Each bolus, carb and CGM row records, when it's migrated,
+how many seconds old its source timestamp is (bolus_lag_secs and
+carb_lag_secs in loop_summary, lag_secs in realtime_cgm; see
+sql/loop-logic-delta-oct-18.sql). That's the end-to-end delay from the
+pump or the Dexcom to the row the dosing loop reads. lag_report
+summarizes it per day. The source timestamps are local time, like
+datetime.now().'''
+
+LAG_COLUMNS = [('bolus', 'loop_summary', 'bolus_timestamp', 'bolus_lag_secs'),
+               ('carb', 'loop_summary', 'carb_timestamp', 'carb_lag_secs'),
+               ('cgm', 'realtime_cgm', 'dexcom_time', 'lag_secs')]
+
+def lag_secs(event_time, now=None):
+    '''Returns the whole number of seconds from event_time to now.'''
+    if event_time is None:
+        return None
+    if now is None:
+        now = datetime.now()
+    return int((now - date_ui.to_datetime(event_time)).total_seconds())
+
+def lag_report(conn, dest='loop_logic', days=7):
+    '''Prints and returns the number of rows and the median, 95th
+percentile and max lag in seconds, per day and kind of row, for the
+last N days.'''
+    curs = dbi.cursor(conn)
+    report = []
+    for kind, table, time_col, lag_col in LAG_COLUMNS:
+        curs.execute(f'''SELECT date({time_col}), {lag_col} FROM {dest}.{table}
+                         WHERE {time_col} >= current_date() - interval %s day
+                           AND {lag_col} IS NOT NULL''',
+                     [int(days)])
+        by_day = collections.defaultdict(list)
+        for day, lag in curs.fetchall():
+            by_day[day].append(lag)
+        for day in sorted(by_day.keys()):
+            lags = sorted(by_day[day])
+            report.append({'day': day, 'kind': kind, 'rows': len(lags),
+                           'p50': nearest_rank(lags, 50),
+                           'p95': nearest_rank(lags, 95),
+                           'max': lags[-1]})
+    report.sort(key=lambda r: (r['day'], r['kind']))
+    print(f'migration lag in seconds for {dest} over the last {days} days')
+    print('\t'.join(['day', 'kind', 'rows', 'p50', 'p95', 'max']))
+    for r in report:
+        print('\t'.join([str(r['day']), r['kind'], str(r['rows']),
+                         str(r['p50']), str(r['p95']), str(r['max'])]))
+    return report
+
+# ================================================================
+# Configuration
+
+'''The configuration table has a row of parameters (intervals,
+timeouts) for each user. Rather than each function querying it when
+it needs a value, we load a snapshot once per run and pass it
+around. It isn't cached across runs: cron starts a new process for
+each run, so a cache would never be hit.
+
+Oct 2026
+'''
+
+class ConfigSnapshot:
+    '''The configuration row for a user in {dest}, as a dictionary.'''
+
+    def __init__(self, dest, user_id, row):
+        self.dest = dest
+        self.user_id = user_id
+        self.row = row if row is not None else {}
+
+    def get(self, name, default=None):
+        val = self.row.get(name)
+        return default if val is None else val
+
+def load_configuration(conn, dest, user_id=HUGH_USER_ID):
+    '''Reads and returns the ConfigSnapshot for the user in dest.'''
+    curs = dbi.dict_cursor(conn)
+    curs.execute(f'''select * from {dest}.configuration where user_id = %s''',
+                 [user_id])
+    rows = curs.fetchall()
+    if len(rows) > 1:
+        raise Exception('multiple configurations; which do you want', rows)
+    logging.info(f'loaded {dest}.configuration for user {user_id}')
+    return ConfigSnapshot(dest, user_id, rows[0] if len(rows) > 0 else None)
+
 # ================================================================
 # Bolus functions
 
@@ -407,7 +502,7 @@ def get_max_bolus_interval_mins(conn, dest, user_id=HUGH_USER_ID):
         return DEFAULT
     return row[0]
         
-def matching_cgm(conn, dest, timestamp, test_mode=False):
+def matching_cgm(conn, dest, timestamp, test_mode=False, cgm_index=None):
     '''Returns two values, the cgm_id and cgm_value value from the
 {dest}.realtime_cgm table where its timestamp is closest in time to the given
 timestamp, which is the timestamp of a bolus or a command.
@@ -426,9 +521,14 @@ values in janice.realtime_cgm2.
 May 18, 2023. Removed that keyword, because we will always search
 realtime_cgm. Added a test_mode keyword to be more verbose.
 
+Oct 2026. If cgm_index is a CgmIndex that covers the timestamp, we
+search that instead of querying the database.
+
     '''
+    if cgm_index is not None and cgm_index.covers(date_ui.to_datetime(timestamp)):
+        return cgm_index.closest(date_ui.to_datetime(timestamp))
     curs = dbi.cursor(conn)
-    MM = MAX_MINUTES_FOR_MATCHING_CGM = 30
+    MM = MAX_MINUTES_FOR_MATCHING_CGM
     # 5/12 New algorithm: get all values within that range and then find closest in Python
     # This might be re-written more concisely using the BETWEEN operator, but this is equivalent
     query = f'''SELECT cgm_id, dexcom_time, mgdl from {dest}.realtime_cgm
@@ -447,6 +547,78 @@ realtime_cgm. Added a test_mode keyword to be more verbose.
     logging.debug(f'found matching CGM for timestamp {timestamp}: {cgm_time} id = {cgm_id}, mgdl = {mgdl}')
     return (cgm_id, mgdl)
 
+class CgmIndex:
+    '''The realtime_cgm readings covering a migration window, as tuples
+of (cgm_id, dexcom_time, mgdl) sorted by dexcom_time, so that
+matching_cgm can use bisect instead of a query for each bolus, carb and
+temp basal. Oct 2026.
+
+The index covers timestamps from start_time to end_time; matches for
+timestamps outside that still go to the database. The lookups counter
+is the number of queries saved.
+    '''
+
+    def __init__(self, rows, start_time, end_time):
+        self.rows = sorted(rows, key=lambda row: row[1])
+        self.times = [ row[1] for row in self.rows ]
+        self.start_time = date_ui.to_datetime(start_time)
+        self.end_time = date_ui.to_datetime(end_time)
+        self.lookups = 0
+
+    def covers(self, timestamp):
+        return self.start_time <= timestamp <= self.end_time
+
+    def closest(self, timestamp):
+        '''Same result as the query in matching_cgm: the reading closest
+in time, if any are strictly within MAX_MINUTES_FOR_MATCHING_CGM,
+otherwise (None, None).'''
+        self.lookups += 1
+        mm = timedelta(minutes=MAX_MINUTES_FOR_MATCHING_CGM)
+        i = bisect.bisect_left(self.times, timestamp)
+        # the candidates are the last reading before and the first one at or after
+        candidates = [ j for j in [i-1, i]
+                       if 0 <= j < len(self.times) and abs(self.times[j] - timestamp) < mm ]
+        if len(candidates) == 0:
+            logging.error(f'no matching CGM for timestamp {timestamp}')
+            return (None, None)
+        j = argmin(candidates, lambda j: abs(self.times[j] - timestamp))
+        # if there are several readings at that time, use the first, like argmin would
+        j = bisect.bisect_left(self.times, self.times[j])
+        (cgm_id, cgm_time, mgdl) = self.rows[j]
+        logging.debug(f'found matching CGM for timestamp {timestamp}: {cgm_time} id = {cgm_id}, mgdl = {mgdl}')
+        return (cgm_id, mgdl)
+
+def load_cgm_index(conn, dest, start_time, end_time=None):
+    '''Reads the {dest}.realtime_cgm readings needed to match timestamps
+from start_time to end_time (default now) with one query, and returns
+a CgmIndex.'''
+    start_time = date_ui.to_datetime(start_time)
+    end_time = date_ui.to_datetime(end_time or datetime.now())
+    mm = timedelta(minutes=MAX_MINUTES_FOR_MATCHING_CGM)
+    curs = dbi.cursor(conn)
+    curs.execute(f'''SELECT cgm_id, dexcom_time, mgdl from {dest}.realtime_cgm
+                     WHERE user_id = %s AND %s < dexcom_time and dexcom_time < %s''',
+                 [HUGH_USER_ID, start_time - mm, end_time + mm])
+    return CgmIndex(curs.fetchall(), start_time, end_time)
+
+def cgm_index_test():
+    '''Compares CgmIndex.closest with argmin over readings with a gap,
+a duplicate time, and timestamps before, between and after them.'''
+    t0 = datetime(2024, 6, 1, 12, 0)
+    minutes = [0, 5, 10, 10, 15, 80, 85]
+    rows = [ (i, t0 + timedelta(minutes=m), 100+i) for i, m in enumerate(minutes) ]
+    index = CgmIndex(rows, t0 - timedelta(hours=1), t0 + timedelta(hours=3))
+    mm = timedelta(minutes=MAX_MINUTES_FOR_MATCHING_CGM)
+    for m in range(-40, 130, 1):
+        ts = t0 + timedelta(minutes=m)
+        near = [ row for row in rows if abs(row[1] - ts) < mm ]
+        best = argmin(near, lambda row : abs(row[1]-ts))
+        expected = (None, None) if best is None else (best[0], best[2])
+        actual = index.closest(ts)
+        if actual != expected:
+            raise Exception(f'at {ts} expected {expected} but got {actual}')
+    print(f'cgm index passed, saving {index.lookups} queries')
+
 def test_matching_cgm(conn, dest, test_time):
     '''test given timestamp'''
     cgm_id, mgdl = matching_cgm(conn, dest, test_time, test_mode=True)
@@ -501,6 +673,9 @@ searching for carb value in loop_summary given minutes before or after
 timestamp. The carbs are *not* already matched with a bolus. Returns
 None if no match.
 
+Oct 2026. The migration no longer calls this; it reads all the
+unpaired carbs once and uses bolus_carb_pairing.
+
     '''
     if conn is None:
         conn = dbi.connect()
@@ -546,80 +721,140 @@ def carbs_within_interval_test(conn, source, dest, start_time):
                 raise Exception
             print(f'loop summary id {id} for carb_id {carb_id} matches')
         
-def migrate_boluses(conn, source, dest, start_time, commit=True):
-    '''start_time is a string or a python datetime. '''
+def migrated_ids(conn, dest, id_col, rows):
+    '''Returns the set of (user_id, id) pairs among rows, which are tuples
+that start with user_id and id, that are already in {dest}.loop_summary,
+where the id is in column id_col. One query, however many rows. Oct 2026.'''
+    if len(rows) == 0:
+        return set()
+    curs = dbi.cursor(conn)
+    curs.execute(f'''select user_id, {id_col} from {dest}.loop_summary
+                     where {id_col} in %s''',
+                 [tuple(set([ row[1] for row in rows ]))])
+    return set(curs.fetchall())
+
+'''Oct 2026. New loop_summary rows are written with one multi-row
+INSERT per run (per INSERT_CHUNK rows), and the follow-up updates of
+existing rows with one UPDATE, so a run costs a constant number of
+statements. The anchors are computed afterwards by compute_anchors,
+which reads the boluses by time, so the ids of the inserted rows
+aren't needed.'''
+
+INSERT_CHUNK = 1000
+
+def insert_loop_summary_rows(conn, dest, columns, rows):
+    '''Inserts rows, tuples of values for the given columns, into
+{dest}.loop_summary and returns the number of rows. Doesn't commit.'''
+    curs = dbi.cursor(conn)
+    placeholders = '(' + ', '.join(['%s']*len(columns)) + ')'
+    for i in range(0, len(rows), INSERT_CHUNK):
+        chunk = rows[i:i+INSERT_CHUNK]
+        curs.execute(f'''INSERT INTO {dest}.loop_summary ({', '.join(columns)})
+                         VALUES {', '.join([placeholders]*len(chunk))}''',
+                     [ val for row in chunk for val in row ])
+    return len(rows)
+
+def update_loop_summary_rows(conn, dest, columns, updates):
+    '''updates is a list of (loop_summary_id, values), where values is a
+tuple for the given columns. Updates all the rows with one UPDATE per
+INSERT_CHUNK rows, using a CASE on loop_summary_id for each
+column. Doesn't commit.'''
+    curs = dbi.cursor(conn)
+    for i in range(0, len(updates), INSERT_CHUNK):
+        chunk = updates[i:i+INSERT_CHUNK]
+        cases = ' '.join([ 'WHEN %s THEN %s' for update in chunk ])
+        sets = ', '.join([ f'{col} = CASE loop_summary_id {cases} END' for col in columns ])
+        args = []
+        for j in range(len(columns)):
+            for (id, values) in chunk:
+                args.extend([id, values[j]])
+        curs.execute(f'''UPDATE {dest}.loop_summary SET {sets}
+                         WHERE loop_summary_id in %s''',
+                     args + [tuple([ id for (id, values) in chunk ])])
+
+def migrate_boluses(conn, source, dest, start_time, commit=True, cgm_index=None, anchors=None, config=None):
+    '''start_time is a string or a python datetime. cgm_index is an optional CgmIndex.
+anchors is an optional PendingAnchors; if supplied, the caller computes
+the anchors, otherwise we do, just before committing, using config, an
+optional ConfigSnapshot. Returns the number of new rows.
+
+Oct 2026. Rather than a query per bolus to see if it's already
+migrated, and another to look for matching carbs, we get the migrated
+ids with one query and the unmatched carbs for the whole window with
+another, pair them in memory with bolus_carb_pairing, and insert all
+the new correction boluses with one multi-row INSERT. A carb row
+paired with one bolus can't be paired with another, just as when the
+UPDATE happened before the next query.
+    '''
     if conn is None:
         conn = dbi.connect()
     curs = dbi.cursor(conn)
-    # Note that these will probably be *new* rows, but to make this
-    # idempotent, we'll look for a bolus_id
     # This function returns a list of tuples: user_id, bolus_id, date, value 
     boluses = get_boluses(conn, source, start_time)
     n = len(boluses)
     logging.info(f'{n} boluses to migrate since {start_time}')
-    for row in boluses:
-        # note: bolus_id is called bolus_pump_id in loop_logic
-        (user_id, bolus_pump_id, date, value) = row
+    # note: bolus_id is called bolus_pump_id in loop_logic
+    migrated = migrated_ids(conn, dest, 'bolus_pump_id', boluses)
+    boluses = [ row for row in boluses if (row[0], row[1]) not in migrated ]
+    logging.info(f'{len(migrated)} boluses already migrated; {len(boluses)} new')
+    if len(boluses) == 0:
+        return 0
+    # all the carbs without boluses that any of these boluses might match
+    times = [ row[2] for row in boluses ]
+    curs.execute(f'''SELECT loop_summary_id, carb_id, carb_timestamp, carb_value 
+                     FROM {dest}.loop_summary 
+                     WHERE user_id = %s  
+                     AND bolus_pump_id is NULL
+                     AND carb_timestamp 
+                     BETWEEN (%s - interval %s minute) 
+                         AND (%s + interval %s minute)
+                     ORDER BY loop_summary_id''',
+                 [HUGH_USER_ID, min(times), CARBS_MINUTES_BEFORE_BOLUS,
+                  max(times), CARBS_MINUTES_AFTER_BOLUS])
+    carb_rows = curs.fetchall()
+    writes = bolus_carb_pairing.pair_boluses(boluses, carb_rows,
+                                             CARBS_MINUTES_BEFORE_BOLUS,
+                                             CARBS_MINUTES_AFTER_BOLUS)
+    corrections = []
+    updates = []
+    pending = PendingAnchors() if anchors is None else anchors
+    for write in writes:
+        (user_id, bolus_pump_id, date, value) = write[1]
         logging.debug(f'migrate bolus_pump_id={bolus_pump_id} on date {date} of value {value}')
-        # see if bolus_pump_id matches, to avoid re-inserting
-        # something already migrated TODO: for speed, we either need
-        # an index on bolus_pump_id (good) or use the bolus_timestamp
-        # and have an index on the time stamp of the loop_summary
-        # entry, which we don't have (yet). Maybe we should?
-        curs.execute(f'''select loop_summary_id, user_id, bolus_pump_id, bolus_timestamp, bolus_value
-                        from {dest}.loop_summary
-                        where user_id = %s and bolus_pump_id = %s''',
-                     [user_id, bolus_pump_id])
-        match = curs.fetchone()
-        if match is not None:
-            # already exists, so update? Ignore? We'll complain if they differ
-            match_id = match[0]
-            logging.info(f'bolus match: this bolus is already migrated: see {dest}.loop_summary row {match_id}')
-            continue
-        # the normal case, we'll migrate it (either insert or update an existing row with matching carbs).
         # First see if there's a CGM at this time
-        (cgm_id, mgdl) = matching_cgm(conn, dest, date)
+        (cgm_id, mgdl) = matching_cgm(conn, dest, date, cgm_index=cgm_index)
         # next, see if there are carbs w/in an interval. if so, update that row
-        # 5/19. Get info about the carbs, to fill into loop_summary fields
-        carb_row = carbs_within_interval_without_bolus(conn, source, dest, date)
-        if carb_row is None:
+        if write[0] == 'insert':
             logging.debug(f'CASE C: migrate bolus at time {date} has no matching carbs')
-            # have to insert into loop_summary
+            # have to insert into loop_summary, which we do below
             bolus_type = 'correction' # since no carbs
-            curs.execute(f'''INSERT INTO {dest}.loop_summary
-                             (user_id, bolus_pump_id, bolus_timestamp, bolus_type, bolus_value,
-                             linked_cgm_id, linked_cgm_value)
-                             values(%s, %s, %s, %s, %s, %s, %s)''',
-                         [user_id, bolus_pump_id, date, bolus_type, value, cgm_id, mgdl])
-            if commit:
-                conn.commit()
-            curs.execute('select last_insert_id()');
-            loop_summary_id = curs.fetchone()[0]
-            logging.debug(f'inserted correction bolus at loop_summary_id {loop_summary_id}')
-            compute_correction_anchors(conn, source, dest, start_time, commit)
-            # for debugging
-            curs.execute(f'select anchor from {dest}.loop_summary where loop_summary_id = %s', [loop_summary_id])
-            anchor = curs.fetchone()[0]
-            if anchor not in [1, 2]:
-                logging.error(f'inserted a new correction bolus at {loop_summary_id} but anchor type is not 1 or 2!!!')
+            corrections.append((user_id, bolus_pump_id, date, bolus_type, value, cgm_id, mgdl,
+                                lag_secs(date)))
         else:
             # since there are matching carbs, update that row instead
             # we actually don't need the other data, since it's already in the row
-            (loop_summary_id, carb_id, carb_timestamp, carb_value) = carb_row
+            (loop_summary_id, carb_id, carb_timestamp, carb_value) = write[2]
             logging.debug(f'CASE D: migrate bolus at time {date} has matching carbs {carb_value} at time {carb_timestamp}')
             bolus_type = 'carb'
-            # let's compute the carb anchor now.
-            anchor_value = compute_carb_anchor(conn, source, dest, value, loop_summary_id, start_time)
-            if anchor_value not in [None, 3]:
-                logging.error(f'loop summary {loop_summary_id} updated with a carb bolus, but anchor is not None or 3')
-            curs.execute(f'''UPDATE {dest}.loop_summary
-                             SET bolus_pump_id = %s, bolus_timestamp = %s, bolus_type = %s, bolus_value = %s,
-                                 anchor = %s,
-                                 linked_cgm_id = %s, linked_cgm_value = %s
-                             WHERE loop_summary_id = %s''',
-                         [bolus_pump_id, date, bolus_type, value, anchor_value, cgm_id, mgdl, loop_summary_id])
-            if commit:
-                conn.commit()
+            # the carb anchor (3 or NULL) is computed along with the others
+            pending.carb_pairs.append((loop_summary_id, value))
+            updates.append((loop_summary_id,
+                            (bolus_pump_id, date, bolus_type, value, cgm_id, mgdl, lag_secs(date))))
+    update_loop_summary_rows(conn, dest,
+                             ['bolus_pump_id', 'bolus_timestamp', 'bolus_type', 'bolus_value',
+                              'linked_cgm_id', 'linked_cgm_value', 'bolus_lag_secs'],
+                             updates)
+    inserted = insert_loop_summary_rows(conn, dest,
+                                        ['user_id', 'bolus_pump_id', 'bolus_timestamp', 'bolus_type',
+                                         'bolus_value', 'linked_cgm_id', 'linked_cgm_value', 'bolus_lag_secs'],
+                                        corrections)
+    logging.debug(f'updated {len(updates)} carb rows and inserted {inserted} correction boluses')
+    pending.corrections += len(corrections)
+    if anchors is None:
+        compute_anchors(conn, dest, start_time, pending, commit=False, config=config)
+    if commit:
+        conn.commit()
+    return inserted
     
 def migrate_boluses_test(conn, source, dest, start_time, commit=True):
     curs = dbi.cursor(conn)
@@ -644,6 +879,8 @@ https://docs.google.com/document/d/1q4dZxhWAhJvpTycH-U17Es44d4eqjoIH/edit
 says that we only need the latest row and only if
 temp_basal_in_progress=1, so that's what I've done. See additional notes in migrate_temp_basal.
 
+Oct 2026. migrate_temp_basal now uses get_temp_basals_after and the checkpoint.
+
     '''
     curs = dbi.cursor(conn)
     curs.execute(f'''select temp_basal_state_id, temp_basal_in_progress, temp_basal_percent, date 
@@ -655,7 +892,61 @@ temp_basal_in_progress=1, so that's what I've done. See additional notes in migr
                  [user_id, start_time])
     return curs.fetchone()
 
-def migrate_temp_basal(conn, source, dest, user_id, start_time, commit=True):
+'''Oct 2026. Rather than searching temp_basal_state by date on each
+run, we keep a checkpoint of the last temp basal state we migrated (its
+id, in_progress, percent and date) in {dest}.migration_status; see
+sql/migration_status-delta-oct-18.sql. Each run only reads the rows
+with a larger id, which is a primary-key range scan of just the new
+rows, and does nothing if there are none, so the same state is never
+migrated twice.'''
+
+def get_temp_basal_checkpoint(conn, dest, user_id):
+    '''Returns the checkpointed temp basal state as a tuple (id,
+in_progress, percent, date), or None if there isn't one yet.'''
+    curs = dbi.cursor(conn)
+    curs.execute(f'''select temp_basal_state_id, temp_basal_in_progress, temp_basal_percent, temp_basal_date
+                     from {dest}.migration_status where user_id = %s''',
+                 [user_id])
+    row = curs.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return row
+
+def set_temp_basal_checkpoint(conn, dest, user_id, state):
+    '''Stores the state (as returned by get_temp_basal_checkpoint) or
+clears the checkpoint if state is None. Doesn't commit.'''
+    if state is None:
+        state = (None, None, None, None)
+    curs = dbi.cursor(conn)
+    curs.execute(f'''UPDATE {dest}.migration_status
+                     SET temp_basal_state_id = %s, temp_basal_in_progress = %s,
+                         temp_basal_percent = %s, temp_basal_date = %s
+                     WHERE user_id = %s''',
+                 list(state) + [user_id])
+
+def get_temp_basals_after(conn, source, user_id, after_id, start_time):
+    '''Returns the non-error temp_basal_state rows for user_id with ids
+after after_id and dates since start_time, in id order, as tuples like
+the checkpoint.'''
+    curs = dbi.cursor(conn)
+    curs.execute(f'''select temp_basal_state_id, temp_basal_in_progress, temp_basal_percent, date 
+                     from {source}.temp_basal_state
+                     where temp_basal_state_id > %s and user_id = %s and error = 0 and date >= %s
+                     order by temp_basal_state_id''',
+                 [after_id, user_id, start_time])
+    return [ (id, bytes_to_int(in_progress), percent, date)
+             for (id, in_progress, percent, date) in curs.fetchall() ]
+
+def effective_temp_basal(checkpoint, newer):
+    '''Applies the newer states, in id order, to the checkpoint, and
+returns the resulting state. Each state replaces the previous one, so
+that's the last, if any.'''
+    state = checkpoint
+    for row in newer:
+        state = row
+    return state
+
+def migrate_temp_basal(conn, source, dest, user_id, start_time, commit=True, cgm_index=None):
     '''start_time is a string or a python datetime.  Migrating temp basal
 is fairly easy: we look for any non-error rows later than start_time
 and we migrate the latest such row. We migrate both in_progress=0 and
@@ -667,27 +958,34 @@ so that's about 7 per day.
 We are not sure why there are more rows with in_progress=0 versus
 in_progress=1.
 
+Oct 2026. Only rows after the checkpointed state are read; see
+get_temp_basal_checkpoint. The checkpoint is updated in the same
+transaction as the insert.
+
     '''
     if conn is None:
         conn = dbi.connect()
     curs = dbi.cursor(conn)
-    basal = get_latest_temp_basal_since_time(conn, source, user_id, start_time)
-    if basal is None:
-        logging.info(f'no temp basal in {source} to migrate since {start_time}')
+    checkpoint = get_temp_basal_checkpoint(conn, dest, user_id)
+    after_id = 0 if checkpoint is None else checkpoint[0]
+    newer = get_temp_basals_after(conn, source, user_id, after_id, start_time)
+    if len(newer) == 0:
+        logging.info(f'no temp basal in {source} to migrate since {start_time} and id {after_id}')
         return
+    basal = effective_temp_basal(checkpoint, newer)
     (id, in_progress, percent, date) = basal
-    in_progress = bytes_to_int(in_progress)
     logging.info(f'migrating temp basal {id}: in_progress: {in_progress}, {percent}% at {date} > {start_time}')
     # TODO: this needs the user_id
     # Check back to https://docs.google.com/document/d/1q4dZxhWAhJvpTycH-U17Es44d4eqjoIH/edit
     # which says to set command_id to NULL and type='temporary_basal'
-    (cgm_id, mgdl) = matching_cgm(conn, dest, date)
+    (cgm_id, mgdl) = matching_cgm(conn, dest, date, cgm_index=cgm_index)
     # have to insert into loop_summary
     curs.execute(f'''INSERT INTO {dest}.loop_summary
                      (user_id, command_id, type, temp_basal_timestamp, temp_basal_percent, running,
                       linked_cgm_id, linked_cgm_value)
                      VALUES(%s, NULL, 'temporary_basal', %s, %s, %s, %s, %s)''',
                  [user_id, date, percent, in_progress, cgm_id, mgdl])
+    set_temp_basal_checkpoint(conn, dest, user_id, basal)
     if commit:
         conn.commit()
 
@@ -824,6 +1122,8 @@ def bolus_within_interval_without_carbs(conn, source, dest, timestamp,
     '''returns loop_summary_id, bolus_pump_id, bolus_timestamp, bolus_value searching for bolus in loop_summary within the given
 time range of timestamp. Returns None if no match.
 
+Oct 2026. The migration no longer calls this; see bolus_carb_pairing.
+
     '''
     if conn is None:
         conn = dbi.connect()
@@ -851,77 +1151,104 @@ time range of timestamp. Returns None if no match.
         return biggest
 
 
-def migrate_carbs(conn, source, dest, start_time, commit=True):
-    '''Like the other migrations. start_time is string or python datetime.'''
+def migrate_carbs(conn, source, dest, start_time, commit=True, cgm_index=None, anchors=None, config=None):
+    '''Like the other migrations. start_time is string or python datetime.
+cgm_index is an optional CgmIndex. anchors and config are as for
+migrate_boluses. Returns the number of new rows.
+
+Oct 2026. Like migrate_boluses, the already-migrated carbs and the
+boluses they might match are each found with one query, the pairing
+is done by bolus_carb_pairing, and the new carbs without boluses are
+inserted with one multi-row INSERT.'''
     if conn is None:
         conn = dbi.connect()
     curs = dbi.cursor(conn)
     # Note that these will probably be *new* rows, but to make this
-    # idempotent, we'll look for a match on the date.
+    # idempotent, we'll look for a match on the carb_id.
     carbs = get_carbs(conn, source, start_time)
     n = len(carbs)
     logging.info(f'{n} carbs to migrate since {start_time}')
-    for row in carbs:
-        # note: carb_id is called carbohydrate_id in the source
-        (user_id, carb_id, carb_date, value) = row
-        # see if carb_id matches, to avoid re-inserting something already migrated
-        # TODO: check the efficiency of this query
-        curs.execute(f'''select loop_summary_id, user_id, carb_id
-                        from {dest}.loop_summary
-                        where user_id = %s and carb_id = %s''',
-                     [user_id, carb_id])
-        match = curs.fetchone()
-        if match is not None:
-            # already exists, so update? Ignore? We'll complain if they differ
-            logging.info('carb match: this carb is already migrated: {}'.format(row))
-            continue
-        # no match, so we'll migrate it (either insert or update w/ matching bolus).
+    # note: carb_id is called carbohydrate_id in the source
+    migrated = migrated_ids(conn, dest, 'carb_id', carbs)
+    carbs = [ row for row in carbs if (row[0], row[1]) not in migrated ]
+    logging.info(f'{len(migrated)} carbs already migrated; {len(carbs)} new')
+    if len(carbs) == 0:
+        return 0
+    # all the boluses without carbs that any of these carbs might match
+    times = [ row[2] for row in carbs ]
+    curs.execute(f'''SELECT loop_summary_id, bolus_pump_id, bolus_timestamp, bolus_value 
+                     FROM {dest}.loop_summary 
+                     WHERE user_id = %s  
+                     AND carb_id IS NULL
+                     AND bolus_pump_id IS NOT NULL
+                     AND bolus_timestamp 
+                     BETWEEN (%s - interval %s minute) 
+                         AND (%s + interval %s minute)
+                     ORDER BY loop_summary_id''',
+                 [HUGH_USER_ID, min(times), CARBS_MINUTES_AFTER_BOLUS,
+                  max(times), CARBS_MINUTES_BEFORE_BOLUS])
+    bolus_rows = curs.fetchall()
+    writes = bolus_carb_pairing.pair_carbs(carbs, bolus_rows,
+                                           CARBS_MINUTES_AFTER_BOLUS,
+                                           CARBS_MINUTES_BEFORE_BOLUS)
+    new_carbs = []
+    updates = []
+    pending = PendingAnchors() if anchors is None else anchors
+    for write in writes:
+        (user_id, carb_id, carb_date, value) = write[1]
         # First see if there's a CGM at this time
-        (cgm_id, cgm_value) = matching_cgm(conn, dest, carb_date)
+        (cgm_id, cgm_value) = matching_cgm(conn, dest, carb_date, cgm_index=cgm_index)
         # 5/23. Get info about a bolus at this time. If so, use that row of loop_summary
-        bolus_row = bolus_within_interval_without_carbs(conn, source, dest, carb_date)
-        if bolus_row is None:
-            curs.execute(f'''INSERT INTO {dest}.loop_summary
-                            (user_id, carb_id, carb_timestamp, carb_value, linked_cgm_id, linked_cgm_value)
-                            VALUES (%s, %s, %s, %s, %s, %s)''',
-                             [user_id, carb_id, carb_date, value, cgm_id, cgm_value])
-            curs.execute('select last_insert_id()')
-            loop_id = curs.fetchone()[0]
-            logging.debug(f'CASE A: new carbs, no matching bolus, inserted {loop_id}')
+        if write[0] == 'insert':
+            logging.debug(f'CASE A: new carbs at {carb_date}, no matching bolus')
+            new_carbs.append((user_id, carb_id, carb_date, value, cgm_id, cgm_value,
+                              lag_secs(carb_date)))
         else:
             # reuse existing row. Note that this revision means
             # that the bolus is now associated with carbs, so
             # change its type to 'carb' and its anchor to NULL
             # Change on 7/26, anchor might not be NULL; might be 3
-            (loop_summary_id, bolus_pump_id, bolus_timestamp, bolus_value) = bolus_row
+            (loop_summary_id, bolus_pump_id, bolus_timestamp, bolus_value) = write[2]
             logging.debug(f'CASE B. migrate carbs at time {carb_date} has matching bolus {bolus_pump_id} at time {bolus_timestamp} in row {loop_summary_id}')
             bolus_type = 'carb'
-            # check for anchor
-            anchor = compute_carb_anchor(conn, source, dest, value, loop_summary_id, start_time)
-            if anchor not in [None, 3]:
-                logging.error(f'loop summary {loop_summary_id} updated with a carb bolus, but anchor is not None or 3')
-            curs.execute(f'''UPDATE {dest}.loop_summary
-                             SET carb_id = %s, carb_timestamp = %s, carb_value = %s, 
-                                 bolus_type = 'carb', anchor = %s,
-                                 linked_cgm_id = %s, linked_cgm_value = %s
-                             WHERE loop_summary_id = %s''',
-                         [carb_id, carb_date, value, anchor, cgm_id, cgm_value, loop_summary_id])
+            # the carb anchor is computed along with the others. Oct
+            # 2026: compare the bolus value, not the carbs.
+            pending.carb_pairs.append((loop_summary_id, bolus_value))
+            updates.append((loop_summary_id,
+                            (carb_id, carb_date, value, bolus_type, cgm_id, cgm_value,
+                             lag_secs(carb_date))))
+    update_loop_summary_rows(conn, dest,
+                             ['carb_id', 'carb_timestamp', 'carb_value', 'bolus_type',
+                              'linked_cgm_id', 'linked_cgm_value', 'carb_lag_secs'],
+                             updates)
+    inserted = insert_loop_summary_rows(conn, dest,
+                                        ['user_id', 'carb_id', 'carb_timestamp', 'carb_value',
+                                         'linked_cgm_id', 'linked_cgm_value', 'carb_lag_secs'],
+                                        new_carbs)
+    logging.debug(f'updated {len(updates)} bolus rows and inserted {inserted} carbs without boluses')
+    if anchors is None:
+        compute_anchors(conn, dest, start_time, pending, commit=False, config=config)
     if commit:
         conn.commit()
+    return inserted
 
-def compute_carb_anchor(conn, source, dest, curr_bolus_value, curr_loop_summary_id, start_time, commit=True):
+def compute_carb_anchor(conn, source, dest, curr_bolus_value, curr_loop_summary_id, start_time, commit=True, config=None):
     '''When a bolus switches from correction to carb, we have to compute
 whether it's the current anchor. This function looks in the interval
 preceding start_time and determines the bolus value and
 loop_summary_id of the anchor (largest carb bolus). If the new carb
 bolus beats it, we return 3 otherwise None.
 
+Oct 2026. No longer used by the migration, which calls compute_anchors
+once per run.
+
     '''
     logging.info(f'determining carb anchor in interval preceding {start_time}')
     curs = dbi.cursor(conn)
     # this was fixed. Had been bolus_interval_minutes.
-    curs.execute(f'select carb_interval_mins from {dest}.configuration')
-    interval = curs.fetchone()[0]
+    if config is None:
+        config = load_configuration(conn, dest)
+    interval = config.get('carb_interval_mins')
     past = date_ui.to_datetime(start_time) - timedelta(minutes=interval)
     # get all carb boluses in last interval.  We need to check that
     # they are before start_time because we might identify historical
@@ -979,7 +1306,7 @@ if seq is empty. In the event of a tie, returns the last such.'''
             return None
     return best
 
-def compute_correction_anchors(conn, source, dest, start_time, commit=True):
+def compute_correction_anchors(conn, source, dest, start_time, commit=True, config=None):
     '''Identify anchor and topup boluses in the N minutes preceding
 start_time, where N is a configuration variable:
 bolus_interval_minutes. Only consults dest; source is ignored.  Anchor
@@ -1001,10 +1328,14 @@ boluses in the interval, and then I'll filter them here. NO; see next.
 and carb boluses, I've separated these computations into two
 functions. This is just correction boluses.
 
+Oct 2026. No longer used by the migration, which calls compute_anchors
+once per run.
+
     '''
     curs = dbi.cursor(conn)
-    curs.execute(f'select bolus_interval_mins from {dest}.configuration')
-    interval = curs.fetchone()[0]
+    if config is None:
+        config = load_configuration(conn, dest)
+    interval = config.get('bolus_interval_mins')
     past = date_ui.to_datetime(start_time) - timedelta(minutes=interval)
     # get all correction boluses in last interval.  We need to check that they
     # are before start_time because we might identify historical
@@ -1042,21 +1373,119 @@ functions. This is just correction boluses.
         conn.commit()
 
 
+class PendingAnchors:
+    '''The anchor work accumulated during a migration run, so that all
+the anchors can be computed in one pass at the end, by
+compute_anchors. carb_pairs is a list of (loop_summary_id,
+bolus_value), one for each bolus paired with carbs, in the order they
+were paired. corrections counts the correction boluses
+inserted. Oct 2026.'''
+
+    def __init__(self):
+        self.carb_pairs = []
+        self.corrections = 0
+
+    def is_empty(self):
+        return len(self.carb_pairs) == 0 and self.corrections == 0
+
+def anchor_values(rows, pending, correction_past, carb_past):
+    '''Returns a dictionary mapping loop_summary_id to its new anchor
+value. rows are (loop_summary_id, bolus_type, bolus_value,
+bolus_timestamp) for the boluses up to start_time, in id order. This
+does the work of compute_correction_anchors and of compute_carb_anchor
+for each pair, in memory.
+
+Each carb pair gets 3 if its bolus beats the largest carb bolus after
+carb_past, otherwise None. As when the anchor was computed just before
+each UPDATE, the rows paired in this run only count once their turn
+has come. The correction anchor (1) and top-up (2) are only
+recomputed if there were new correction boluses. Oct 2026.'''
+    anchors = {}
+    paired = set([ id for (id, value) in pending.carb_pairs ])
+    carbs = { row[0]: row[2] for row in rows
+              if row[1] == 'carb' and row[3] > carb_past }
+    earlier = [ value for (id, value) in carbs.items() if id not in paired ]
+    best = max(earlier) if len(earlier) > 0 else None
+    for (id, value) in pending.carb_pairs:
+        anchors[id] = 3 if (best is None or best < value) else None
+        if id in carbs:
+            best = carbs[id] if best is None else max(best, carbs[id])
+    if pending.corrections > 0:
+        corrections = [ row for row in rows
+                        if row[1] == 'correction' and row[3] > correction_past ]
+        if len(corrections) > 0:
+            # largest is the anchor, latest after it is the top-up
+            anchor_row = argmax(corrections, lambda r: r[2])
+            anchors[anchor_row[0]] = 1
+            if corrections.index(anchor_row) < len(corrections)-1:
+                anchors[corrections[-1][0]] = 2
+    return anchors
+
+def anchor_values_test():
+    '''Tests anchor_values with no database. Oct 2026.'''
+    t0 = datetime(2026, 10, 1, 12, 0)
+    def at(mins):
+        return t0 + timedelta(minutes=mins)
+    rows = [(1, 'correction', 2.0, at(-100)),
+            (2, 'correction', 3.0, at(-60)),
+            (3, 'correction', 1.0, at(-30)),
+            (4, 'carb', 4.0, at(-20)),
+            (5, 'carb', 5.0, at(-10)),
+            (6, 'carb', 4.5, at(-5))]
+    pending = PendingAnchors()
+    pending.carb_pairs = [(5, 5.0), (6, 4.5), (7, 9.0)]
+    pending.corrections = 1
+    # 5 beats 4; 6 doesn't beat 5; 7 (after start_time) beats them all
+    # 2 is the largest correction within 90 minutes; 3 is the top-up
+    anchors = anchor_values(rows, pending, at(-90), at(-30))
+    assert anchors == {5: 3, 6: None, 7: 3, 2: 1, 3: 2}, anchors
+    # no new corrections, so the correction anchors are left alone
+    pending.corrections = 0
+    anchors = anchor_values(rows, pending, at(-90), at(-30))
+    assert anchors == {5: 3, 6: None, 7: 3}, anchors
+    print('anchor_values_test passed')
+
+def compute_anchors(conn, dest, start_time, pending, commit=True, config=None):
+    '''Computes all the anchors for the boluses migrated in this run:
+uses the configuration snapshot, reads the boluses in the longer of the
+two intervals preceding start_time once, and writes all the anchor
+values with one UPDATE. Returns the dictionary of new anchor
+values. Oct 2026.'''
+    if pending.is_empty():
+        return {}
+    curs = dbi.cursor(conn)
+    if config is None:
+        config = load_configuration(conn, dest)
+    bolus_interval = config.get('bolus_interval_mins')
+    carb_interval = config.get('carb_interval_mins')
+    start_time = date_ui.to_datetime(start_time)
+    correction_past = start_time - timedelta(minutes=bolus_interval)
+    carb_past = start_time - timedelta(minutes=carb_interval)
+    curs.execute(f'''SELECT loop_summary_id, bolus_type, bolus_value, bolus_timestamp 
+                     FROM {dest}.loop_summary 
+                     WHERE bolus_type in ('carb', 'correction')
+                        AND bolus_value > 0 
+                        AND bolus_timestamp > %s 
+                        AND bolus_timestamp <= %s
+                     ORDER BY loop_summary_id''',
+                 [min(correction_past, carb_past), start_time])
+    anchors = anchor_values(curs.fetchall(), pending, correction_past, carb_past)
+    logging.info(f'{len(anchors)} anchors from {len(pending.carb_pairs)} carb boluses and {pending.corrections} corrections')
+    update_loop_summary_rows(conn, dest, ['anchor'],
+                             [ (id, (anchor,)) for (id, anchor) in anchors.items() ])
+    if commit:
+        conn.commit()
+    return anchors
+
+
 ## ================================================================
 
-def read_command_migration_minutes(conn, dest):
+def read_command_migration_minutes(conn, dest, config=None):
     '''Read the command_timeout_mins from the configuration variables and return that; 
-if none, use 40 minutes.'''
-    curs = dbi.cursor(conn)
-    curs.execute(f'''select command_timeout_mins from {dest}.configuration where user_id = %s''',
-                 [HUGH_USER_ID])
-    rows = curs.fetchall()
-    if len(rows) > 1:
-        raise Exception('multiple configurations; which do you want', rows)
-    if len(rows) == 0:
-        return 40
-    else:
-        return rows[0][0]
+if none, use 40 minutes. config is an optional ConfigSnapshot.'''
+    if config is None:
+        config = load_configuration(conn, dest)
+    return config.get('command_timeout_mins', 40)
 
 
 def migrate_all(conn, source, dest, alt_start_time=None, test=False):
@@ -1106,13 +1535,22 @@ Oct 13, 2023, rearranged the order to migrate commands first. Well,
         logging.debug(f'3. no data to migrate')
     else:
         logging.info(f'3. migrating data since {start_time_data}')
+        # one query for all the CGM matching, rather than one per bolus, carb, etc.
+        cgm_index = load_cgm_index(conn, dest, start_time_data)
+        # the anchors for all the new boluses are computed once, in 3d
+        pending = PendingAnchors()
+        config = load_configuration(conn, dest)
         logging.info(f'3a. migrating bolus since {start_time_data}')
-        migrate_boluses(conn, source, dest, start_time_data)
+        nbolus = migrate_boluses(conn, source, dest, start_time_data, cgm_index=cgm_index, anchors=pending)
+        logging.info(f'3a. {nbolus} new loop_summary rows for boluses')
         logging.info(f'3b. migrating temp basal since {start_time_data}')
-        migrate_temp_basal(conn, source, dest, HUGH_USER_ID, start_time_data)
+        migrate_temp_basal(conn, source, dest, HUGH_USER_ID, start_time_data, cgm_index=cgm_index)
         logging.info(f'3c. migrating carbs since {start_time_data}')
-        migrate_carbs(conn, source, dest, start_time_data)
+        ncarbs = migrate_carbs(conn, source, dest, start_time_data, cgm_index=cgm_index, anchors=pending)
+        logging.info(f'3c. {ncarbs} new loop_summary rows for carbs')
         logging.info(f'3d. identifying anchors since {start_time_data}')
+        compute_anchors(conn, dest, start_time_data, pending, config=config)
+        logging.info(f'CGM index: {len(cgm_index.rows)} readings, answered {cgm_index.lookups} matches, saving {max(0, cgm_index.lookups - 1)} queries')
     # last, store times for the next run
     if test or alt_start_time:
         logging.info('done, but test mode/alt start time, so not storing update time')
@@ -1204,6 +1642,8 @@ def set_data_migration(conn, source, dest, start):
                      SET prev_autoapp_update = %s, prev_autoapp_migration = %s
                     WHERE user_id = %s''',
                  [start, start, HUGH_USER_ID])
+    # starting over, so forget the temp basal checkpoint
+    set_temp_basal_checkpoint(conn, dest, HUGH_USER_ID, None)
     conn.commit()
 
 
@@ -1873,6 +2313,30 @@ def test_caseD():
 
 
 
+def configuration_queries_test():
+    '''Runs migrate_all over the scott databases, counting the queries
+of the configuration table, which it should read just once. Oct 2026.'''
+    from statement_counter import CountingConnection
+    start = date_ui.to_datetime('2023-05-01 12:00:00')
+    (insert, now, at, later) = create_testing_infrastructure(start)
+    conn = CountingConnection(dbi.connect())
+    test_clear_scott_db_and_start(conn)
+    dest = 'loop_logic_scott'
+    source = 'autoapp_scott'
+    set_data_migration(conn, source, dest, start)
+    USER = 7
+    init_cgm(conn, start)
+    for desc in [ ( ('at', 4), 'carbs', '*', (None, USER, 'now', 20, 'now'))
+                  ,( ('at', 34), 'carbs', '*', (None, USER, 'now', 10, 'now'))
+                 ]:
+        insert(conn, desc)
+    conn.reset()
+    migrate_all(conn, source, dest, now())
+    reads = conn.matching(f'from {dest}.configuration')
+    print(f'{reads} reads of configuration')
+    assert reads == 1
+    print('configuration_queries_test passed')
+
 def to_dictionary(dic_list):
     result = {}
     for d in dic_list:
@@ -1971,24 +2435,84 @@ def logfile_start_new(source):
         logging.info('================ first run of the day!!'+str(now))
     logging.info('running at {}'.format(datetime.now(), logfile))
 
+# ================================================================
+# Running the source/dest pairs concurrently
+
+'''Oct 2026. The cron job used to migrate autoapp to loop_logic and
+then autoapp_test to loop_logic_test, one after the other, so a slow
+run on the test databases delayed the next production run. Now each
+pair runs in its own process, with its own connection and its own log
+file (logfile_start can only configure logging once per process, so
+the test pair used to log into the production file). Each process
+logs its own latency, and also reports it to the parent.'''
+
+MIGRATION_PAIRS = [('autoapp', 'loop_logic'),
+                   ('autoapp_test', 'loop_logic_test')]
+
+def migrate_pair(source, dest, results=None):
+    '''Runs migrate_all for one source/dest pair, on its own
+connection. If results (a multiprocessing Queue) is given, puts
+(source, dest, seconds, status) on it.'''
+    start = time.time()
+    status = 'failed'
+    try:
+        conn = dbi.connect()
+        migrate_all(conn, source, dest)
+        status = 'success'
+    finally:
+        seconds = time.time() - start
+        logging.info(f'migration from {source} to {dest} took {seconds:.2f} seconds: {status}')
+        if results is not None:
+            results.put((source, dest, seconds, status))
+
+def migrate_pairs(pairs=MIGRATION_PAIRS):
+    '''Migrates each source/dest pair in its own process, and waits for
+them all. Returns a dictionary mapping each pair to its (seconds,
+status); a process that died without reporting has status 'crashed'.'''
+    results = multiprocessing.Queue()
+    procs = [ multiprocessing.Process(target=migrate_pair,
+                                      args=(source, dest, results),
+                                      name=f'{source}-{dest}')
+              for (source, dest) in pairs ]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join()
+    latencies = { pair: (None, 'crashed') for pair in pairs }
+    for pair in pairs:
+        try:
+            (source, dest, seconds, status) = results.get(timeout=1)
+        except queue.Empty:
+            break
+        latencies[(source, dest)] = (seconds, status)
+    return latencies
+
 if __name__ == '__main__': 
-    conn = dbi.connect()
     # we use this when we've cleared out the database and started again
     if len(sys.argv) > 1 and sys.argv[1] == 'migrate_cgm':
+        conn = dbi.connect()
         alt_start_time = sys.argv[2]
         debugging()
         migrate_cgm(conn, 'loop_logic', alt_start_time, True)
         migrate_cgm(conn, 'loop_logic_test', alt_start_time, True)
         # set_cgm_migration_time(conn, alt_start_time, alt_start_time)
         sys.exit()
+    if len(sys.argv) > 1 and sys.argv[1] == 'lag':
+        # python autoapp_to_loop_logic_inputs.py lag [days] [dest]
+        conn = dbi.connect()
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+        dest = sys.argv[3] if len(sys.argv) > 3 else 'loop_logic'
+        lag_report(conn, dest, days)
+        sys.exit()
     if len(sys.argv) > 1 and sys.argv[1] == 'all':
+        conn = dbi.connect()
         alt_start_time = sys.argv[2]
         print(f'test migrate_all starting at {alt_start_time}')
         debugging()
         migrate_all(conn, 'autoapp', 'loop_logic', alt_start_time, True)
         sys.exit()
-    migrate_all(conn, 'autoapp', 'loop_logic')
-    migrate_all(conn, 'autoapp_test', 'loop_logic_test')
+    # each pair gets its own process, connection and log file
+    migrate_pairs()
 
 '''
 SELECT loop_summary_id, 
@@ -0,0 +1,204 @@
+'''Pairs new boluses with carbs already in loop_summary, and new carbs
+with boluses already in loop_summary, in memory.
+
+The migration used to send a range query to loop_summary for each new
+event (carbs_within_interval_without_bolus and
+bolus_within_interval_without_carbs), and carb_timestamp has no index,
+so each of those was a scan. Now the migration reads all the unpaired
+rows for the window once, and this module does the pairing. There's no
+database code here, so it can be tested and benchmarked anywhere:
+
+    python bolus_carb_pairing.py
+    python bolus_carb_pairing.py 50000
+
+Events are tuples of (user_id, event_id, timestamp, value), like the
+rows of get_boluses and get_carbs. Candidates are tuples of
+(loop_summary_id, event_id, timestamp, value), like the rows of
+loop_summary that are waiting for a partner.
+
+The result is a list of writes, one per event, in event order:
+
+    ('insert', event)               # no partner; insert a new row
+    ('update', event, candidate)    # fill in the candidate's row
+
+The rules are the same as the old queries: an event pairs with the
+unpaired candidate whose timestamp is within the interval, inclusive,
+taking the largest value if there are several (and the latest
+loop_summary_id among equal values). Once paired, a candidate can't be
+paired again.
+
+Oct 2026
+'''
+
+import sys
+import time
+import random
+import bisect
+from datetime import datetime, timedelta
+
+# the same intervals as autoapp_to_loop_logic_inputs: carbs up to 20
+# minutes before a bolus or 5 minutes after it are its carbs
+CARBS_MINUTES_BEFORE_BOLUS = 20
+CARBS_MINUTES_AFTER_BOLUS = 5
+
+class IntervalIndex:
+    '''The candidates sorted by timestamp, so the ones in an interval
+can be found by bisection, plus the set of loop_summary_ids already
+claimed.'''
+
+    def __init__(self, candidates):
+        self.rows = sorted(candidates, key=lambda row: (row[2], row[0]))
+        self.times = [ row[2] for row in self.rows ]
+        self.claimed = set()
+
+    def within(self, start, end):
+        '''Returns the unclaimed candidates with start <= timestamp <= end.'''
+        lo = bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_right(self.times, end)
+        return [ row for row in self.rows[lo:hi] if row[0] not in self.claimed ]
+
+    def best(self, start, end):
+        '''Returns the unclaimed candidate in the interval with the
+largest value, breaking ties by the largest loop_summary_id, or None.'''
+        rows = self.within(start, end)
+        if len(rows) == 0:
+            return None
+        return max(rows, key=lambda row: (row[3], row[0]))
+
+    def claim(self, row):
+        self.claimed.add(row[0])
+
+def pair_events(events, candidates, mins_before, mins_after):
+    '''Returns the list of writes for the events, pairing each with the
+best unclaimed candidate from mins_before its timestamp to mins_after it.'''
+    index = IntervalIndex(candidates)
+    before = timedelta(minutes=mins_before)
+    after = timedelta(minutes=mins_after)
+    writes = []
+    for event in events:
+        when = event[2]
+        match = index.best(when - before, when + after)
+        if match is None:
+            writes.append(('insert', event))
+        else:
+            index.claim(match)
+            writes.append(('update', event, match))
+    return writes
+
+def pair_boluses(boluses, carb_rows,
+                 mins_before=CARBS_MINUTES_BEFORE_BOLUS,
+                 mins_after=CARBS_MINUTES_AFTER_BOLUS):
+    '''Pairs new boluses with loop_summary rows that have carbs but no bolus.'''
+    return pair_events(boluses, carb_rows, mins_before, mins_after)
+
+def pair_carbs(carbs, bolus_rows,
+               mins_before=CARBS_MINUTES_AFTER_BOLUS,
+               mins_after=CARBS_MINUTES_BEFORE_BOLUS):
+    '''Pairs new carbs with loop_summary rows that have a bolus but no
+carbs. The interval is the mirror image of the one for boluses.'''
+    return pair_events(carbs, bolus_rows, mins_before, mins_after)
+
+def pair_events_naive(events, candidates, mins_before, mins_after):
+    '''The same as pair_events, but scanning all the candidates for each
+event, the way the per-event queries did. For testing and benchmarks.'''
+    rows = sorted(candidates, key=lambda row: row[0])
+    claimed = set()
+    writes = []
+    for event in events:
+        start = event[2] - timedelta(minutes=mins_before)
+        end = event[2] + timedelta(minutes=mins_after)
+        matches = [ row for row in rows
+                    if row[0] not in claimed and start <= row[2] <= end ]
+        if len(matches) == 0:
+            writes.append(('insert', event))
+        else:
+            match = max(matches, key=lambda row: (row[3], row[0]))
+            claimed.add(match[0])
+            writes.append(('update', event, match))
+    return writes
+
+# ================================================================
+# tests and benchmarks
+
+T0 = datetime(2026, 10, 1, 12, 0)
+
+def at(mins):
+    return T0 + timedelta(minutes=mins)
+
+def pair_boluses_test():
+    carb_rows = [ (101, 1, at(-10), 30),
+                  (102, 2, at(-5), 50),
+                  (103, 3, at(60), 20) ]
+    boluses = [ (7, 11, at(0), 4.0),    # carbs 101 and 102; takes 102, the larger
+                (7, 12, at(1), 2.0),    # 102 is claimed, so takes 101
+                (7, 13, at(2), 1.0),    # nothing left
+                (7, 14, at(40), 3.0),   # 103 is 20 minutes after; too late
+                (7, 15, at(80), 3.0) ]  # 103 is 20 minutes before; just in time
+    writes = pair_boluses(boluses, carb_rows)
+    assert writes == [ ('update', boluses[0], carb_rows[1]),
+                       ('update', boluses[1], carb_rows[0]),
+                       ('insert', boluses[2]),
+                       ('insert', boluses[3]),
+                       ('update', boluses[4], carb_rows[2]) ], writes
+    print('pair_boluses_test passed')
+
+def pair_carbs_test():
+    bolus_rows = [ (201, 21, at(0), 2.0),
+                   (202, 22, at(3), 2.0) ]
+    carbs = [ (7, 31, at(-25), 40),   # bolus 25 minutes after; too late
+              (7, 32, at(-1), 40),    # both; tie on value, so the later id
+              (7, 33, at(4), 15) ]    # 201 is 4 minutes before
+    writes = pair_carbs(carbs, bolus_rows)
+    assert writes == [ ('insert', carbs[0]),
+                       ('update', carbs[1], bolus_rows[1]),
+                       ('update', carbs[2], bolus_rows[0]) ], writes
+    print('pair_carbs_test passed')
+
+def synthetic_events(n, seed=0, minutes=None, first_id=1):
+    '''Returns n events and n candidates scattered over the given
+number of minutes (default 5 per event, about as dense as real data
+on a busy day).'''
+    rand = random.Random(seed)
+    if minutes is None:
+        minutes = 5*n
+    events = sorted([ (7, first_id+i, at(rand.randrange(minutes)), rand.randrange(1, 10))
+                      for i in range(n) ],
+                    key=lambda e: e[2])
+    candidates = [ (first_id+n+i, first_id+2*n+i, at(rand.randrange(minutes)), rand.randrange(1, 100))
+                   for i in range(n) ]
+    return events, candidates
+
+def pairing_equivalence_test(n=2000):
+    '''The index has to give the same answers as the naive scan.'''
+    for seed in range(5):
+        events, candidates = synthetic_events(n, seed, minutes=n)
+        fast = pair_boluses(events, candidates)
+        slow = pair_events_naive(events, candidates,
+                                 CARBS_MINUTES_BEFORE_BOLUS, CARBS_MINUTES_AFTER_BOLUS)
+        assert fast == slow, seed
+    print('pairing_equivalence_test passed')
+
+def pairing_benchmark(n=10000, naive_limit=20000):
+    '''Times the index and, for up to naive_limit events, the naive
+scan, on n events and n candidates. The naive scan is quadratic, so
+it takes minutes beyond that.'''
+    events, candidates = synthetic_events(n)
+    start = time.time()
+    fast = pair_boluses(events, candidates)
+    indexed = time.time() - start
+    paired = len([ w for w in fast if w[0] == 'update' ])
+    if n > naive_limit:
+        print(f'{n} events, {paired} paired: index {indexed:.3f}s')
+        return
+    start = time.time()
+    slow = pair_events_naive(events, candidates,
+                             CARBS_MINUTES_BEFORE_BOLUS, CARBS_MINUTES_AFTER_BOLUS)
+    naive = time.time() - start
+    assert fast == slow
+    print(f'{n} events, {paired} paired: index {indexed:.3f}s, naive scan {naive:.3f}s')
+
+if __name__ == '__main__':
+    pair_boluses_test()
+    pair_carbs_test()
+    pairing_equivalence_test()
+    pairing_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -52,5 +52,9 @@ $python pull_data_from_diamon.py
 $python autoapp_to_ics2.py cron 
 
 # $python $repo/autoapp_to_loop_logic.py
-$python autoapp_to_loop_logic_inputs.py 
-$python loop_logic_testing_cgm_cron.py
+# Oct 2026. The CGM daemon (dexcom_cgm_sample.py daemon) also runs these
+# two as soon as it writes a reading, so they take the same lock. If
+# the daemon is running, the dexcom_cgm_sample.py above does nothing.
+lock=/home/hugh9/minerva-downstream.lock
+flock -w 50 $lock $python autoapp_to_loop_logic_inputs.py 
+flock -w 50 $lock $python loop_logic_testing_cgm_cron.py
@@ -42,10 +42,34 @@ I'll write T, N, and the result of the IF statement in the LOG
 Scott D. Anderson
 August 5, 2022
 
+Oct 2026. The session id is cached on disk (SESSION_FILE) with the
+time it was issued, and reused by later runs, so a normal run is just
+one request. We log in again only when Dexcom rejects the session. All
+requests go through one requests.Session, so the login and the fetch
+share a kept-alive connection. To run against a local fake server (see
+fake_dexcom_share.py), set DEXCOM_SHARE_URL, e.g.
+
+    DEXCOM_SHARE_URL=http://localhost:8765 python dexcom_cgm_sample.py
+
+Oct 2026. There's also a daemon mode, which keeps the session and the
+database connection open and polls just after each reading is due
+(the last WT plus five minutes) instead of once a minute from cron:
+
+    python dexcom_cgm_sample.py daemon
+
+After writing a new reading, it starts the downstream migration
+(DOWNSTREAM) right away. While the daemon runs, the cron job sees its
+lock and does nothing. Dexcom being unavailable raises ShareUnavailable
+instead of exiting, so the daemon can wait it out; the cron job still
+just logs it and exits.
+
 '''
 
 import sys
 import os
+import time
+import fcntl
+import subprocess
 from datetime import datetime, timedelta
 import date_ui
 import requests
@@ -58,10 +82,30 @@ import cs304dbi as dbi
 # Configuration Constants
 
 LOG_DIR = '/home/hugh9/dexcom_logs/'
-LOGIN_URL = 'https://share1.dexcom.com/ShareWebServices/Services/General/LoginPublisherAccountByName'
+SHARE_URL = os.environ.get('DEXCOM_SHARE_URL', 'https://share1.dexcom.com')
+LOGIN_URL = SHARE_URL+'/ShareWebServices/Services/General/LoginPublisherAccountByName'
 USER_AGENT_HEADER = 'Dexcom%20Share/3.0.2.11 CFNetwork/672.0.2 Darwin/14.0.0';
-CGM_URL = 'https://share1.dexcom.com/ShareWebServices/Services/Publisher/ReadPublisherLatestGlucoseValues'
+CGM_URL = SHARE_URL+'/ShareWebServices/Services/Publisher/ReadPublisherLatestGlucoseValues'
 CRED_FILE = '/home/hugh9/dexcom-credentials.json'
+# the cached session id and when it was issued. Not in the repo, like the credentials
+SESSION_FILE = '/home/hugh9/dexcom-session.json'
+# held by the daemon while it runs
+DAEMON_LOCK = '/home/hugh9/dexcom-daemon.lock'
+# held while the downstream migration runs; cronjobs.sh uses it too
+DOWNSTREAM_LOCK = '/home/hugh9/minerva-downstream.lock'
+# how long a notification waits for a cron run of the downstream
+# scripts to finish, in seconds; a run takes well under a minute
+DOWNSTREAM_WAIT = 60
+# what to run when the daemon writes a reading, in order
+DOWNSTREAM = ['autoapp_to_loop_logic_inputs.py', 'loop_logic_testing_cgm_cron.py']
+# the sensor takes a reading every five minutes, and Dexcom takes a few
+# seconds to publish it, so we poll a little after it's due, and poll
+# again every RETRY_SECONDS if it's late
+READING_INTERVAL = timedelta(minutes=5)
+POLL_DELAY = timedelta(seconds=15)
+RETRY_SECONDS = 30
+# a day of readings, which is the most that Share returns
+MAX_COUNT = 288
 # added this on 9/10/2022
 HUGH_USER_ID = 7          # the user_id value stored in realtime_cgm2
 HUGH_USER = 'Hugh'        # the username value stored in realtime_cgm2
@@ -120,13 +164,81 @@ def trim_quotes(x):
 
 session_cookies = None
 
+# one HTTP session for all requests, so they reuse a kept-alive connection
+http = requests.Session()
+
+def use_share_server(url):
+    '''Sends all requests to the given server instead of Dexcom's, e.g.
+http://localhost:8765 for fake_dexcom_share.'''
+    global SHARE_URL, LOGIN_URL, CGM_URL
+    SHARE_URL = url
+    LOGIN_URL = SHARE_URL+'/ShareWebServices/Services/General/LoginPublisherAccountByName'
+    CGM_URL = SHARE_URL+'/ShareWebServices/Services/Publisher/ReadPublisherLatestGlucoseValues'
+
+class ShareUnavailable(Exception):
+    '''Dexcom's server is down or overloaded; try again later.'''
+    pass
+
+class SessionRejected(Exception):
+    '''Dexcom says the session id is unknown or expired.'''
+    pass
+
+# the Code values Dexcom returns for a bad session id
+SESSION_ERROR_CODES = ['SessionIdNotFound', 'SessionNotValid']
+
+def session_rejected(resp):
+    '''True if the response is Dexcom rejecting our session id.'''
+    if resp.status_code != 500:
+        return False
+    try:
+        return resp.json().get('Code') in SESSION_ERROR_CODES
+    except ValueError:
+        return False
+
+def read_session(session_file=None):
+    '''Returns the cached session id, or None if there isn't one.'''
+    if session_file is None:
+        session_file = SESSION_FILE
+    try:
+        with open(session_file, 'r') as fin:
+            cached = json.load(fin)
+        logging.debug(f"using session issued at {cached.get('issued')}")
+        return cached['sessionId']
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+def write_session(session_id, session_file=None):
+    '''Caches the session id, with the time it was issued. The file is
+only readable by us, since the session id is as good as a password.'''
+    if session_file is None:
+        session_file = SESSION_FILE
+    tmp = session_file+'.tmp'
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fout:
+        json.dump({'sessionId': session_id, 'issued': datetime.now().isoformat()}, fout)
+    os.replace(tmp, session_file)
+
+def new_session(session_file=None):
+    '''Logs in, caches the new session id and returns it.'''
+    session_id = dexcom_login(read_credentials())
+    write_session(session_id, session_file)
+    logging.info('logged in to Dexcom; new session cached')
+    return session_id
+
+def get_session_id(session_file=None):
+    '''Returns the cached session id, logging in only if there isn't one.'''
+    session_id = read_session(session_file)
+    if session_id is None:
+        session_id = new_session(session_file)
+    return session_id
+
 def dexcom_login(creds):
     '''Returns sessionId which we use in requesting the CGM value'''
     global session_cookies
-    resp = requests.post(LOGIN_URL,
-                         data = json.dumps(creds),
-                         headers = {'User-Agent': USER_AGENT_HEADER,
-                                    'Content-Type': 'application/json'})
+    resp = http.post(LOGIN_URL,
+                     data = json.dumps(creds),
+                     headers = {'User-Agent': USER_AGENT_HEADER,
+                                'Content-Type': 'application/json'})
     if 'session' in dict(resp.cookies):
         logging.info('cookies were set!')
         session_cookies = resp.cookies
@@ -136,24 +248,24 @@ def dexcom_login(creds):
     # bug, so let's try to detect it and just log the fact
     if resp.status_code == 503:
         logging.info('Service Unavailable')
-        sys.exit()
+        raise ShareUnavailable('Service Unavailable')
     # similarly 502
     if resp.status_code == 502:
         logging.info('Bad Gateway')
-        sys.exit()
+        raise ShareUnavailable('Bad Gateway')
     # similarly 504
     if resp.status_code == 504:
         logging.info('Gateway Time-out')
-        sys.exit()
+        raise ShareUnavailable('Gateway Time-out')
     if resp.status_code == 500:
         logging.info('Internal Server error at Dexcom')
-        sys.exit()
+        raise ShareUnavailable('Internal Server error at Dexcom')
     if resp.status_code == 530:
         logging.info('??; please enable cookies')
-        sys.exit()
+        raise ShareUnavailable('??; please enable cookies')
     if resp.status_code == 409:
         logging.info('Conflict; please enable cookies')
-        sys.exit()
+        raise ShareUnavailable('Conflict; please enable cookies')
     raise Exception('Server Error',
                     [resp.status_code, resp.reason, html2text.html2text(resp.text)] )
 
@@ -186,32 +298,35 @@ def convert_to_datetime(dexcom_date_string):
 def dexcom_cgm_values_raw(session_id, max_count=1):
     '''Makes request to Dexcom and returns text of the response. Should
 look like JSON, list of dictionaries of length max_count.'''
-    resp = requests.get(CGM_URL,
-                        {'sessionId': session_id,
-                         # 24 hours of data. Might be excessive
-                         'minutes': 1440, 
-                         # MaxCount cannot be null
-                         'MaxCount': max_count
-                         })
+    resp = http.get(CGM_URL,
+                    params = {'sessionId': session_id,
+                              # 24 hours of data. Might be excessive
+                              'minutes': 1440, 
+                              # MaxCount cannot be null
+                              'MaxCount': max_count
+                              })
     if resp.ok:
         return resp.text
+    # Oct 2026. The cached session has expired; the caller logs in again
+    if session_rejected(resp):
+        raise SessionRejected(resp.text)
     # 6/22/2023 Sometimes the service isn't available. That's not a
     # bug, so let's try to detect it and just log the fact
     if resp.status_code == 503 and resp.reason == 'Service Unavailable':
         logging.info('Service Unavailable')
-        sys.exit()
+        raise ShareUnavailable('Service Unavailable')
     # similarly 504
     if resp.status_code == 504 and resp.reason == 'Gateway Time-out':
         logging.info('Gateway Time-out')
-        sys.exit()
+        raise ShareUnavailable('Gateway Time-out')
     # 7/11/2023 Sometimes we get an Internal Server Error
     if resp.status_code == 500:
         logging.info('Internal Server Error')
-        sys.exit()
+        raise ShareUnavailable('Internal Server Error')
     # 10/10/2023 Or a Bad Gateway.
     if resp.status_code == 502:
         logging.info('Bad Gateway')
-        sys.exit()
+        raise ShareUnavailable('Bad Gateway')
     # something else went wrong. Give it an id
     error_id = random.randint(1, 1000)
     logging.error(f'{error_id} bad CGM request or response. status_code: {resp.status_code} ')
@@ -242,15 +357,33 @@ values. Complains if there are errors. Returns JSON, list of dictionaries.'''
     logging.info('raw data: '+raw_data)
     return parse_cgm_values(raw_data)
 
+def fetch_cgm_values(max_count, session_file=None):
+    '''Like dexcom_cgm_values, but with the cached session, logging in
+again and retrying once if Dexcom rejects it.'''
+    session_id = get_session_id(session_file)
+    try:
+        return dexcom_cgm_values(session_id, max_count)
+    except SessionRejected:
+        logging.info('Dexcom rejected the cached session; logging in again')
+        session_id = new_session(session_file)
+        return dexcom_cgm_values(session_id, max_count)
+
 def log_file_name():
     today = datetime.today()
     day = today.day
     return os.path.join(LOG_DIR, 'day'+str(day))
 
-def write_cgm(conn, text_data, wt_time, rtime_now):
-    '''write a single CGM value (and trend) into the realtime_cgm2 table,
-might be an old value.'''
-    curs = dbi.cursor(conn)
+CGM_UPSERT = '''INSERT INTO realtime_cgm2(user_id, user, rtime, dexcom_time, mgdl, trend, trend_code) 
+                VALUES(%s,%s,%s,%s,%s,%s,%s)
+                ON DUPLICATE KEY UPDATE
+                   dexcom_time = values(dexcom_time),
+                   mgdl = values(mgdl),
+                   trend = values(trend),
+                   trend_code = values(trend_code)'''
+
+def cgm_row(text_data, wt_time, rtime_now):
+    '''Returns the values for CGM_UPSERT for one CGM value, complaining
+about anything missing or invalid.'''
     mgdl = text_data.get('Value')
     trend_code = text_data.get('Trend') # an ENUM 
     if mgdl is None:
@@ -262,75 +395,116 @@ might be an old value.'''
     if trend_num is None:
         logging.error('trend is invalid: {}'.format(trend_code))
     logging.debug('rtime {} WT {} value {}'.format(rtime_now,wt_time,mgdl))
-    nrows = curs.execute('''INSERT INTO realtime_cgm2(user_id, user, rtime, dexcom_time, mgdl, trend, trend_code) 
-                            VALUES(%s,%s,%s,%s,%s,%s,%s)
-                            ON DUPLICATE KEY UPDATE
-                               dexcom_time = values(dexcom_time),
-                               mgdl = values(mgdl),
-                               trend = values(trend),
-                               trend_code = values(trend_code)''',
-                         [HUGH_USER_ID, HUGH_USER, rtime_now, wt_time, mgdl, trend_num, trend_code ])
+    return [HUGH_USER_ID, HUGH_USER, rtime_now, wt_time, mgdl, trend_num, trend_code ]
+
+def reading_rtime(wt_time):
+    '''Returns the rtime a reading is stored in: the one after its WT,
+rounding UP. get_cgm, replace_missing_data and the daemon all use this,
+so a reading's row doesn't depend on which of them stored it or when.'''
+    return date_ui.to_rtime(wt_time) + READING_INTERVAL
+
+def write_cgm(conn, text_data, wt_time, rtime_now):
+    '''write a single CGM value (and trend) into the realtime_cgm2 table,
+might be an old value.'''
+    curs = dbi.cursor(conn)
+    nrows = curs.execute(CGM_UPSERT, cgm_row(text_data, wt_time, rtime_now))
     conn.commit()
     return nrows
     
 def write_no_data(conn, rtime_now):
-    '''write a NoData event into the realtime_cgm2 table.'''
+    '''write a NoData event into the realtime_cgm2 table. Oct 2026: if
+the row is already there, it's left alone, since it may have a reading
+(e.g. from the daemon) that we mustn't replace with NULL.'''
     curs = dbi.cursor(conn)
     curs.execute('''INSERT INTO realtime_cgm2(user_id, user, rtime, mgdl, trend, trend_code) 
                     VALUES(%s,%s,%s,%s,%s,%s)
-                    ON DUPLICATE KEY UPDATE mgdl = NULL, trend = NULL, trend_code = NULL''',
+                    ON DUPLICATE KEY UPDATE rtime = rtime''',
                  [HUGH_USER_ID, HUGH_USER, rtime_now, None, None, None])
     conn.commit()
     
   
 
+def stored_cgm(conn, start_rtime, end_rtime):
+    '''Returns a dictionary from rtime to (dexcom_time, mgdl) of what's
+in realtime_cgm2 from start_rtime to end_rtime, inclusive.'''
+    curs = dbi.cursor(conn)
+    curs.execute('''SELECT rtime, dexcom_time, mgdl FROM realtime_cgm2
+                    WHERE user_id = %s AND rtime BETWEEN %s AND %s''',
+                 [HUGH_USER_ID, start_rtime, end_rtime])
+    return { rtime: (dexcom_time, mgdl) for rtime, dexcom_time, mgdl in curs.fetchall() }
+
 def replace_missing_data(conn, cgm_values):
+    '''Writes the CGM values, each in the rtime after its WT. Oct 2026:
+instead of a write and a commit per value, this reads what's already
+stored for the whole span in one query, leaves out the values that
+are already there, and writes the rest with one multi-row upsert and
+one commit. Returns the number of values written.'''
     # Let's try to update with the new data.
     # I'm going to convert each dexcom timestamp to an rtime,
     # rounding UP and use that for replacing missing values.
+    rows = []
     for d in cgm_values:
         wt = d['WT']
-        rt = date_ui.to_rtime(wt) + timedelta(minutes=5)
+        rt = reading_rtime(wt)
         logging.debug('old data RT: {} WT: {}'.format(str(wt),str(rt)))
-        nrows = write_cgm(conn, d, wt, rt)
-        if nrows != 2:
-            logging.error("update with new data didn't yield 2 modified rows: nrows = {} wt = {} rtime = {}".format(nrows, wt, rt))
-
-def get_cgm():
+        rows.append(cgm_row(d, wt, rt))
+    if len(rows) == 0:
+        return 0
+    stored = stored_cgm(conn, min(row[2] for row in rows), max(row[2] for row in rows))
+    rows = [ row for row in rows if stored.get(row[2]) != (row[3], row[4]) ]
+    logging.info(f'{len(rows)} of {len(cgm_values)} values are not yet stored')
+    if len(rows) > 0:
+        curs = dbi.cursor(conn)
+        # pymysql sends this as one multi-row INSERT
+        curs.executemany(CGM_UPSERT, rows)
+        conn.commit()
+    return len(rows)
+
+def get_cgm(conn=None, now=None):
     '''This puts all the pieces together. There are basically 4 scenarios: 
 1. up to date, get 1 record and store it,
 2. up to date, but the record is a repeat, so record NoData
 3. need to catch up, get N records and store them.
-4. need to catch up, but still getting old data, so record NoData'''
-    now = datetime.today()
+4. need to catch up, but still getting old data, so record NoData
+
+Oct 2026. The connection and the time can be supplied, for testing.
+Each reading is stored in its reading_rtime, as the daemon does. The
+daemon may have stored the latest reading in rtime_now (or even the
+next rtime) already, which counts as up to date, not as a gap.'''
+    if now is None:
+        now = datetime.today()
     rtime_now = date_ui.to_rtime(now)
     rtime_prev = rtime_now - timedelta(minutes=5)
-    conn = dbi.connect()
+    if conn is None:
+        conn = dbi.connect()
     stored_rtime, stored_dexcom_time = get_latest_stored_data(conn)
     logging.debug('stored times {} and {}'.format(stored_rtime, stored_dexcom_time))
-    creds = read_credentials()
-    session_id = dexcom_login(creds)
     cgm_values = None           # will be our return value
-    if stored_rtime == rtime_prev:
+    if stored_rtime >= rtime_prev:
         logging.info('Normal case: all up to date, so just get one data value')
-        cgm_values = dexcom_cgm_values(session_id, 1)
+        cgm_values = fetch_cgm_values(1)
         cgm = cgm_values[0]
         logging.debug('cgm values: '+str(cgm))
         wt_time = cgm['WT']
         # check for NoData
-        if wt_time == stored_dexcom_time:
+        if wt_time == stored_dexcom_time and stored_rtime >= rtime_now:
+            logging.info('CASE2 nothing new, but rtime_now is already filled')
+        elif wt_time == stored_dexcom_time:
             logging.info('CASE2 no data')
             write_no_data(conn, rtime_now)
         else:
             logging.info('CASE1 normal update, one row')
-            write_cgm(conn, cgm, wt_time, rtime_now)
+            write_cgm(conn, cgm, wt_time, reading_rtime(wt_time))
     else:
         logging.info('latest value is > 5 minutes old; we need to catch up')
         # NOT up to date, so get several data values, hoping to fill in missing values
         time_diff = rtime_now - stored_rtime
-        count = time_diff.seconds // (60*5)
+        # Oct 2026. total_seconds, since seconds ignores whole days.
+        # Share returns at most MAX_COUNT, so ask for the whole span
+        # in one request
+        count = min(int(time_diff.total_seconds()) // (60*5), MAX_COUNT-1)
         # add one, just to be sure
-        cgm_values = dexcom_cgm_values(session_id, count+1)
+        cgm_values = fetch_cgm_values(count+1)
         logging.debug('requested {} values, got {} values'.format(count, len(cgm_values)))
         # so many things could go wrong. Are they all different
         # timestamp values? We might *still* be in a NoData situation.
@@ -349,10 +523,95 @@ def get_cgm():
     return cgm_values
 
 def get_data(count):
-    creds = read_credentials()
-    session_id = dexcom_login(creds)
-    cgm_values = dexcom_cgm_values(session_id, count)
-    return cgm_values
+    return fetch_cgm_values(count)
+
+# ================================================================
+# daemon mode, Oct 2026
+
+def next_poll_time(last_wt, now):
+    '''Returns when to poll next: just after the reading after last_wt
+is due, or in RETRY_SECONDS if it's already overdue.'''
+    due = last_wt + READING_INTERVAL + POLL_DELAY
+    if due <= now:
+        due = now + timedelta(seconds=RETRY_SECONDS)
+    return due
+
+def next_poll_time_test():
+    t = datetime(2026, 10, 18, 12, 3, 20)    # a reading at 12:03:20
+    # the next reading is due at 12:08:20
+    assert next_poll_time(t, datetime(2026, 10, 18, 12, 3, 40)) == datetime(2026, 10, 18, 12, 8, 35)
+    # it's late, so try again soon
+    assert next_poll_time(t, datetime(2026, 10, 18, 12, 9)) == datetime(2026, 10, 18, 12, 9, 30)
+    print('next_poll_time_test passed')
+
+def daemon_poll(conn, last_wt, now):
+    '''One poll of the daemon. Gets the readings since last_wt and
+writes each in the rtime after its WT, as replace_missing_data does,
+so a reading's row doesn't depend on when we polled. If there's
+nothing new and the rtime for the next reading has come and gone, that
+rtime gets NoData, as in get_cgm. Returns the new readings, newest first.'''
+    missed = int((now - last_wt) / READING_INTERVAL)
+    cgm_values = fetch_cgm_values(min(max(1, missed), MAX_COUNT))
+    new_values = [ d for d in cgm_values if d['WT'] > last_wt ]
+    replace_missing_data(conn, new_values)
+    if len(new_values) == 0 and date_ui.to_rtime(now) > reading_rtime(last_wt):
+        logging.info('reading is overdue; write null')
+        write_no_data(conn, date_ui.to_rtime(now))
+    return new_values
+
+def notify_downstream(cgm_values=None):
+    '''Starts the DOWNSTREAM scripts, in the background, one after the
+other. If the cron job is running one already, that run may have
+started before our write, so we wait for it to finish (up to
+DOWNSTREAM_WAIT seconds) and then run it again.'''
+    repo = os.path.dirname(os.path.abspath(__file__))
+    commands = [ f'flock -w {DOWNSTREAM_WAIT} {DOWNSTREAM_LOCK} {sys.executable} {script}'
+                 for script in DOWNSTREAM ]
+    subprocess.Popen(['sh', '-c', '; '.join(commands)], cwd=repo)
+
+def hold_lock(lockfile):
+    '''Returns the open lockfile if we got the lock, otherwise None. The
+lock lasts as long as the file is open.'''
+    fd = open(lockfile, 'w')
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return fd
+    except BlockingIOError:
+        fd.close()
+        return None
+
+def run_daemon(conn=None, notify=notify_downstream, clock=datetime.now, sleep=time.sleep, polls=None):
+    '''Polls Dexcom just after each reading is due, forever, or for the
+given number of polls. Calls notify with the values after writing a new
+reading. The clock and sleep functions can be replaced to run the
+daemon against simulated time. Returns the number of polls.'''
+    if conn is None:
+        conn = dbi.connect()
+    stored_rtime, last_wt = get_latest_stored_data(conn)
+    next_poll = next_poll_time(last_wt, clock())
+    count = 0
+    while polls is None or count < polls:
+        wait = (next_poll - clock()).total_seconds()
+        if wait > 0:
+            sleep(wait)
+        now = clock()
+        count += 1
+        new_values = []
+        try:
+            conn.ping(reconnect=True)
+            new_values = daemon_poll(conn, last_wt, now)
+        except ShareUnavailable as err:
+            logging.info(f'Dexcom unavailable: {err}')
+        except Exception:
+            logging.exception('poll failed')
+        if len(new_values) > 0:
+            last_wt = new_values[0]['WT']
+            logging.info(f'{len(new_values)} new readings, the latest {last_wt}')
+            if notify is not None:
+                notify(new_values)
+        next_poll = next_poll_time(last_wt, clock())
+        logging.debug(f'next poll at {next_poll}')
+    return count
 
 
 def test1():
@@ -413,6 +672,17 @@ def test3():
 
 
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'daemon':
+        logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s',
+                            datefmt='%m-%d %H:%M:%S',
+                            filename=os.path.join(LOG_DIR, 'daemon'),
+                            level=logging.INFO)
+        lock = hold_lock(DAEMON_LOCK)
+        if lock is None:
+            print('the daemon is already running')
+            sys.exit()
+        run_daemon()
+        sys.exit()
     # when run as a script, log to a logfile 
     today = datetime.today()
     logfile = os.path.join(LOG_DIR, 'day'+str(today.day))
@@ -420,4 +690,12 @@ if __name__ == '__main__':
                         datefmt='%H:%M',
                         filename=logfile,
                         level=logging.DEBUG)
-    get_cgm()
+    lock = hold_lock(DAEMON_LOCK)
+    if lock is None:
+        logging.info('the daemon is running, so the cron job does nothing')
+        sys.exit()
+    try:
+        get_cgm()
+    except ShareUnavailable:
+        # already logged
+        pass
@@ -77,73 +77,32 @@ def compute_dynamic_carbs_batch(conn, rtime = None):
     If rtime is given, computes the dynamic carbs for all records beginning at that rtime.
     In either case, if carb records are or data is missing in the database, we assume 0 carbs were given at that time.
     Runtime for all records in the database as of 12/19/22 = 3025 seconds = 50 minutes.
+    Oct 2026: now delegates to autoapp_to_ics2.recompute_dynamic_carbs, which splits the carbs
+    into one array per action curve, convolves each one, and bulk-writes the results. Meals
+    before rtime are now included, so the first rows after rtime are correct.
+    Returns the number of records computed and the records/second.
     """
-    
+    # imported here, since autoapp_to_ics2 connects to the database when imported
+    import autoapp_to_ics2
+
     # Get action_curves
     action_curves, _ = cache_action_curves(conn)
     carb_action_curves = {key: action_curves[key] for key in action_curves if key != 'insulin'}
-    
+
     curs = dbi.dict_cursor(conn)
-    # Gets ALL records in the database
-    if rtime is None: 
-        # Get the latest time from the database
-        curs.execute('''select max(rtime) as currentTime from insulin_carb_smoothed_2;''')
-        rtime = curs.fetchone()['currentTime']
-        curs.execute('''select rtime,
-                        timestampdiff(MINUTE,%s,rtime) as delta,
-                            coalesce(bg, cgm) as abg,
-                            carb_code,
-                            if(carbs is null, 0, carbs) as carbs,
-                            rescue_carbs
-                        from insulin_carb_smoothed_2''', [rtime])
-    # Gets records after the given time            
-    else: 
-        rtime = date_ui.to_datetime(rtime)
-        rtime = date_ui.to_rtime(rtime)
-        curs.execute('''select rtime,
-                        timestampdiff(MINUTE,%s,rtime) as delta,
-                            coalesce(bg, cgm) as abg,
-                            carb_code,
-                            if(carbs is null, 0, carbs) as carbs,
-                            rescue_carbs
-                        from insulin_carb_smoothed_2
-                        where rtime >= %s''', [rtime, rtime])
-    
-    past_inputs = curs.fetchall()
+    curs.execute('''select min(rtime) as firstTime, max(rtime) as currentTime
+                    from insulin_carb_smoothed_2;''')
+    row = curs.fetchone()
+    if rtime is None:
+        rtime = row['firstTime']
+    rtime = date_ui.to_rtime(date_ui.to_datetime(rtime))
+    end_time = row['currentTime'] + timedelta(minutes=5)
     print("rtime", rtime)
-    print('num past inputs', len(past_inputs))
-
-    # Add carb information in wide format to past_inputs
-    # (e.g. we represent {carb_code: “rescue”, carbs:16} as {“rescue”: 16, “brunch”:0, ..., “dinner”: 0})
-    all_carb_codes = [dct['carb_code'] for dct in past_inputs]
-    dummy_carb_encoding = pd.get_dummies(all_carb_codes)
-    # Note: The loop below is slow and should ideally be optimized
-    count = 0
-    for i in range(len(past_inputs)):
-        # add the dummy encoding to each row in past_inputs
-        row = past_inputs[i]
-        row.update(dummy_carb_encoding.iloc[i] * row['carbs'])
-        if (count%100000 == 0): 
-            print(f"Rows updated so far: {count}")
-        count+=1
-        
-    # Carb_codes present in past_inputs
-    carb_codes = set([code for code in all_carb_codes if code is not None])
-    print('unique carb_codes', carb_codes)
-
-    # Compute dynamic carbs for each record in past_inputs
-    for i in range(len(past_inputs)):
-        row = past_inputs[i]
-        # Compute dynamic carbs
-        dynamic_carbs = 0
-        for code in carb_codes:
-            dynamic_carbs += convolve(past_inputs, i, code, action_curves[carb_code_mapping(code)])
-        # Update database with the result of the dynamic carb computation
-        curs.execute(f'''INSERT INTO {TABLE}(rtime, dynamic_carbs)
-                        VALUES(%s, %s)
-                        ON DUPLICATE KEY UPDATE
-                        dynamic_carbs=%s''',[row['rtime'], dynamic_carbs, dynamic_carbs])
-        print(row['rtime'], row['carbs'], row['carb_code'], dynamic_carbs)
+    nrows, rate = autoapp_to_ics2.recompute_dynamic_carbs(conn, rtime, end_time,
+                                                          curves=carb_action_curves,
+                                                          curve_of=carb_code_mapping)
+    print(f'computed dynamic carbs for {nrows} records at {rate:.0f} records/second')
+    return nrows, rate
 
 if __name__ == '__main__':
     t_start = time.time()
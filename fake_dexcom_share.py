@@ -0,0 +1,605 @@
+'''A fake Dexcom Share server, for testing and benchmarking
+dexcom_cgm_sample without Dexcom's servers or Hugh's credentials.
+
+It answers the two requests we make: the login, which returns a
+quoted session id, and ReadPublisherLatestGlucoseValues, which returns
+made-up readings every five minutes, newest first, in Dexcom's format:
+
+    [{"WT":"Date(1659091309000)","ST":"Date(1659091309000)",
+      "DT":"Date(1659091309000-0400)","Value":123,"Trend":"Flat"}]
+
+Sessions can be made to expire after some number of fetches, in which
+case the fetch gets a 500 with {"Code":"SessionIdNotFound"}, the way
+Dexcom does. The server counts logins, fetches and TCP connections, so
+we can see whether connections are being reused.
+
+To benchmark the old way (log in and fetch on fresh connections every
+run) against the new way (the cached session on one connection):
+
+    python fake_dexcom_share.py
+    python fake_dexcom_share.py 200       # number of runs
+
+It's plain http on localhost, so the cost of the TLS handshakes that
+a reused connection saves with the real server isn't in these numbers.
+
+The server's clock can be simulated (see SimulatedClock), so that
+daemon_test can run the dexcom_cgm_sample daemon over hours of
+readings in a second or two.
+
+The server can also add latency to every response, answer with an
+error status during some windows of time, leave out readings (gaps,
+where the sensor had nothing) and hold back readings (outages, where
+the phone couldn't upload, and the readings all show up at the end).
+Instead of made-up readings, it can replay a recording of real ones:
+
+    python fake_dexcom_share.py record day.json     # needs the real credentials
+
+To run get_cgm every five simulated minutes over some days, with the
+windows in SCRIPT, and report the latency of each call and its
+statements and writes to the database (a scratch realtime_cgm2 in
+TEST_DB):
+
+    python fake_dexcom_share.py bench 3
+    python fake_dexcom_share.py bench 3 day.json
+
+Oct 2026
+'''
+
+import sys
+import os
+import json
+import time
+import uuid
+import bisect
+import tempfile
+import threading
+import collections
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from statement_counter import nearest_rank
+
+LOGIN_PATH = '/ShareWebServices/Services/General/LoginPublisherAccountByName'
+CGM_PATH = '/ShareWebServices/Services/Publisher/ReadPublisherLatestGlucoseValues'
+
+TRENDS = ['Flat', 'FortyFiveUp', 'FortyFiveDown', 'SingleUp', 'SingleDown']
+
+def dexcom_date(when, tz=''):
+    '''Returns the Dexcom string for a datetime, e.g. Date(1659091309000)'''
+    return 'Date({}{})'.format(int(when.timestamp())*1000, tz)
+
+def parse_dexcom_date(date_string):
+    '''The inverse of dexcom_date, ignoring the time zone.'''
+    epoch = date_string[len('Date('):-1].split('-')[0]
+    return datetime.fromtimestamp(int(epoch)//1000)
+
+def reading(when, value=None, trend=None):
+    '''Returns a reading for the given time. Unless they're given, the
+value and trend are made up, but they depend only on the time, so
+repeated requests agree.'''
+    minute = int(when.timestamp())//60
+    if value is None:
+        value = 100 + (minute*7) % 120
+    if trend is None:
+        trend = TRENDS[(minute//5) % len(TRENDS)]
+    return {'WT': dexcom_date(when),
+            'ST': dexcom_date(when),
+            'DT': dexcom_date(when, '-0400'),
+            'Value': value,
+            'Trend': trend}
+
+class Recording:
+    '''Readings recorded from the real server (see record), replayed
+over and over, shifted so that the first one is at start.'''
+
+    def __init__(self, filename, start):
+        with open(filename, 'r') as fin:
+            raw = json.load(fin)
+        rows = sorted([ (parse_dexcom_date(d['WT']), d['Value'], d['Trend']) for d in raw ],
+                      key=lambda row: row[0])
+        first = rows[0][0]
+        self.offsets = [ row[0] - first for row in rows ]
+        self.values = [ (row[1], row[2]) for row in rows ]
+        self.period = self.offsets[-1] + timedelta(minutes=5)
+        self.start = start
+
+    def readings_back(self, when):
+        '''Yields (time, (value, trend)) for the readings at or before
+when, newest first, forever.'''
+        k, rem = divmod(when - self.start, self.period)
+        i = bisect.bisect_right(self.offsets, rem) - 1
+        while True:
+            if i < 0:
+                k -= 1
+                i = len(self.offsets) - 1
+            yield self.start + k*self.period + self.offsets[i], self.values[i]
+            i -= 1
+
+class SimulatedClock:
+    '''A clock that only moves when something sleeps. Pass its now and
+sleep methods to FakeShare and run_daemon.'''
+
+    def __init__(self, start):
+        self.time = start
+
+    def now(self):
+        return self.time
+
+    def sleep(self, secs):
+        self.time += timedelta(seconds=secs)
+
+class FakeShare:
+    '''The state of the fake server: its sessions and its counters.
+Readings are every five minutes, the latest at or before now(), at
+phase seconds past each five minute mark, unless there's a recording.
+
+The gaps and outages are lists of (start, end) datetimes, and errors
+is a list of (start, end, status). Latency is in real seconds.'''
+
+    def __init__(self, session_fetches=None, clock=datetime.now, phase=0,
+                 latency=0, gaps=[], outages=[], errors=[], recording=None):
+        # a session expires after this many fetches; None means never
+        self.session_fetches = session_fetches
+        self.clock = clock
+        self.phase = timedelta(seconds=phase)
+        self.latency = latency
+        self.gaps = gaps
+        self.outages = outages
+        self.errors = errors
+        self.recording = recording
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.reset_counts()
+
+    def reset_counts(self):
+        self.logins = 0
+        self.fetches = 0
+        self.rejected = 0
+        self.failed = 0
+        self.connections = 0
+
+    def now(self):
+        return self.clock()
+
+    def latest_reading_time(self):
+        now = self.now() - self.phase
+        now = now.replace(second=0, microsecond=0)
+        return now - timedelta(minutes=now.minute % 5) + self.phase
+
+    def readings_back(self, when):
+        '''Yields (time, values) for the readings at or before when,
+newest first, where values are the arguments to reading after the time.'''
+        if self.recording is not None:
+            yield from self.recording.readings_back(when)
+            return
+        latest = self.latest_reading_time()
+        while latest > when:
+            latest -= timedelta(minutes=5)
+        while True:
+            yield latest, ()
+            latest -= timedelta(minutes=5)
+
+    def visible_readings(self, minutes, max_count):
+        '''Returns the readings the server has now, newest first, leaving
+out the gaps and anything after the start of a current outage.'''
+        now = self.now()
+        until = now
+        for start, end in self.outages:
+            if start <= now < end:
+                until = min(until, start)
+        oldest = now - timedelta(minutes=minutes)
+        values = []
+        for when, vals in self.readings_back(until):
+            if when < oldest or len(values) >= max_count:
+                break
+            if any(start <= when < end for start, end in self.gaps):
+                continue
+            values.append(reading(when, *vals))
+        return values
+
+    def error_status(self):
+        '''Returns the status for an error window we're in, or None.'''
+        now = self.now()
+        for start, end, status in self.errors:
+            if start <= now < end:
+                with self.lock:
+                    self.failed += 1
+                return status
+        return None
+
+    def login(self):
+        with self.lock:
+            self.logins += 1
+            session_id = str(uuid.uuid4())
+            self.sessions[session_id] = 0
+            return session_id
+
+    def readings(self, session_id, minutes, max_count):
+        '''Returns the list of readings, or None if the session is bad.'''
+        with self.lock:
+            self.fetches += 1
+            if session_id not in self.sessions:
+                self.rejected += 1
+                return None
+            self.sessions[session_id] += 1
+            if (self.session_fetches is not None and
+                self.sessions[session_id] > self.session_fetches):
+                del self.sessions[session_id]
+                self.rejected += 1
+                return None
+        return self.visible_readings(minutes, max_count)
+
+class Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1, with a Content-Length on every response, so clients can
+    # keep the connection open
+    protocol_version = 'HTTP/1.1'
+    # otherwise the body waits for the ack of the headers, adding 40ms
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.share.lock:
+            self.server.share.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_page(self, status):
+        body = f'<html><body><h1>{status}</h1></body></html>'.encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def failing(self):
+        '''Waits for the latency, then sends the error page and returns
+True if we're in an error window.'''
+        share = self.server.share
+        if share.latency > 0:
+            time.sleep(share.latency)
+        status = share.error_status()
+        if status is None:
+            return False
+        self.send_error_page(status)
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.rfile.read(length)
+        if self.failing():
+            return
+        if urlparse(self.path).path != LOGIN_PATH:
+            return self.send_json(404, {'Code': 'NotFound'})
+        self.send_json(200, self.server.share.login())
+
+    def do_GET(self):
+        if self.failing():
+            return
+        url = urlparse(self.path)
+        if url.path != CGM_PATH:
+            return self.send_json(404, {'Code': 'NotFound'})
+        params = { key.lower(): vals[0] for key, vals in parse_qs(url.query).items() }
+        values = self.server.share.readings(params.get('sessionid'),
+                                            int(params.get('minutes', 1440)),
+                                            int(params.get('maxcount', 1)))
+        if values is None:
+            return self.send_json(500, {'Code': 'SessionIdNotFound',
+                                        'Message': 'Session ID not found'})
+        self.send_json(200, values)
+
+def start_server(share=None, port=0):
+    '''Starts the fake server in a daemon thread and returns it. The
+url is server.url, and the state is server.share.'''
+    server = ThreadingHTTPServer(('localhost', port), Handler)
+    server.daemon_threads = True
+    server.share = share if share is not None else FakeShare()
+    server.url = 'http://localhost:{}'.format(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ================================================================
+# tests and benchmarks. These need dexcom_cgm_sample, which needs
+# requests and html2text. Only daemon_test needs the database.
+
+FAKE_CREDENTIALS = {'accountName': 'hugh', 'applicationId': 'fake', 'password': 'fake'}
+
+def fake_client(server, session_file):
+    '''Points dexcom_cgm_sample at the server, with fake credentials,
+caching its session in session_file.'''
+    import dexcom_cgm_sample as dex
+    dex.use_share_server(server.url)
+    dex.read_credentials = lambda credfile=None: FAKE_CREDENTIALS
+    dex.SESSION_FILE = session_file
+    return dex
+
+def old_run(dex, max_count=1):
+    '''What every run used to do: log in, then fetch, each with a fresh
+connection, since requests.post and requests.get don't share one.'''
+    import requests
+    resp = requests.post(dex.LOGIN_URL, data=json.dumps(FAKE_CREDENTIALS),
+                         headers={'User-Agent': dex.USER_AGENT_HEADER,
+                                  'Content-Type': 'application/json'})
+    session_id = dex.trim_quotes(resp.text)
+    resp = requests.get(dex.CGM_URL, params={'sessionId': session_id,
+                                             'minutes': 1440,
+                                             'MaxCount': max_count})
+    return dex.parse_cgm_values(resp.text)
+
+def session_reuse_test():
+    '''The session is cached and reused, and a rejected session leads
+to exactly one new login.'''
+    server = start_server(FakeShare(session_fetches=3))
+    with tempfile.TemporaryDirectory() as tmp:
+        session_file = os.path.join(tmp, 'session.json')
+        dex = fake_client(server, session_file)
+        for i in range(3):
+            values = dex.fetch_cgm_values(2, session_file)
+            assert len(values) == 2 and values[0]['WT'] > values[1]['WT'], values
+        assert server.share.logins == 1, server.share.logins
+        # the fourth fetch is rejected, so we log in again and retry
+        dex.fetch_cgm_values(1, session_file)
+        assert server.share.logins == 2, server.share.logins
+        assert server.share.rejected == 1, server.share.rejected
+        assert os.stat(session_file).st_mode & 0o077 == 0
+        # all of that on one connection
+        assert server.share.connections == 1, server.share.connections
+    server.shutdown()
+    print('session_reuse_test passed')
+
+def session_benchmark(runs=100):
+    '''Times runs of the old way and the new way against the fake
+server, and reports ms per run, logins and connections.'''
+    server = start_server()
+    share = server.share
+    with tempfile.TemporaryDirectory() as tmp:
+        session_file = os.path.join(tmp, 'session.json')
+        dex = fake_client(server, session_file)
+        share.reset_counts()
+        start = time.time()
+        for i in range(runs):
+            old_run(dex)
+        old = time.time() - start
+        old_counts = (share.logins, share.connections)
+        # each cron run is a new process, with a new requests.Session
+        share.reset_counts()
+        start = time.time()
+        for i in range(runs):
+            dex.http = dex.requests.Session()
+            dex.fetch_cgm_values(1, session_file)
+        new = time.time() - start
+        new_counts = (share.logins, share.connections)
+    server.shutdown()
+    print(f'{runs} runs')
+    print(f'old (login every run): {old/runs*1000:.2f} ms/run, '
+          f'{old_counts[0]} logins, {old_counts[1]} connections')
+    print(f'new (cached session):  {new/runs*1000:.2f} ms/run, '
+          f'{new_counts[0]} logins, {new_counts[1]} connections')
+
+# where daemon_test puts its realtime_cgm2, so the real one is untouched
+TEST_DB = 'loop_logic_scott'
+
+def daemon_test(hours=2, phase=200):
+    '''Runs the daemon for some hours of simulated time, against the
+fake server and a scratch realtime_cgm2 in TEST_DB, and checks that it
+wrote every reading, one poll each, within seconds of the reading.'''
+    import cs304dbi as dbi
+    import date_ui
+    clock = SimulatedClock(datetime(2026, 10, 18, 12, 0))
+    server = start_server(FakeShare(clock=clock.now, phase=phase))
+    with tempfile.TemporaryDirectory() as tmp:
+        dex = fake_client(server, os.path.join(tmp, 'session.json'))
+        conn = dbi.connect()
+        conn.select_db(TEST_DB)
+        curs = dbi.cursor(conn)
+        curs.execute('create table if not exists realtime_cgm2 like janice.realtime_cgm2')
+        curs.execute('delete from realtime_cgm2 where user_id = %s', [dex.HUGH_USER_ID])
+        # say we have everything up to the reading before the start
+        first = server.share.latest_reading_time()
+        dex.write_cgm(conn, reading(first), first, date_ui.to_rtime(first) + timedelta(minutes=5))
+        lags = []
+        def notify(cgm_values):
+            lags.append((clock.now() - cgm_values[0]['WT']).total_seconds())
+        polls = hours*12
+        dex.run_daemon(conn, notify=notify, clock=clock.now, sleep=clock.sleep, polls=polls)
+        curs.execute('select count(*), count(mgdl) from realtime_cgm2 where user_id = %s',
+                     [dex.HUGH_USER_ID])
+        rows, readings = curs.fetchone()
+    server.shutdown()
+    assert len(lags) == polls, (len(lags), polls)
+    assert rows == readings == polls+1, (rows, readings)
+    assert server.share.logins == 1 and server.share.connections == 1
+    print(f'daemon_test passed: {polls} polls, sensor to database at most {max(lags):.0f} seconds')
+
+def catch_up_test(hours=4, phase=200):
+    '''After an outage of some hours, get_cgm catches up with one
+request to Share, one query of realtime_cgm2, one multi-row upsert and
+one commit. Uses a scratch realtime_cgm2 in TEST_DB.'''
+    import cs304dbi as dbi
+    import date_ui
+    from statement_counter import CountingConnection
+    clock = SimulatedClock(datetime(2026, 10, 18, 12, 0))
+    server = start_server(FakeShare(clock=clock.now, phase=phase))
+    with tempfile.TemporaryDirectory() as tmp:
+        dex = fake_client(server, os.path.join(tmp, 'session.json'))
+        conn = dbi.connect()
+        conn.select_db(TEST_DB)
+        curs = dbi.cursor(conn)
+        curs.execute('create table if not exists realtime_cgm2 like janice.realtime_cgm2')
+        curs.execute('delete from realtime_cgm2 where user_id = %s', [dex.HUGH_USER_ID])
+        # the last reading before the outage
+        first = server.share.latest_reading_time() - timedelta(hours=hours)
+        dex.write_cgm(conn, reading(first), first, date_ui.to_rtime(first) + timedelta(minutes=5))
+        server.share.reset_counts()
+        counted = CountingConnection(conn)
+        values = dex.get_cgm(counted, clock.now())
+        curs.execute('select count(*), count(mgdl) from realtime_cgm2 where user_id = %s',
+                     [dex.HUGH_USER_ID])
+        rows, readings = curs.fetchone()
+    server.shutdown()
+    assert server.share.fetches == 1, server.share.fetches
+    # the whole span, including the reading we already had
+    assert len(values) == hours*12+1, len(values)
+    assert rows == readings == hours*12+1, (rows, readings)
+    assert counted.matching('insert into realtime_cgm2') == 1, counted.queries
+    assert counted.commits == 1, counted.commits
+    print(f'catch_up_test passed: {hours*12} readings in {counted.statements} statements')
+
+def handoff_test(polls=3, phase=200):
+    '''Runs the daemon for some polls, then stops it and runs get_cgm
+the way cron does, just after each of the next two five minute marks.
+The first run has nothing new, and mustn't replace the daemon's latest
+reading with NULL; the second stores the next reading in the next row.
+Uses a scratch realtime_cgm2 in TEST_DB.'''
+    import cs304dbi as dbi
+    import date_ui
+    clock = SimulatedClock(datetime(2026, 10, 18, 12, 0))
+    server = start_server(FakeShare(clock=clock.now, phase=phase))
+    with tempfile.TemporaryDirectory() as tmp:
+        dex = fake_client(server, os.path.join(tmp, 'session.json'))
+        conn = dbi.connect()
+        conn.select_db(TEST_DB)
+        curs = dbi.cursor(conn)
+        curs.execute('create table if not exists realtime_cgm2 like janice.realtime_cgm2')
+        curs.execute('delete from realtime_cgm2 where user_id = %s', [dex.HUGH_USER_ID])
+        first = server.share.latest_reading_time()
+        dex.write_cgm(conn, reading(first), first, dex.reading_rtime(first))
+        dex.run_daemon(conn, notify=None, clock=clock.now, sleep=clock.sleep, polls=polls)
+        last_rtime, last_wt = dex.get_latest_stored_data(conn)
+        assert last_rtime > date_ui.to_rtime(clock.now()), (last_rtime, clock.now())
+        for i in range(2):
+            clock.time = last_rtime + timedelta(minutes=5*i, seconds=35)
+            dex.get_cgm(conn, clock.now())
+            curs.execute('select mgdl from realtime_cgm2 where user_id = %s and rtime = %s',
+                         [dex.HUGH_USER_ID, last_rtime])
+            assert curs.fetchone()[0] == reading(last_wt)['Value'], clock.now()
+        curs.execute('select count(*), count(mgdl), max(rtime) from realtime_cgm2 where user_id = %s',
+                     [dex.HUGH_USER_ID])
+        rows, readings, latest = curs.fetchone()
+    server.shutdown()
+    assert rows == readings == polls+2, (rows, readings)
+    assert latest == last_rtime + timedelta(minutes=5), latest
+    print(f'handoff_test passed: {polls} daemon polls, then 2 cron runs, no NULLs')
+
+def record(filename, count=288):
+    '''Saves the latest count readings from the real server, as Dexcom
+sent them, for Recording to replay.'''
+    import dexcom_cgm_sample as dex
+    raw = dex.dexcom_cgm_values_raw(dex.get_session_id(), count)
+    with open(filename, 'w') as fout:
+        fout.write(raw)
+    print(f'recorded {len(json.loads(raw))} readings in {filename}')
+
+def replay_test():
+    '''The recording repeats, shifted to start, and gaps and outages
+leave out and hold back readings.'''
+    start = datetime(2026, 10, 18, 0, 0, 30)
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'day.json')
+        # an hour of readings, recorded long ago
+        recorded = [ reading(datetime(2024, 5, 1, 8, 2) + timedelta(minutes=5*i), 100+i, 'Flat')
+                     for i in range(12) ]
+        with open(filename, 'w') as fout:
+            json.dump(recorded, fout)
+        clock = SimulatedClock(start + timedelta(hours=2, minutes=7))
+        share = FakeShare(clock=clock.now, recording=Recording(filename, start),
+                          gaps=[(start + timedelta(hours=2), start + timedelta(hours=2, minutes=1))])
+        values = share.visible_readings(1440, 3)
+    # 2:05:30, since 2:00:30 is in the gap, then 1:55:30, the last of the previous hour
+    assert [ (parse_dexcom_date(v['WT']), v['Value']) for v in values ] == \
+        [ (start + timedelta(hours=2, minutes=5), 101),
+          (start + timedelta(hours=1, minutes=55), 111),
+          (start + timedelta(hours=1, minutes=50), 110) ], values
+    share.outages = [(start + timedelta(hours=1, minutes=52), start + timedelta(hours=3))]
+    assert parse_dexcom_date(share.visible_readings(1440, 1)[0]['WT']) == start + timedelta(hours=1, minutes=50)
+    print('replay_test passed')
+
+# the benchmark's scripted day, as offsets from midnight: a sensor gap
+# (NoData), a three hour phone outage (a catch-up) and Dexcom down
+SCRIPT = {'gaps': [(timedelta(hours=3), timedelta(hours=3, minutes=20))],
+          'outages': [(timedelta(hours=9), timedelta(hours=12))],
+          'errors': [(timedelta(hours=15), timedelta(hours=15, minutes=10), 503)]}
+
+def scripted_windows(script, start, days):
+    '''Returns the keyword arguments for FakeShare, with the script's
+windows repeated on each day from start.'''
+    windows = collections.defaultdict(list)
+    for day in range(days):
+        midnight = start + timedelta(days=day)
+        for kind, spans in script.items():
+            for span in spans:
+                windows[kind].append((midnight + span[0], midnight + span[1]) + tuple(span[2:]))
+    return dict(windows)
+
+def ingestion_benchmark(days=1, recording=None, latency=0.05, script=SCRIPT, step=5, conn=None):
+    '''Runs get_cgm every step simulated minutes over the days, against
+the fake server with the script's windows, and reports the latency of
+each call and its statements and writes to the database. Uses a scratch
+realtime_cgm2 in TEST_DB unless given a connection.'''
+    import cs304dbi as dbi
+    import date_ui
+    from statement_counter import CountingConnection
+    start = datetime(2026, 10, 1)
+    clock = SimulatedClock(start)
+    share = FakeShare(clock=clock.now, phase=200, latency=latency,
+                      recording=Recording(recording, start) if recording else None,
+                      **scripted_windows(script, start, days))
+    server = start_server(share)
+    with tempfile.TemporaryDirectory() as tmp:
+        dex = fake_client(server, os.path.join(tmp, 'session.json'))
+        if conn is None:
+            conn = dbi.connect()
+            conn.select_db(TEST_DB)
+            curs = dbi.cursor(conn)
+            curs.execute('create table if not exists realtime_cgm2 like janice.realtime_cgm2')
+            curs.execute('delete from realtime_cgm2 where user_id = %s', [dex.HUGH_USER_ID])
+            conn.commit()
+        # start up to date, with the reading just before start
+        last = next(share.readings_back(start - timedelta(minutes=5)))
+        dex.write_cgm(conn, reading(last[0], *last[1]), last[0], date_ui.to_rtime(start))
+        share.reset_counts()
+        counted = CountingConnection(conn)
+        latencies = []
+        statements = []
+        rows_written = commits = 0
+        failures = collections.Counter()
+        for i in range(days*24*60//step):
+            clock.time = start + timedelta(minutes=step*(i+1))
+            counted.reset()
+            call_start = time.time()
+            try:
+                dex.get_cgm(counted, clock.now())
+            except Exception as err:
+                failures[type(err).__name__] += 1
+            latencies.append(time.time() - call_start)
+            statements.append(counted.statements)
+            rows_written += counted.rows_written
+            commits += counted.commits
+    server.shutdown()
+    latencies.sort()
+    calls = len(latencies)
+    print(f'{calls} calls of get_cgm over {days} days, {latency*1000:.0f} ms server latency')
+    print(f'Share: {share.fetches} fetches, {share.logins} logins, {share.failed} errors; '
+          f'failed calls: {dict(failures)}')
+    print(f'latency: p50 {nearest_rank(latencies, 50)*1000:.1f} ms, '
+          f'p95 {nearest_rank(latencies, 95)*1000:.1f} ms, max {latencies[-1]*1000:.1f} ms')
+    print(f'database: {sum(statements)/calls:.2f} statements per call (max {max(statements)}), '
+          f'{rows_written} rows written, {commits} commits')
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'record':
+        record(sys.argv[2])
+    elif len(sys.argv) > 2 and sys.argv[1] == 'bench':
+        ingestion_benchmark(int(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else None)
+    else:
+        session_reuse_test()
+        replay_test()
+        session_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100)
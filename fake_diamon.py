@@ -0,0 +1,222 @@
+'''A fake Diamon server, for testing and benchmarking
+pull_data_from_diamon without minervaanalysis.net.
+
+It answers userCarbs (the records after fromTimestamp) and
+userCarbsForQuarter (a year and quarter of records) with made-up
+rescue carbs, one every INTERVAL, in Diamon's format:
+
+    {"timestamp":"2022-01-02T22:23:15.000Z", "carbName":"Juice box",
+     "quantity":1, "carbCountGrams":15, "totalCarbGrams":15, "userId":1}
+
+The response is sent in pieces, like a big response over the network.
+
+To compare the old way of storing a quarter (the whole response in
+memory, then one insert per record) with the new one (parsed as it
+arrives, multi-row upserts of BATCH_SIZE), using scratch copies of
+rescue_carbs_from_diamon and diamon_pull_status in TEST_DB:
+
+    python fake_diamon.py
+    python fake_diamon.py 2               # one record every 2 minutes
+
+The report gives the seconds, the peak Python memory (tracemalloc)
+and the statements sent to MySQL for each.
+
+Oct 2026
+'''
+
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pull_data_from_diamon as pull
+
+CARBS_PATH = '/analytics/userCarbs'
+QUARTER_PATH = '/analytics/userCarbsForQuarter'
+
+INTERVAL = timedelta(minutes=10)
+# bytes per write, so that the client gets the response in pieces
+WRITE_SIZE = 16*1024
+
+CARBS = [('Juice box', 15), ('Glucose tabs', 4), ('Skittles', 1), ('Banana', 27)]
+
+# where the benchmark puts its tables, so the real ones are untouched
+TEST_DB = 'loop_logic_scott'
+
+def quarter_start(year, quarter):
+    return datetime(int(year), 3*(int(quarter)-1)+1, 1)
+
+def quarter_end(year, quarter):
+    year, quarter = int(year), int(quarter)
+    return quarter_start(year+1, 1) if quarter == 4 else quarter_start(year, quarter+1)
+
+def records(start, end, interval=INTERVAL, user_id=pull.USER_ID):
+    '''Returns the made-up records after start and before end.'''
+    when = start + interval
+    i = 0
+    result = []
+    while when < end:
+        name, grams = CARBS[i % len(CARBS)]
+        quantity = 1 + i % 3
+        result.append({'timestamp': when.strftime(pull.ISO_FMT)+'.000Z',
+                       'carbName': name,
+                       'quantity': quantity,
+                       'carbCountGrams': grams,
+                       'totalCarbGrams': grams*quantity,
+                       'userId': user_id})
+        when += interval
+        i += 1
+    return result
+
+class FakeDiamon:
+    '''The state of the fake server: the interval between records, the
+time that userCarbs treats as now, and the bodies of the quarters,
+made once, so that serving them doesn't count in the client's memory.'''
+
+    def __init__(self, interval=INTERVAL, now=None):
+        self.interval = interval
+        self.now = now if now is not None else datetime.now()
+        self.quarters = {}
+        self.requests = 0
+
+    def quarter_body(self, year, quarter):
+        key = (int(year), int(quarter))
+        if key not in self.quarters:
+            data = records(quarter_start(*key) - self.interval, quarter_end(*key), self.interval)
+            self.quarters[key] = json.dumps(data).encode('utf8')
+        return self.quarters[key]
+
+    def carbs_body(self, from_timestamp):
+        start = datetime.strptime(from_timestamp, pull.ISO_FMT)
+        return json.dumps(records(start, self.now, self.interval)).encode('utf8')
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        diamon = self.server.diamon
+        diamon.requests += 1
+        url = urlparse(self.path)
+        params = { key: vals[0] for key, vals in parse_qs(url.query).items() }
+        if url.path == QUARTER_PATH:
+            body = diamon.quarter_body(params['year'], params['quarter'])
+        elif url.path == CARBS_PATH:
+            body = diamon.carbs_body(params['fromTimestamp'])
+        else:
+            body = b'not found'
+            self.send_response(404)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        view = memoryview(body)
+        for i in range(0, len(body), WRITE_SIZE):
+            self.wfile.write(view[i:i+WRITE_SIZE])
+
+def start_server(diamon=None, port=0):
+    '''Starts the fake server in a daemon thread, points
+pull_data_from_diamon at it and returns it.'''
+    server = ThreadingHTTPServer(('localhost', port), Handler)
+    server.daemon_threads = True
+    server.diamon = diamon if diamon is not None else FakeDiamon()
+    url = 'http://localhost:{}'.format(server.server_address[1])
+    pull.DIAMON = url + CARBS_PATH
+    pull.DIAMON_QUARTER = url + QUARTER_PATH
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# ================================================================
+# benchmark
+
+def old_transfer_quarter(conn, year, quarter):
+    '''What the script used to do with a quarter: the whole response as
+a list, then an insert per record.'''
+    import requests
+    import cs304dbi as dbi
+    resp = requests.get(pull.DIAMON_QUARTER, {'year': year, 'quarter': quarter, 'userId': pull.USER_ID})
+    data = resp.json()
+    curs = dbi.cursor(conn)
+    for row in data:
+        timestamp = pull.convert_timestamp(row['timestamp'])
+        curs.execute('''insert into rescue_carbs_from_diamon
+                        (user, timestamp, carbCountGrams, totalCarbGrams, quantity, carbName)
+                        values (%s, %s, %s, %s, %s, %s)
+                        on duplicate key update
+                        carbCountGrams = %s, totalCarbGrams = %s, quantity = %s, carbName = %s;''',
+                     [row['userId'], timestamp, row['carbCountGrams'], row['totalCarbGrams'],
+                      row['quantity'], row['carbName'],
+                      row['carbCountGrams'], row['totalCarbGrams'], row['quantity'], row['carbName']])
+    conn.commit()
+    return len(data)
+
+def scratch_tables(conn):
+    '''Empty copies of the two tables in TEST_DB, which becomes the
+connection's database.'''
+    import cs304dbi as dbi
+    conn.select_db(TEST_DB)
+    curs = dbi.cursor(conn)
+    curs.execute('create table if not exists rescue_carbs_from_diamon like janice.rescue_carbs_from_diamon')
+    curs.execute('create table if not exists diamon_pull_status like janice.diamon_pull_status')
+    curs.execute('delete from rescue_carbs_from_diamon')
+    curs.execute('delete from diamon_pull_status')
+    conn.commit()
+
+def stored_rows(conn):
+    '''Returns the rows in rescue_carbs_from_diamon, in order.'''
+    import cs304dbi as dbi
+    curs = dbi.cursor(conn)
+    curs.execute('''select user, timestamp, carbCountGrams, totalCarbGrams, quantity, carbName
+                    from rescue_carbs_from_diamon order by user, timestamp''')
+    return curs.fetchall()
+
+def measure(label, fn, conn):
+    '''Runs fn(conn), printing the seconds, peak memory and statements.'''
+    from statement_counter import CountingConnection
+    counted = CountingConnection(conn)
+    tracemalloc.start()
+    start = time.time()
+    count = fn(counted)
+    secs = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f'{label}: {count} records in {secs:.2f} s ({count/secs:.0f} records/s), '
+          f'peak memory {peak/1e6:.1f} MB, {counted.statements} statements, '
+          f'{counted.commits} commits')
+    return count
+
+def quarter_benchmark(interval_minutes=10, year=2026, quarter=3, conn=None):
+    '''Stores a quarter of records from the fake server the old way and
+the new way, emptying rescue_carbs_from_diamon in between, and checks
+that they store the same rows. A connection, if given, should be to
+scratch tables like those from scratch_tables.'''
+    import cs304dbi as dbi
+    diamon = FakeDiamon(timedelta(minutes=interval_minutes))
+    server = start_server(diamon)
+    diamon.quarter_body(year, quarter)
+    if conn is None:
+        conn = dbi.connect()
+        scratch_tables(conn)
+    old = measure('old', lambda c: old_transfer_quarter(c, year, quarter), conn)
+    old_rows = stored_rows(conn)
+    dbi.cursor(conn).execute('delete from rescue_carbs_from_diamon')
+    conn.commit()
+    new = measure('new', lambda c: pull.transfer_quarter(year, quarter, c), conn)
+    new_rows = stored_rows(conn)
+    server.shutdown()
+    assert old == new, (old, new)
+    assert len(old_rows) == old and old_rows == new_rows
+    since_str, since = pull.find_since(conn)
+    assert since == quarter_end(year, quarter) - diamon.interval, since
+
+if __name__ == '__main__':
+    quarter_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
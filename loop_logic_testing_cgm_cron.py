@@ -106,12 +106,12 @@ fake; instead they'll be identified by timestamp.
     curs.execute(f'''UPDATE {dest}.{SOURCE_CGM} SET used = 'YES' WHERE rtime = %s''', [rtime])
     conn.commit()
     if use_fake_time:
-        curs.execute(f'''INSERT INTO {dest}.{REALTIME_CGM}
+        curs.execute(f'''INSERT INTO {dest}.{REALTIME_CGM}(cgm_id, user_id, dexcom_time, mgdl, trend, trend_code, src)
                          VALUES(NULL, 7, %s, %s, %s, %s, 'fake')''',
                      [rtime, mgdl, trend, trend_code])
     else:
         # Insert it into the real table, substituting current_timestamp() for rtime
-        curs.execute(f'''INSERT INTO {dest}.{REALTIME_CGM}
+        curs.execute(f'''INSERT INTO {dest}.{REALTIME_CGM}(cgm_id, user_id, dexcom_time, mgdl, trend, trend_code, src)
                          VALUES(NULL, 7, current_timestamp(), %s, %s, %s, 'fake')''',
                      [mgdl, trend, trend_code])
     conn.commit()
@@ -154,6 +154,23 @@ def plot_data(start_date, start_time, hours):
     except Exception as err:
         return jsonify({'error': repr(err)})
 
+@app.route('/projection-data/')
+@app.route('/projection-data/<int:hours>')
+def projection_data(hours=3):
+    '''return JSON data of projected dynamic insulin and dynamic carbs
+    for the next few hours, computed now rather than read from future
+    rows of ICS2.'''
+    # imported here because autoapp_to_ics2 connects to the database on import
+    import autoapp_to_ics2
+    try:
+        conn = dbi.connect()
+        proj = autoapp_to_ics2.project_dynamic_values(conn, hours)
+        return jsonify({'rtimes': [ date_ui.str(rtime) for rtime in proj['rtimes'] ],
+                        'dynamic_insulin': proj['dynamic_insulin'],
+                        'dynamic_carbs': proj['dynamic_carbs']})
+    except Exception as err:
+        return jsonify({'error': repr(err)})
+
 @app.route ('/getRecentISF/<int:time_bucket>/<int:min_weeks>/<int:min_data>/')
 def get_recent_ISF(time_bucket,min_weeks, min_data):
     '''Returns the first, second, and third quartile isf information given a time bucket and number of weeks and data points to look back. '''
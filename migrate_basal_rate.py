@@ -70,31 +70,49 @@ USER_ID = 7
 def migrate_basal_12(conn, start_time, end_time=date_ui.to_rtime(datetime.now())):
     '''update the database table insulin_carb_smoothed_2 with the
     actual basal rates for the given time interval.
+
+    Oct 2026. Returns the first and last rtimes that actually changed
+    (both None if none did), so the caller can limit recomputing DI to
+    those rows. The notes are only appended if they aren't already
+    there, so that re-running doesn't keep changing those rows.
     '''
     start_time = date_ui.to_rtime(start_time)
     end_time = date_ui.to_rtime(end_time)
     logging.info(f'migrate_basal_12 from {start_time} to {end_time}')
     curs = dbi.cursor(conn)
+    first_changed = None
+    last_changed = None
     try:
         for update in actual_basal(conn, start_time, end_time):
             # this shouldn't happen
             if update['basal_amt_12'] is None:
                 logging.error(f'''ERROR: got a NULL basal_amt_12 for {update['rtime']}''')
-            curs.execute('''UPDATE insulin_carb_smoothed_2
-                            SET basal_amt = %s,
-                                basal_amt_12 = %s,
-                                notes = if(isnull(notes),%s,concat(notes,%s))
-                            WHERE rtime = %s''',
-                         [update['basal_amt'],
-                          update['basal_amt_12'],
-                          update['notes'],
-                          update['notes'],
-                          update['rtime']])
+            # MySQL only counts the row as affected if a value changed
+            nr = curs.execute('''UPDATE insulin_carb_smoothed_2
+                                 SET basal_amt = %s,
+                                     basal_amt_12 = %s,
+                                     notes = if(isnull(notes),%s,
+                                                if(locate(%s,notes) > 0,notes,concat(notes,%s)))
+                                 WHERE rtime = %s''',
+                              [update['basal_amt'],
+                               update['basal_amt_12'],
+                               update['notes'],
+                               update['notes'],
+                               update['notes'],
+                               update['rtime']])
+            if nr > 0:
+                if first_changed is None:
+                    first_changed = update['rtime']
+                last_changed = update['rtime']
         conn.commit()
     except Exception as err:
         msg = repr(err)
         logging.error(f'ERROR! {msg} in migrate_basal_12 for inputs {start_time} and {end_time}')
         # raise err
+        # we don't know what changed, so say everything did
+        return start_time, end_time
+    logging.info(f'migrate_basal_12 changed rows from {first_changed} to {last_changed}')
+    return first_changed, last_changed
 
 
 def actual_basal(conn, start_time, end_time):
@@ -34,116 +34,196 @@ using the contents of
 Scott D. Anderson
 March 24, 2022
 
+Oct 2026. The time of the last pull now lives in the
+diamon_pull_status table (sql/diamon_pull_status.sql), and is updated
+in the same transaction as the rows it covers. The file is only read
+if the table has no row yet. The response is parsed as it arrives
+(iter_records) and stored with multi-row upserts of BATCH_SIZE rows,
+so a whole quarter is never in memory at once. See fake_diamon.py for
+a benchmark.
+
 '''
 
 import os
 import sys
+import json
+import codecs
 import requests
 from datetime import datetime
 import cs304dbi as dbi
-import date_ui
 
 DIAMON = 'http://minervaanalysis.net/analytics/userCarbs'
 DIAMON_QUARTER = 'http://minervaanalysis.net/analytics/userCarbsForQuarter'
 
 USER_ID = 1
 
+# no longer written; read once, if diamon_pull_status has no row
 SINCE_FILE = '/home/hugh9/last_pull_data_from_diamon.log'
 ISO_FMT = '%Y-%m-%dT%H:%M:%S'
 
+# rows per multi-row upsert
+BATCH_SIZE = 500
+CHUNK_SIZE = 64*1024
+
+def iter_records(chunks):
+    '''Yields the objects in a JSON array, given an iterator of chunks
+of bytes, without waiting for the whole array.'''
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf8')()
+    buf = ''
+    pos = 0
+    started = False
+    for chunk in chunks:
+        buf = buf[pos:] + utf8.decode(chunk)
+        pos = 0
+        while True:
+            # skip the separators; the objects themselves always end with }
+            while pos < len(buf) and buf[pos] in ' \t\r\n,[':
+                started = started or buf[pos] == '['
+                pos += 1
+            if pos == len(buf) or buf[pos] == ']':
+                break
+            if not started:
+                raise ValueError('response is not a JSON array: '+buf[:100])
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # incomplete; wait for the next chunk
+                break
+            yield obj
+    rest = buf[pos:].strip()
+    if rest not in ['', ']']:
+        raise ValueError('response ended in the middle of a record: '+rest[:100])
+
+def iter_records_test():
+    records = [ {'timestamp': '2022-01-02T22:23:15.000Z', 'carbName': 'Juice box',
+                 'quantity': 1, 'carbCountGrams': 15, 'totalCarbGrams': 15, 'userId': 4},
+                {'timestamp': '2022-01-03T07:01:00.000Z', 'carbName': 'Crème brûlée [sic], {}',
+                 'quantity': 2, 'carbCountGrams': 12, 'totalCarbGrams': 24, 'userId': 4} ]
+    text = json.dumps(records, ensure_ascii=False).encode('utf8')
+    # split everywhere, including inside the multi-byte characters
+    for size in [1, 2, 3, 7, 50, len(text)]:
+        chunks = [ text[i:i+size] for i in range(0, len(text), size) ]
+        assert list(iter_records(chunks)) == records, size
+    assert list(iter_records([b' [ ] '])) == []
+    try:
+        list(iter_records([text[:-20]]))
+        raise AssertionError('truncated response was accepted')
+    except ValueError:
+        pass
+    print('iter_records_test passed')
+
+def stream_data(url, params):
+    '''Yields the records of a Diamon request as they arrive.'''
+    with requests.get(url, params, stream=True) as resp:
+        if not resp.ok:
+            raise Exception('bad login request or response',
+                            [resp.status_code, resp.reason, resp.text] )
+        yield from iter_records(resp.iter_content(CHUNK_SIZE))
+
 def get_data(fromTimestamp, userId=4):
-    resp = requests.get(DIAMON, {'fromTimestamp': fromTimestamp, 'userId': userId})
-    if resp.ok:
-        return resp.json()
-    raise Exception('bad login request or response',
-                    [resp.status_code, resp.reason, resp.text] )
+    return list(stream_data(DIAMON, {'fromTimestamp': fromTimestamp, 'userId': userId}))
 
 def convert_timestamp(timestr):
     '''Converts the timestamp to one with integer number of seconds'''
     return datetime.strptime(timestr,ISO_FMT+'.%fZ').strftime(ISO_FMT)
 
-def store_data(conn, data):
+def store_data(conn, data, batch_size=BATCH_SIZE):
+    '''Upserts the records, which can be any iterable, batch_size rows
+per statement, without committing. Returns the number of records and
+the latest timestamp, or None if there were none.'''
     curs = dbi.cursor(conn)
+    count = 0
+    last_time = None
+    batch = []
     for row in data:
-        userId, timestamp, carbCountGrams, totalCarbGrams, quantity, carbName = (
-            row['userId'],
-            row['timestamp'],
-            row['carbCountGrams'],
-            row['totalCarbGrams'],
-            row['quantity'],
-            row['carbName'])
-        timestamp = convert_timestamp(timestamp)
-        # note that, currently, the key is timestamp only, because we only have one user
-        curs.execute('''insert into rescue_carbs_from_diamon
+        timestamp = convert_timestamp(row['timestamp'])
+        batch.append([row['userId'], timestamp, row['carbCountGrams'],
+                      row['totalCarbGrams'], row['quantity'], row['carbName']])
+        if last_time is None or timestamp > last_time:
+            last_time = timestamp
+        if len(batch) == batch_size:
+            store_batch(curs, batch)
+            count += len(batch)
+            batch = []
+    if len(batch) > 0:
+        store_batch(curs, batch)
+        count += len(batch)
+    # We don't put these in ICS2 here; we let that be done by the
+    # autoapp_to_ics2.py cron job, since that code will ensure that
+    # rows are filled forward, that computations of Dynamic Carbs are
+    # computed based on this, and so forth.
+    # See autoapp_to_ics2.migrate_rescue_carbs_from_diamon()
+    return count, last_time
+
+def store_batch(curs, batch):
+    # note that, currently, the key is timestamp only, because we only have one user.
+    # pymysql sends the whole batch as one multi-row insert
+    curs.executemany('''insert into rescue_carbs_from_diamon
                         (user, timestamp, carbCountGrams, totalCarbGrams, quantity, carbName)
                         values (%s, %s, %s, %s, %s, %s)
                         on duplicate key update
-                        carbCountGrams = %s, totalCarbGrams = %s, quantity = %s, carbName = %s;''',
-                     [userId, timestamp, carbCountGrams, totalCarbGrams, quantity, carbName,
-                      carbCountGrams, totalCarbGrams, quantity, carbName ])
-        # also put in ICS2.
-
-        # Actually, we will *not* put them in ICS2; We'll let that be
-        # done by the autoapp_to_ics2.py cron job, since that code
-        # will ensure that rows are filled forward, that computations
-        # of Dynamic Carbs are computed based on this, and so forth.
-        # See autoapp_to_ics2.migrate_rescue_carbs_from_diamon()
-        if False:
-            notes = f'{quantity} of {carbName}'
-            curs.execute('''insert into insulin_carb_smoothed_2
-                        (user, rtime, carb_code, carbs, rescue_carbs, notes)
-                        values (%s, %s, 'rescue', %s, %s, %s)
-                        on duplicate key update
-                        carb_code = 'rescue', carbs = %s, rescue_carbs = %s, notes = %s;''',
-                         [userId, date_ui.to_rtime(timestamp), totalCarbGrams, totalCarbGrams, notes,
-                          totalCarbGrams, totalCarbGrams, notes])
-    conn.commit()
+                        carbCountGrams = values(carbCountGrams), totalCarbGrams = values(totalCarbGrams),
+                        quantity = values(quantity), carbName = values(carbName)''',
+                     batch)
 
-def find_since():
+def find_since(conn):
+    '''Returns the time of the last pull, as a string and a datetime.'''
+    curs = dbi.cursor(conn)
+    curs.execute('''select since from diamon_pull_status where user_id = %s''', [USER_ID])
+    row = curs.fetchone()
+    if row is not None:
+        return row[0].strftime(ISO_FMT), row[0]
+    # not yet moved to the table
     with open(SINCE_FILE, 'r') as fin:
-        since_str = fin.read()
+        since_str = fin.read().strip()
     return since_str, datetime.strptime(since_str, ISO_FMT)
 
-def store_time(timestamp=None):
+def store_time(conn, timestamp=None):
+    '''Records the time of the last pull, without committing, so that
+it commits with the rows.'''
     if timestamp is None:
         timestamp = datetime.now().strftime(ISO_FMT)
-    with open(SINCE_FILE, 'w') as fout:
-        fout.write(timestamp)
+    curs = dbi.cursor(conn)
+    curs.execute('''insert into diamon_pull_status(user_id, since) values (%s, %s)
+                    on duplicate key update since = values(since)''',
+                 [USER_ID, timestamp])
 
 debug = False
 
-def transfer(since_str=None):
-    if since_str is None:
-        (since_str, since_dt) = find_since()
-    data = get_data(since_str, USER_ID)
-    if len(data) > 0:
-        if debug:
-            print(f'got {len(data)} since {since_str}')
+def transfer(since_str=None, conn=None):
+    if conn is None:
         dbi.cache_cnf()
         conn = dbi.connect()
-        store_data(conn, data)
-        last_time = convert_timestamp(max([ d.get('timestamp') for d in data ]))
+    if since_str is None:
+        (since_str, since_dt) = find_since(conn)
+    data = stream_data(DIAMON, {'fromTimestamp': since_str, 'userId': USER_ID})
+    count, last_time = store_data(conn, data)
+    if count > 0:
         if debug:
+            print(f'got {count} since {since_str}')
             print(f'storing latest rescue carb time as {last_time}')
-        store_time(last_time)
+        store_time(conn, last_time)
+        conn.commit()
+    return count
+
+def transfer_quarter(year, quarter, conn=None):
+    if conn is None:
+        dbi.cache_cnf()
+        conn = dbi.connect()
+    data = stream_data(DIAMON_QUARTER, {'year': year, 'quarter': quarter, 'userId': USER_ID})
+    count, last_time = store_data(conn, data)
+    if count > 0:
+        store_time(conn, last_time)
+        conn.commit()
+    return count
 
 if __name__ == '__main__':
     if len(sys.argv) > 1:
         year, quarter = sys.argv[1], sys.argv[2]
-        resp = requests.get(DIAMON_QUARTER, {'year': year, 'quarter': quarter, 'userId': USER_ID})
-        if resp.ok:
-            data = resp.json()
-        else:
-            raise Exception('error in request: ',
-                            [resp.status_code, resp.reason, resp.text])
-        if len(data) > 0:
-            print(f'Got {len(data)} for that quarter')
-            dbi.cache_cnf()
-            conn = dbi.connect()
-            store_data(conn, data)
-            last_time = convert_timestamp(max([ d.get('timestamp') for d in data ]))
-            store_time(last_time)
-            print('done')
+        count = transfer_quarter(year, quarter)
+        print(f'Got {count} for that quarter')
+        print('done')
     else:
         # the normal case, when run as a cron job
         transfer()
@@ -0,0 +1,233 @@
+'''Replays a stream of autoapp rows (boluses, carbs, temp basal states
+and CGM readings) into scratch databases, calling migrate_all once per
+simulated minute, so that the autoapp to loop_logic migration can be
+load-tested over months of data in a few minutes.
+
+The stream is either synthetic or recorded from the real autoapp
+tables, and it goes into autoapp_scott and loop_logic_scott (see
+sql/scott_setup.sql), which this empties first. CGM readings go
+straight into {dest}.realtime_cgm, with test mode turned on, just as
+loop_logic_testing_cgm_cron does.
+
+Usage:
+
+    python replay_loop_logic.py synthetic 30            # 30 days of made-up data
+    python replay_loop_logic.py recorded 2024-01-01 2024-03-01
+    python replay_loop_logic.py synthetic 90 5          # migrate every 5 minutes
+
+The report gives throughput (events and simulated minutes per second of
+wall time), the latency of each migrate_all call (p50, p95, max), and
+the statements per call.
+
+The migration code is MySQL-specific (database-qualified table names,
+date arithmetic, upserts), so the stand-in is a scratch MySQL
+database, not SQLite.
+
+Oct 2026
+'''
+
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+import cs304dbi as dbi
+import date_ui
+import autoapp_to_loop_logic_inputs as a2l
+from statement_counter import CountingConnection, nearest_rank
+
+SOURCE = 'autoapp_scott'
+DEST = 'loop_logic_scott'
+USER_ID = a2l.HUGH_USER_ID
+
+# we empty these, so refuse to replay into the real databases
+PROTECTED = ['autoapp', 'autoapp_test', 'loop_logic', 'loop_logic_test']
+
+# ================================================================
+# streams
+
+'''A stream is a list of events, each a tuple of (rtime, table,
+values), where the values are the columns the insert functions below
+need:
+
+    bolus             (user_id, date, type, value, duration)
+    carbohydrate      (user_id, date, value)
+    temp_basal_state  (user_id, date, error, in_progress, aps_in_progress, percent, total)
+    cgm               (user_id, dexcom_time, mgdl, trend, trend_code)
+'''
+
+def synthetic_stream(start, days, seed=0):
+    '''Returns a made-up stream starting at start: a CGM reading every
+five minutes, three meals a day with carbs and a bolus a few minutes
+apart (either one first), an occasional correction bolus, and a temp
+basal state every half hour.'''
+    rand = random.Random(seed)
+    start = date_ui.to_datetime(start)
+    events = []
+    mgdl = 120
+    for i in range(days*24*12):
+        rtime = start + timedelta(minutes=5*i)
+        mgdl = min(300, max(50, mgdl + rand.randint(-8, 8)))
+        events.append((rtime, 'cgm', (USER_ID, rtime, mgdl, 0, 'Flat')))
+    for day in range(days):
+        midnight = start + timedelta(days=day)
+        for hour in [7, 12, 18]:
+            meal = midnight + timedelta(hours=hour, minutes=rand.randrange(60))
+            bolus = meal + timedelta(minutes=rand.randint(-10, 3))
+            carbs = rand.randrange(20, 90)
+            events.append((meal, 'carbohydrate', (USER_ID, meal, carbs)))
+            events.append((bolus, 'bolus', (USER_ID, bolus, 'S', round(carbs/10, 1), 0)))
+        if rand.random() < 0.5:
+            corr = midnight + timedelta(minutes=rand.randrange(24*60))
+            events.append((corr, 'bolus', (USER_ID, corr, 'S', rand.randint(1, 4), 0)))
+        for half_hour in range(48):
+            when = midnight + timedelta(minutes=30*half_hour + rand.randrange(30))
+            percent = rand.choice([0, 50, 100, 150])
+            events.append((when, 'temp_basal_state',
+                           (USER_ID, when, 0, 1 if percent != 100 else 0, 0, percent, 0)))
+    events.sort(key=lambda e: e[0])
+    return events
+
+def recorded_stream(conn, start, end, source='autoapp'):
+    '''Returns the stream of Hugh's real rows from source (and the
+dexcom CGM readings) from start to end. Only reads.'''
+    curs = dbi.cursor(conn)
+    events = []
+    curs.execute(f'''select user_id, date, type, value, duration from {source}.bolus
+                     where user_id = %s and date >= %s and date < %s''',
+                 [USER_ID, start, end])
+    events.extend([ (row[1], 'bolus', row) for row in curs.fetchall() ])
+    curs.execute(f'''select user_id, date, value from {source}.carbohydrate
+                     where user_id = %s and date >= %s and date < %s''',
+                 [USER_ID, start, end])
+    events.extend([ (row[1], 'carbohydrate', row) for row in curs.fetchall() ])
+    curs.execute(f'''select user_id, date, error, temp_basal_in_progress, APS_temp_basal_in_progress,
+                            temp_basal_percent, temp_basal_total
+                     from {source}.temp_basal_state
+                     where user_id = %s and date >= %s and date < %s''',
+                 [USER_ID, start, end])
+    events.extend([ (row[1], 'temp_basal_state', row) for row in curs.fetchall() ])
+    curs.execute('''select user_id, dexcom_time, mgdl, trend, trend_code from janice.realtime_cgm2
+                    where user_id = %s and dexcom_time >= %s and dexcom_time < %s
+                      and mgdl is not NULL''',
+                 [USER_ID, start, end])
+    events.extend([ (row[1], 'cgm', row) for row in curs.fetchall() ])
+    events.sort(key=lambda e: e[0])
+    return events
+
+# ================================================================
+# loading the scratch databases
+
+def reset(conn, source, dest, start):
+    '''Empties the scratch tables, turns on test mode (so migrate_all
+doesn't copy the real CGM data) and says there's no data before start.'''
+    if source in PROTECTED or dest in PROTECTED:
+        raise Exception(f'refusing to replay into {source} and {dest}')
+    curs = dbi.cursor(conn)
+    for table in ['bolus', 'carbohydrate', 'temp_basal_state']:
+        curs.execute(f'delete from {source}.{table}')
+    for table in ['loop_summary', 'realtime_cgm']:
+        curs.execute(f'delete from {dest}.{table}')
+    curs.execute(f'delete from {dest}.testing_command')
+    curs.execute(f"insert into {dest}.testing_command values (1, 'start', 'on', %s, 'replay')",
+                 [start])
+    conn.commit()
+    a2l.set_data_migration(conn, source, dest, start)
+
+INSERTS = {
+    'bolus': '''insert into {source}.bolus(user_id, date, type, value, duration)
+                values(%s, %s, %s, %s, %s)''',
+    'carbohydrate': '''insert into {source}.carbohydrate(user_id, date, value)
+                       values(%s, %s, %s)''',
+    'temp_basal_state': '''insert into {source}.temp_basal_state
+                           (user_id, date, error, temp_basal_in_progress, APS_temp_basal_in_progress,
+                            temp_basal_percent, temp_basal_total)
+                           values(%s, %s, %s, %s, %s, %s, %s)''',
+    'cgm': '''insert into {dest}.realtime_cgm(cgm_id, user_id, dexcom_time, mgdl, trend, trend_code, src)
+              values(NULL, %s, %s, %s, %s, %s, 'fake')''',
+    }
+
+def insert_events(conn, source, dest, events):
+    '''Inserts the events, with one executemany per table.'''
+    curs = dbi.cursor(conn)
+    for table, sql in INSERTS.items():
+        rows = [ values for (rtime, tab, values) in events if tab == table ]
+        if len(rows) > 0:
+            curs.executemany(sql.format(source=source, dest=dest), rows)
+    curs.execute(f'''UPDATE {source}.dana_history_timestamp SET date = %s WHERE user_id = %s''',
+                 [events[-1][0], USER_ID])
+    conn.commit()
+
+# ================================================================
+# replay
+
+def replay(conn, stream, start=None, end=None, step=1, source=SOURCE, dest=DEST):
+    '''Replays the stream from start to end (default, its first and
+last events), one step of simulated minutes at a time: insert the
+events of that step, then migrate_all with that step's start as the
+alternate start time. Returns a dictionary of measurements.'''
+    if len(stream) == 0:
+        raise Exception('empty stream')
+    start = date_ui.to_datetime(start) if start is not None else stream[0][0].replace(second=0, microsecond=0)
+    end = date_ui.to_datetime(end) if end is not None else stream[-1][0] + timedelta(minutes=step)
+    reset(conn, source, dest, start)
+    counted = CountingConnection(conn)
+    stride = timedelta(minutes=step)
+    latencies = []
+    i = 0
+    n_events = 0
+    now = start
+    wall_start = time.time()
+    while now < end:
+        later = now + stride
+        batch = []
+        while i < len(stream) and stream[i][0] < later:
+            if stream[i][0] >= now:
+                batch.append(stream[i])
+            i += 1
+        if len(batch) > 0:
+            insert_events(conn, source, dest, batch)
+            n_events += len(batch)
+        call_start = time.time()
+        a2l.migrate_all(counted, source, dest, now, test=True)
+        latencies.append(time.time() - call_start)
+        now = later
+    wall = time.time() - wall_start
+    latencies.sort()
+    calls = len(latencies)
+    return {'calls': calls,
+            'events': n_events,
+            'simulated_minutes': calls*step,
+            'wall_seconds': wall,
+            'events_per_second': n_events/wall if wall > 0 else None,
+            'simulated_minutes_per_second': calls*step/wall if wall > 0 else None,
+            'p50': nearest_rank(latencies, 50),
+            'p95': nearest_rank(latencies, 95),
+            'max': latencies[-1] if calls > 0 else None,
+            'statements_per_call': counted.statements/calls if calls > 0 else None}
+
+def print_report(report):
+    print(f"{report['calls']} calls over {report['simulated_minutes']} simulated minutes, "
+          f"{report['events']} events, in {report['wall_seconds']:.1f} seconds")
+    print(f"throughput: {report['events_per_second']:.1f} events/s, "
+          f"{report['simulated_minutes_per_second']:.1f} simulated minutes/s")
+    print(f"migrate_all latency: p50 {report['p50']*1000:.1f}ms, "
+          f"p95 {report['p95']*1000:.1f}ms, max {report['max']*1000:.1f}ms; "
+          f"{report['statements_per_call']:.1f} statements per call")
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit()
+    conn = dbi.connect()
+    if sys.argv[1] == 'synthetic':
+        days = int(sys.argv[2])
+        step = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+        stream = synthetic_stream(datetime(2024, 1, 1), days)
+    elif sys.argv[1] == 'recorded':
+        step = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+        stream = recorded_stream(conn, sys.argv[2], sys.argv[3])
+    else:
+        print(__doc__)
+        sys.exit()
+    print(f'replaying {len(stream)} events')
+    print_report(replay(conn, stream, step=step))
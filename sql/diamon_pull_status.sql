@@ -0,0 +1,19 @@
+-- Oct 2026.
+-- The time of the latest rescue carb that pull_data_from_diamon.py
+-- has stored, which is where the next pull starts. This used to be
+-- the contents of /home/hugh9/last_pull_data_from_diamon.log. Keeping
+-- it here means it's updated in the same transaction as the rows in
+-- rescue_carbs_from_diamon. Until the table has a row for the user,
+-- the script falls back to the file.
+
+use janice;
+
+CREATE TABLE if not exists `diamon_pull_status` (
+  `user_id` int NOT NULL,
+  `since` datetime NOT NULL comment 'timestamp of the latest rescue carb stored',
+  `updated` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  primary key (user_id)
+);
+
+-- to move the time over from the file, for USER_ID 1:
+-- insert into diamon_pull_status(user_id, since) values (1, '<contents of the file>');
@@ -0,0 +1,19 @@
+-- Oct 2026. Checkpoints for the 'backfill' mode of autoapp_to_ics2.py.
+-- A backfill splits a long interval into chunks that are migrated by
+-- worker processes. Each worker inserts a row here when its chunk is
+-- done, so a killed backfill can be restarted with the same start and
+-- end and will skip the finished chunks. Before the chunks, the inputs
+-- are imported in one serial pass, which is recorded by a row whose
+-- chunk_start is before backfill_start (the start of the import) and
+-- whose nrows is NULL, so a restart doesn't import them again.
+
+drop table if exists ics2_backfill;
+create table `ics2_backfill` (
+  `backfill_start` datetime NOT NULL,
+  `backfill_end` datetime NOT NULL,
+  `chunk_start` datetime NOT NULL,
+  `chunk_end` datetime NOT NULL,
+  `nrows` int comment 'rows of DI recomputed in this chunk; NULL for the import',
+  `finished` datetime NOT NULL,
+  PRIMARY KEY (`backfill_start`, `backfill_end`, `chunk_start`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -0,0 +1,34 @@
+-- Records how stale each migrated row is when it lands: the seconds
+-- from its source timestamp (bolus date, carb date, dexcom time) to
+-- its migration. See lag_report in autoapp_to_loop_logic_inputs.py.
+-- The columns are at the end and nullable, so existing rows are fine.
+
+use loop_logic;
+
+alter table loop_summary
+    add column bolus_lag_secs int comment 'seconds from bolus_timestamp to migration',
+    add column carb_lag_secs int comment 'seconds from carb_timestamp to migration';
+
+alter table realtime_cgm
+    add column lag_secs int comment 'seconds from dexcom_time to migration';
+
+use loop_logic_test;
+
+alter table loop_summary
+    add column bolus_lag_secs int comment 'seconds from bolus_timestamp to migration',
+    add column carb_lag_secs int comment 'seconds from carb_timestamp to migration';
+
+alter table realtime_cgm
+    add column lag_secs int comment 'seconds from dexcom_time to migration';
+
+-- the scratch database of sql/scott_setup.sql, used by the test
+-- scenarios and replay_loop_logic.py
+
+use loop_logic_scott;
+
+alter table loop_summary
+    add column bolus_lag_secs int comment 'seconds from bolus_timestamp to migration',
+    add column carb_lag_secs int comment 'seconds from carb_timestamp to migration';
+
+alter table realtime_cgm
+    add column lag_secs int comment 'seconds from dexcom_time to migration';
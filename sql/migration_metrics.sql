@@ -0,0 +1,16 @@
+-- Oct 2026. One row per step per run of autoapp_to_ics2.migrate_between,
+-- so we can see which steps of the per-minute cron job are slow and
+-- notice regressions. See metrics_report() in autoapp_to_ics2.py, or
+-- run "python autoapp_to_ics2.py metrics 7" for the last week.
+
+drop table if exists migration_metrics;
+create table `migration_metrics` (
+  `user_id` int NOT NULL,
+  `run_start` datetime NOT NULL comment 'when migrate_between started',
+  `step` varchar(40) NOT NULL,
+  `seconds` double NOT NULL comment 'wall time',
+  `statements` int NOT NULL comment 'round trips to the database',
+  `rows_written` int NOT NULL comment 'rows affected by INSERT/UPDATE/DELETE',
+  PRIMARY KEY (`user_id`, `run_start`, `step`),
+  INDEX (`run_start`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
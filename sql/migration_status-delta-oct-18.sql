@@ -0,0 +1,27 @@
+-- Checkpoint of the last temp basal state migrated to loop_summary,
+-- so that migrate_temp_basal only reads newer temp_basal_state
+-- rows. All NULL until the first temp basal is migrated.
+
+use loop_logic;
+
+alter table `migration_status`
+      add column `temp_basal_state_id` int comment 'id in autoapp.temp_basal_state of the last temp basal migrated',
+      add column `temp_basal_in_progress` tinyint comment 'its temp_basal_in_progress',
+      add column `temp_basal_percent` int comment 'its temp_basal_percent',
+      add column `temp_basal_date` datetime comment 'its date';
+
+use loop_logic_test;
+
+alter table `migration_status`
+      add column `temp_basal_state_id` int comment 'id in autoapp_test.temp_basal_state of the last temp basal migrated',
+      add column `temp_basal_in_progress` tinyint comment 'its temp_basal_in_progress',
+      add column `temp_basal_percent` int comment 'its temp_basal_percent',
+      add column `temp_basal_date` datetime comment 'its date';
+
+use loop_logic_scott;
+
+alter table `migration_status`
+      add column `temp_basal_state_id` int comment 'id in autoapp_scott.temp_basal_state of the last temp basal migrated',
+      add column `temp_basal_in_progress` tinyint comment 'its temp_basal_in_progress',
+      add column `temp_basal_percent` int comment 'its temp_basal_percent',
+      add column `temp_basal_date` datetime comment 'its date';
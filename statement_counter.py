@@ -0,0 +1,132 @@
+'''Counts the statements (round trips), rows written and commits that
+some code sends to MySQL, so that we can compare a row-at-a-time
+migration function with a bulk one. Oct 2026.
+
+Wrap a connection and pass the wrapper wherever a connection is
+expected:
+
+    conn = dbi.connect()
+    counted = CountingConnection(conn)
+    migrate_between(counted, start, end)
+    print(counted.counts())
+
+Cursors created from the wrapper (including via dbi.cursor and
+dbi.dict_cursor) count every statement they execute. executemany
+counts each statement pymysql actually sends, so a batched INSERT
+counts as one or a few, while an executemany of UPDATEs counts one per
+row, which is what happens on the wire.
+
+The text of each statement is kept too, so a test can count the
+statements that touch a particular table:
+
+    counted.matching('configuration')
+
+Writes to scratch tables, such as the temporary staging table that
+bulk_update fills before copying it into ICS2, aren't real changes, so
+they can be left out of writes and rows_written (but not statements):
+
+    counted = CountingConnection(conn, scratch_tables=['ics2_staging'])
+
+nearest_rank is here too, since the benchmarks that count statements
+also report percentiles.
+'''
+
+import re
+import time
+
+WRITE_STATEMENTS = ('insert', 'update', 'delete', 'replace')
+
+# the table that a write statement writes to, possibly qualified by the database
+WRITTEN_TABLE = re.compile(r'''\s*(?:(?:insert|replace)\s+(?:ignore\s+)?(?:into\s+)?
+                                 |update\s+(?:ignore\s+)?
+                                 |delete\s+(?:ignore\s+)?from\s+)
+                               ([\w.`]+)''',
+                           re.IGNORECASE | re.VERBOSE)
+
+def written_table(query):
+    '''Returns the name, without the database, of the table that a
+    write statement writes to, or None if it isn't one we recognize.'''
+    match = WRITTEN_TABLE.match(query)
+    if match is None:
+        return None
+    return match.group(1).replace('`', '').split('.')[-1].lower()
+
+def nearest_rank(sorted_vals, pct):
+    '''Returns the pct percentile of the sorted values, by the nearest
+    rank method, or None if there are none.'''
+    if len(sorted_vals) == 0:
+        return None
+    return sorted_vals[min(len(sorted_vals)-1, int(len(sorted_vals)*pct/100))]
+
+# subclasses of the pymysql cursor classes, created as needed
+counting_cursor_classes = {}
+
+def counting_cursor_class(cursor_class):
+    '''Returns a subclass of the given pymysql cursor class whose
+    execute method reports to the cursor's counter.'''
+    if cursor_class not in counting_cursor_classes:
+        def execute(self, query, args=None):
+            nr = cursor_class.execute(self, query, args)
+            self.counter.count_statement(query, nr)
+            return nr
+        counting_cursor_classes[cursor_class] = type('Counting'+cursor_class.__name__,
+                                                     (cursor_class,),
+                                                     {'execute': execute})
+    return counting_cursor_classes[cursor_class]
+
+class CountingConnection:
+    '''Wraps a pymysql connection, counting statements, rows written
+    and commits. Writes to any of the scratch_tables count as
+    statements but not as writes. Anything else is passed through to
+    the connection.'''
+
+    def __init__(self, conn, scratch_tables=()):
+        self.conn = conn
+        self.scratch_tables = set([ table.lower() for table in scratch_tables ])
+        self.reset()
+
+    def reset(self):
+        self.statements = 0
+        self.writes = 0
+        self.rows_written = 0
+        self.commits = 0
+        self.queries = []
+        self.start = time.time()
+
+    def count_statement(self, query, nr):
+        self.statements += 1
+        if isinstance(query, (bytes, bytearray)):
+            query = query.decode('utf8', 'replace')
+        self.queries.append(query)
+        if (query.lstrip().lower().startswith(WRITE_STATEMENTS) and
+            written_table(query) not in self.scratch_tables):
+            self.writes += 1
+            self.rows_written += nr
+
+    def cursor(self, cursor=None):
+        if cursor is None:
+            cursor = self.conn.cursorclass
+        curs = self.conn.cursor(counting_cursor_class(cursor))
+        curs.counter = self
+        return curs
+
+    def commit(self):
+        self.commits += 1
+        self.conn.commit()
+
+    def matching(self, text):
+        '''Returns the number of statements since the last reset whose
+        text contains the given text, ignoring case.'''
+        text = text.lower()
+        return len([ q for q in self.queries if text in q.lower() ])
+
+    def counts(self):
+        '''Returns a dictionary of the counts since the last reset.'''
+        return {'statements': self.statements,
+                'writes': self.writes,
+                'rows_written': self.rows_written,
+                'commits': self.commits,
+                'seconds': time.time() - self.start}
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)